@@ -0,0 +1,74 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchAdaptiveChunk.py
+# ##############################################################################
+#
+# Throughput curve of stoRFScoreMM.py against the chunk size on a synthetic
+# state_code partition, with the per-state models that stoRFFitMM.py trains on
+# the sandbox data. The script runs with a range of fixed chunk sizes, and in
+# the adaptive mode ("adaptive=true"), whose chunk size choices are shown from
+# its standard error. All runs are checked to produce the same output.
+#
+# Usage: python benchAdaptiveChunk.py [nRows [memoryMB]]
+#        (default: 100,000 rows, 1024 MB memory ceiling for the adaptive mode)
+#
+################################################################################
+
+import os
+import sys
+import tempfile
+
+import benchUtils
+
+chunkSizes = [500, 2000, 10000, 50000]
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    memoryMB = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    ads = benchUtils.synthetic_ads(nRows, shares=[('OTHER', 1.0)])
+    text = benchUtils.engine_text(ads)
+    print('Input: one state_code partition of {:,} rows'.format(nRows))
+
+    runs = [('chunk={}'.format(n), ['chunk={}'.format(n)]) for n in chunkSizes]
+    runs.append(('adaptive', ['adaptive=true', 'memory={}'.format(memoryMB)]))
+    rows, outputs = [], {}
+    with tempfile.TemporaryDirectory() as workDir:
+        benchUtils.make_sandbox(workDir, benchUtils.fit_sandbox_model(1))
+        benchUtils.make_multiple_models(workDir)
+        outPath = os.path.join(workDir, 'score.out')
+        errPath = os.path.join(workDir, 'score.err')
+        print('{:<14s} {:>9s} {:>12s} {:>9s}'.format('run', 'seconds',
+                                                     'rows/s', 'peak MB'))
+        for label, args in runs:
+            with open(outPath, 'wb') as fOut, open(errPath, 'wb') as fErr:
+                rc, seconds, peakMB = benchUtils.run_script(
+                    workDir, 'stoRFScoreMM.py', args, feed=[text],
+                    stdout=fOut, stderr=fErr)
+            if rc != 0:
+                sys.exit('stoRFScoreMM.py failed with ' + ' '.join(args))
+            with open(outPath, 'rb') as fIn:
+                outputs[label] = fIn.read()
+            print('{:<14s} {:9.3f} {:12,.0f} {:9.1f}'.format(
+                  label, seconds, nRows / seconds, peakMB))
+            with open(errPath) as fIn:
+                log = fIn.read()
+        print('Chunk sizes chosen in the adaptive mode:')
+        sys.stdout.write(''.join('  ' + line for line in log.splitlines(True)))
+
+    if len(set(outputs.values())) != 1:
+        sys.exit('FAIL: the output depends on the chunk size')
+    print('PASS: identical output for all chunk sizes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 2 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchAdsLocal.py
+# ##############################################################################
+#
+# Correctness check and scaling benchmark of the offline ADS builder of
+# adsLocal.py, on the Customer and Accounts tables of Inputs/Data and on
+# synthetic transactions of the accounts (see benchAdsPipeline.py).
+#   - Check: the ADS of adsLocal.py is compared to the reference ADS that
+#     pandas builds with the row-by-row joins of the notebook; with the
+#     transactions in one chunk, in many small chunks, and read in chunks
+#     from a zipped CSV file.
+#   - Scaling: the tables are replicated 1x, 10x and 100x, with new customer
+#     IDs and account numbers in every replica, and the transactions are fed
+#     to the builder one replica at a time. The ADS of every scale is checked
+#     to be the 1x ADS replicated, and the build time, throughput and peak
+#     memory are reported, next to the time that the synthetic feed alone
+#     takes.
+# The benchmark exits with an error on any mismatch.
+#
+# Usage: python benchAdsLocal.py [maxScale [transPerAcct]]
+#        (default: scales up to 100x, 10 transactions per account)
+#
+################################################################################
+
+import os
+import resource
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import benchUtils
+import benchAdsPipeline
+import adsLocal
+
+# Offset of the customer IDs of each replica of the tables.
+custIdStep = 100000000
+
+
+def replicate(customer, accounts, transactions, scale):
+    """Return the replicated Customer and Accounts tables, and a generator of
+    the transactions of every replica."""
+    nAcct = len(accounts)
+    customers = pd.concat([customer.assign(cust_id=customer['cust_id'] +
+                                           r * custIdStep)
+                           for r in range(scale)], ignore_index=True)
+    acctNbrs = np.array(['{}{:03d}'.format(a, r) for r in range(scale)
+                         for a in accounts['acct_nbr']], dtype=object)
+    accountsAll = pd.concat([accounts.assign(cust_id=accounts['cust_id'] +
+                                             r * custIdStep)
+                             for r in range(scale)], ignore_index=True)
+    accountsAll['acct_nbr'] = acctNbrs
+    basePositions = pd.Index(accounts['acct_nbr']).get_indexer(
+        transactions['acct_nbr'])
+
+    def feed():
+        for r in range(scale):
+            yield transactions.assign(
+                acct_nbr=acctNbrs[r * nAcct + basePositions])
+    return customers, accountsAll, feed
+
+
+def expected_ads(ads, scale):
+    """Return the ADS of the 1x tables replicated, as adsLocal.py orders it."""
+    return pd.concat([ads.assign(cust_id=ads['cust_id'] + r * custIdStep)
+                      for r in range(scale)], ignore_index=True)
+
+
+def peak_memory_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main():
+    maxScale = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    transPerAcct = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    customer, accounts, transactions = benchAdsPipeline.load_tables(transPerAcct)
+    print('Customer: {:,} rows, Accounts: {:,} rows, Transactions: {:,} rows'
+          .format(len(customer), len(accounts), len(transactions)))
+    failures = []
+
+    # Correctness against the reference ADS of the notebook transformations.
+    reference = benchAdsPipeline.reference_ads(customer, accounts, transactions)
+    with tempfile.TemporaryDirectory() as workDir:
+        zipPath = os.path.join(workDir, 'Transactions.csv.zip')
+        transactions.to_csv(zipPath, index=False)
+        feeds = [('1 chunk', [transactions]),
+                 ('chunks of 9,973 rows',
+                  [transactions.iloc[i:i + 9973]
+                   for i in range(0, len(transactions), 9973)]),
+                 ('zipped CSV file', zipPath)]
+        for label, feed in feeds:
+            ads = adsLocal.build_ads(customer, accounts, feed, chunkRows=50000)
+            differences = benchAdsPipeline.compare_ads(ads, reference)
+            print('  check, {:<22s} {:,} ADS rows, {}'.format(
+                  label, len(ads), 'OK' if not differences else
+                  'DIFFERS in ' + ', '.join(differences)))
+            if differences:
+                failures.append(label)
+
+    # Scaling.
+    baseAds = adsLocal.build_ads(customer, accounts, [transactions])
+    print('Scaling of the ADS build')
+    print('  {:>5s} {:>12s} {:>10s} {:>10s} {:>16s} {:>12s}'.format(
+          'scale', 'transactions', 'feed s', 'build s', 'transactions/s',
+          'peak RSS MB'))
+    for scale in [s for s in [1, 10, 100] if s <= maxScale]:
+        customers, accountsAll, feed = replicate(customer, accounts,
+                                                 transactions, scale)
+        with benchUtils.Timer() as feedTimer:
+            for _ in feed():
+                pass
+        with benchUtils.Timer() as timer:
+            ads = adsLocal.build_ads(customers, accountsAll, feed())
+        nTrans = scale * len(transactions)
+        print('  {:>4d}x {:12,d} {:10.3f} {:10.3f} {:16,.0f} {:12.0f}'.format(
+              scale, nTrans, feedTimer.elapsed, timer.elapsed,
+              nTrans / timer.elapsed, peak_memory_mb()))
+        if not ads.equals(expected_ads(baseAds, scale)):
+            failures.append('scale {}x'.format(scale))
+
+    if failures:
+        sys.exit('FAIL: the ADS differs for ' + ', '.join(failures))
+    print('OK: every ADS matches the reference')
+
+
+if __name__ == '__main__':
+    main()
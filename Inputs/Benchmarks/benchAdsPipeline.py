@@ -0,0 +1,225 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 2 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchAdsPipeline.py
+# ##############################################################################
+#
+# Benchmark of the lazy ADS build pipeline of adsPipeline.py against the
+# to_pandas() round trips of the Part 2 "TBv2_Py-2-Explore-Transform-ADS.ipynb"
+# notebook. An in-memory SQLite database stands in for Vantage, with the
+# Customer and Accounts tables of Inputs/Data, and with a Transactions table
+# of synthetic transactions of the accounts, as the transactions data are
+# only shipped as a FastLoad script. The ADS and the income histogram are
+# built in 2 ways:
+#   - as in the notebook: every transformation step is transferred to the
+#     client with to_pandas(), and the histogram is computed from the whole
+#     income column on the client;
+#   - with the pipeline: the steps are inspected with head(), the ADS is
+#     created in the database in a single statement, and the histogram is
+#     computed from per-bin counts streamed to the client.
+# The time, queries, rows and bytes transferred of both ways are reported.
+# The ADS of the pipeline is checked against a pandas reference build from
+# the CSV files, and its histogram against np.histogram(); the benchmark
+# exits with an error on any mismatch.
+#
+# Usage: python benchAdsPipeline.py [transPerAcct]
+#        (default: 10 transactions per account on average)
+#
+################################################################################
+
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+
+import benchUtils
+import adsPipeline
+
+dataPath = os.path.join(benchUtils.inputsPath, 'Data')
+
+###
+### Local stand-in of the database
+###
+
+def load_tables(transPerAcct=10, seed=0):
+    """Return the Customer, Accounts and synthetic Transactions DataFrames."""
+    customer = pd.read_csv(os.path.join(dataPath, 'Customer.csv'),
+                           dtype={'marital_status': str, 'postal_code': str})
+    accounts = pd.read_csv(os.path.join(dataPath, 'Accounts.csv'),
+                           dtype={'acct_nbr': str})
+    rng = np.random.RandomState(seed)
+    counts = rng.poisson(transPerAcct, len(accounts))
+    acctNbr = np.repeat(accounts['acct_nbr'].to_numpy(), counts)
+    n = len(acctNbr)
+    days = rng.randint(0, 365, n)
+    principal = np.round(rng.normal(0, 500, n), 2)
+    interest = np.where(rng.rand(n) < 0.2, np.round(rng.rand(n) * 20, 2), 0.0)
+    transactions = pd.DataFrame({
+        'tran_id': np.arange(1, n + 1), 'acct_nbr': acctNbr,
+        'tran_amt': principal + interest, 'principal_amt': principal,
+        'interest_amt': interest,
+        'tran_date': (np.datetime64('2021-01-01') +
+                      days.astype('timedelta64[D]')).astype(str)})
+    return customer, accounts, transactions
+
+
+def make_database(customer, accounts, transactions):
+    connection = sqlite3.connect(':memory:')
+    for name, df in [('Customer', customer), ('Accounts', accounts),
+                     ('Transactions', transactions)]:
+        df.to_sql(name, connection, index=False)
+    return connection
+
+###
+### Reference ADS in pandas
+###
+
+def reference_ads(customer, accounts, transactions):
+    """Build the ADS from the source tables with pandas, as in the notebook."""
+    cust = customer.rename(columns={'years_with_bank': 'tot_cust_years',
+                                    'nbr_children': 'tot_children'})
+    cust['female_ind'] = (cust['gender'] == 'F').astype(int)
+    for code, name in [('1', 'single'), ('2', 'married'), ('3', 'separated')]:
+        cust[name + '_ind'] = (cust['marital_status'] == code).astype(int)
+    for state in adsPipeline.topStates:
+        cust[state.lower() + '_resident_ind'] = (
+            cust['state_code'] == state).astype(int)
+    cust['state_code'] = cust['state_code'].where(
+        cust['state_code'].isin(adsPipeline.topStates), 'OTHER')
+
+    acct = accounts.copy()
+    for column in ['starting_balance', 'ending_balance']:
+        acct[column] = acct[column].fillna(acct[column].median())
+    for accountType in ['CC', 'CK', 'SV']:
+        prefix = accountType.lower()
+        ind = (acct['acct_type'] == accountType).astype(int)
+        acct[prefix + '_acct_ind'] = ind
+        acct[prefix + '_bal'] = ind * (acct['starting_balance'] +
+                                       acct['ending_balance'])
+
+    trans = transactions.copy()
+    month = pd.to_datetime(trans['tran_date']).dt.month
+    for q in range(1, 5):
+        trans['q{}_trans'.format(q)] = month.between(3 * q - 2, 3 * q).astype(int)
+
+    cat = cust.merge(acct, on='cust_id', how='left').merge(
+        trans, on='acct_nbr', how='left')
+    amount = cat['principal_amt'] + cat['interest_amt']
+    cat['cc_tran_amt'] = np.where(cat['cc_acct_ind'] == 1, amount, 0)
+    cat['ck_tran_amt'] = np.where(cat['ck_acct_ind'] == 1, amount, 0)
+    cat['sv_tran_amt'] = np.where(cat['ck_acct_ind'] == 1, amount, 0)
+
+    names = adsPipeline.stoSchema.ads.names
+    aggregates = {}
+    for name in names[1:]:
+        if name.endswith('_avg_bal'):
+            aggregates[name] = (name[:2] + '_bal', 'mean')
+        elif name.endswith('_avg_tran_amt'):
+            aggregates[name] = (name[:2] + '_tran_amt', 'mean')
+        elif name.endswith('_trans_cnt'):
+            aggregates[name] = (name[:2] + '_trans',
+                                lambda values: values.sum(min_count=1))
+        else:
+            aggregates[name] = (name, 'max')
+    ads = cat.groupby('cust_id', as_index=False).agg(**aggregates)
+    return ads[names].dropna()
+
+
+def compare_ads(ads, reference):
+    """Return a list of the columns where 2 ADS differ."""
+    ads = ads.sort_values('cust_id').reset_index(drop=True)
+    reference = reference.sort_values('cust_id').reset_index(drop=True)
+    if len(ads) != len(reference):
+        return ['rows: {} != {}'.format(len(ads), len(reference))]
+    differences = []
+    for name, colType in adsPipeline.stoSchema.ads:
+        a, b = ads[name], reference[name]
+        if colType == 'str':
+            same = (a.astype(str) == b.astype(str)).all()
+        else:
+            a = pd.to_numeric(a).to_numpy(dtype=float)
+            b = pd.to_numeric(b).to_numpy(dtype=float)
+            same = np.allclose(a, b, rtol=1e-9, atol=1e-6, equal_nan=True)
+        if not same:
+            differences.append(name)
+    return differences
+
+###
+### The 2 ways to build the ADS
+###
+
+def notebook_way(connection):
+    """Transfer every step to the client, as the Part 2 notebook does."""
+    pipeline = adsPipeline.AdsPipeline(connection, 'sqlite')
+    for step in [pipeline.cust, pipeline.acct, pipeline.trans,
+                 pipeline.cust_acct, pipeline.cust_acct_tran]:
+        step().to_pandas()
+    pipeline.materialize(pipeline.ads(), 'ADS_Py_notebook')
+    income = pipeline.to_pandas('SELECT income FROM Customer WHERE income IS '
+                                'NOT NULL')['income'].to_numpy(dtype=float)
+    counts, edges = np.histogram(income, bins=range(0, int(round(income.max())),
+                                                    10000))
+    return pipeline, counts, edges
+
+
+def pipeline_way(connection):
+    """Inspect the steps with head(), and keep the data in the database."""
+    pipeline = adsPipeline.AdsPipeline(connection, 'sqlite')
+    for step in [pipeline.cust, pipeline.acct, pipeline.trans,
+                 pipeline.cust_acct, pipeline.cust_acct_tran]:
+        step().head(5)
+    pipeline.materialize(pipeline.ads(), 'ADS_Py_pipeline')
+    counts, edges = pipeline.histogram(pipeline.customer(), 'income', 10000)
+    return pipeline, counts, edges
+
+
+def main():
+    transPerAcct = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    customer, accounts, transactions = load_tables(transPerAcct)
+    connection = make_database(customer, accounts, transactions)
+    print('Customer: {:,} rows, Accounts: {:,} rows, Transactions: {:,} rows'
+          .format(len(customer), len(accounts), len(transactions)))
+
+    results = []
+    for label, way in [('notebook (to_pandas)', notebook_way),
+                       ('lazy pipeline', pipeline_way)]:
+        with benchUtils.Timer() as timer:
+            pipeline, counts, edges = way(connection)
+        results.append((label, timer.elapsed, pipeline.transfer, counts, edges))
+
+    print('ADS build and income histogram')
+    print('  {:<22s} {:>9s} {:>8s} {:>12s} {:>14s}'.format(
+          'way', 'seconds', 'queries', 'rows', 'bytes'))
+    for label, seconds, transfer, _, _ in results:
+        print('  {:<22s} {:9.3f} {:8d} {:12,d} {:14,d}'.format(
+              label, seconds, transfer['queries'], transfer['rows'],
+              transfer['bytes']))
+
+    failures = []
+    reference = reference_ads(customer, accounts, transactions)
+    for table in ['ADS_Py_notebook', 'ADS_Py_pipeline']:
+        ads = pd.read_sql('SELECT * FROM {}'.format(table), connection)
+        differences = compare_ads(ads, reference)
+        if differences:
+            failures.append('{} differs in {}'.format(table, ', '.join(differences)))
+    _, _, _, countsA, edgesA = results[0]
+    _, _, _, countsB, edgesB = results[1]
+    if not (np.array_equal(countsA, countsB) and np.array_equal(edgesA, edgesB)):
+        failures.append('the streamed histogram differs from np.histogram()')
+    if failures:
+        sys.exit('FAIL: ' + '; '.join(failures))
+    print('OK: both ADS match the pandas reference, and the histograms match')
+
+
+if __name__ == '__main__':
+    main()
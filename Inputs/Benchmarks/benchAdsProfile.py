@@ -0,0 +1,236 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 2 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchAdsProfile.py
+# ##############################################################################
+#
+# Benchmark of the one-pass sketch profiling of adsProfile.py against the
+# exact pandas profiling of a table that is loaded into memory, on the
+# Customer and Accounts tables of Inputs/Data with the column types of their
+# fastload scripts. The tables are replicated 1x, 10x and 100x, with new keys
+# in the first column of every replica. For each table and scale:
+#   - the time and peak memory of adsProfile.profile_table() on all cores,
+#     and of pandas read_csv(), describe(), np.histogram(), value_counts() and
+#     nunique() are reported; each runs in a process of its own, and the peak
+#     memory is the one of that process plus the one of its largest worker;
+#   - the profile is checked against the exact pandas results: the counts,
+#     NULLs, min, max, zeros, positives, negatives and the fixed-width
+#     histograms must be equal, the mean and std equal up to rounding, the
+#     frequent values of text columns with few distinct values equal; the
+#     rank error of the quartiles must be within 2% of the count, and the
+#     error of the distinct counts within 5%.
+# The benchmark exits with an error if a check fails.
+#
+# Usage: python benchAdsProfile.py [maxScale [jobs]]
+#        (default: scales up to 100x, all cores)
+#
+################################################################################
+
+import json
+import os
+import pickle
+import resource
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import benchUtils
+import adsProfile
+
+dataPath = os.path.join(benchUtils.inputsPath, 'Data')
+
+# Table, fastload script and exact histogram bin widths.
+tables = [('Customer', 'Customer.fastload', {'income': 10000}),
+          ('Accounts', 'Accounts.fastload', {'ending_balance': 1000})]
+
+rankTolerance = 0.02
+distinctTolerance = 0.05
+
+
+def replicate_csv(sourcePath, targetPath, scale, skip):
+    """Write a data file with scale copies of the records of a data file.
+
+    The first column is a numeric key; it is offset in every copy, keeping
+    its width, so that the keys stay unique.
+    """
+    with open(sourcePath) as fIn:
+        lines = fIn.read().splitlines()
+    header, records = lines[:skip], lines[skip:]
+    keys = [record.split(',', 1) for record in records]
+    step = 10 ** len(str(max(int(key) for key, _ in keys)))
+    with open(targetPath, 'w') as fOut:
+        for line in header:
+            fOut.write(line + '\n')
+        for r in range(scale):
+            for key, rest in keys:
+                fOut.write('{},{}\n'.format(
+                    str(int(key) + r * step).zfill(len(key)), rest))
+
+
+def read_exact(table):
+    """Read a whole table with pandas, with the column types of its profile."""
+    schema = benchUtils.stoSchema.as_schema(table['schema'])
+    readOptions = dict(schema.read_options(table['sep']), skiprows=table['skip'])
+    df = pd.read_csv(table['path'], **readOptions)
+    for name, colType in schema:
+        if colType == 'str':
+            df[name] = df[name].replace('', np.nan)
+    return df
+
+
+def run_exact(table, widths):
+    """Profile a table exactly with pandas, as the notebook would."""
+    df = read_exact(table)
+    numeric = [name for name, colType in table['schema'] if colType != 'str']
+    text = [name for name, colType in table['schema'] if colType == 'str']
+    df[numeric].describe()
+    df.nunique()
+    for name in text:
+        df[name].value_counts()
+    for name, width in widths.items():
+        values = df[name].dropna()
+        np.histogram(values, bins=np.arange(0, values.max() + width, width))
+
+
+def peak_memory_mb():
+    """Return the peak RSS in MB of the process plus its largest worker."""
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss +
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024.0
+
+
+def run_case(mode, tablePath, widths, jobs, outPath):
+    """Run a profiling of a table in a new process; return (seconds, MB)."""
+    command = [sys.executable, __file__, '--run', mode, tablePath,
+               json.dumps(widths), str(jobs), outPath]
+    result = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+    seconds, peakMB = result.stdout.decode().split()
+    return float(seconds), float(peakMB)
+
+
+def run_child(mode, tablePath, widths, jobs, outPath):
+    with open(tablePath, 'rb') as fIn:
+        table = pickle.load(fIn)
+    with benchUtils.Timer() as timer:
+        if mode == 'sketch':
+            profile = adsProfile.profile_table(table, jobs, widths=widths)
+        else:
+            run_exact(table, widths)
+    if mode == 'sketch':
+        with open(outPath, 'wb') as fOut:
+            pickle.dump(profile, fOut)
+    print(timer.elapsed, peak_memory_mb())
+
+
+def check_profile(profile, df, widths):
+    """Return the differences of a profile from the exact values of a table."""
+    differences = []
+    described = profile.describe()
+    for name, colType in profile.schema:
+        row = described.loc[name]
+        values = df[name].dropna()
+        n = len(values)
+        if row['count'] != n or row['nulls'] != len(df) - n:
+            differences.append(name + ' counts')
+        distinct = values.nunique()
+        if abs(row['distinct'] - distinct) > distinctTolerance * distinct:
+            differences.append('{} distinct {} of {}'.format(
+                               name, row['distinct'], distinct))
+        if colType == 'str':
+            exact = values.value_counts()
+            if len(exact) <= 1000:
+                counts = profile.value_counts(name)
+                if not counts.sort_index().equals(exact.sort_index()):
+                    differences.append(name + ' frequent values')
+            continue
+        values = values.to_numpy()
+        if (row['min'] != values.min() or row['max'] != values.max() or
+                row['zeros'] != (values == 0).sum() or
+                row['positives'] != (values > 0).sum() or
+                row['negatives'] != (values < 0).sum()):
+            differences.append(name + ' min/max/signs')
+        if not np.allclose([row['mean'], row['std']],
+                           [values.mean(), values.std(ddof=1)], rtol=1e-9):
+            differences.append(name + ' mean/std')
+        ordered = np.sort(values)
+        for q, key in [(0.25, 'q1'), (0.5, 'median'), (0.75, 'q3')]:
+            low = np.searchsorted(ordered, row[key], side='left') / float(n)
+            high = np.searchsorted(ordered, row[key], side='right') / float(n)
+            if q < low - rankTolerance or q > high + rankTolerance:
+                differences.append('{} {} rank {:.3f}'.format(name, key, low))
+        if name in widths:
+            counts, edges = profile.histogram(name)
+            if not np.array_equal(counts, np.histogram(values, bins=edges)[0]):
+                differences.append(name + ' histogram')
+    return differences
+
+
+def main():
+    maxScale = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    failures = []
+
+    print('Profiling of the tables: time and peak RSS (incl. workers), '
+          'jobs={}'.format(jobs))
+    print('  {:<9s} {:>5s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s}'.format(
+          'table', 'scale', 'rows', 'sketch s', 'sketch MB', 'pandas s',
+          'pandas MB'))
+    with tempfile.TemporaryDirectory() as workDir:
+        # All timed runs come first, while the present process is small: a
+        # new process starts with the peak memory of the process it forks.
+        cases = []
+        for tableName, fastloadFile, widths in tables:
+            for scale in [s for s in [1, 10, 100] if s <= maxScale]:
+                table = adsProfile.read_fastload(os.path.join(dataPath,
+                                                              fastloadFile))
+                table['path'] = os.path.join(workDir, '{}_{}.csv'.format(
+                                             tableName, scale))
+                replicate_csv(os.path.join(dataPath, tableName + '.csv'),
+                              table['path'], scale, table['skip'])
+                tablePath = os.path.join(workDir, 'table.pickle')
+                with open(tablePath, 'wb') as fOut:
+                    pickle.dump(table, fOut)
+                profilePath = os.path.join(workDir, '{}_{}.profile'.format(
+                                           tableName, scale))
+                sketchTime, sketchMB = run_case('sketch', tablePath, widths,
+                                                jobs, profilePath)
+                exactTime, exactMB = run_case('pandas', tablePath, widths,
+                                              jobs, profilePath)
+                with open(profilePath, 'rb') as fIn:
+                    profile = pickle.load(fIn)
+                print('  {:<9s} {:>4d}x {:10,d} {:10.3f} {:10.0f} {:10.3f} '
+                      '{:10.0f}'.format(tableName, scale, profile.rows,
+                                        sketchTime, sketchMB, exactTime,
+                                        exactMB))
+                cases.append((tableName, scale, table, widths, profile))
+
+        print('Checks of the profiles against the exact values')
+        for tableName, scale, table, widths, profile in cases:
+            differences = check_profile(profile, read_exact(table), widths)
+            print('  {:<9s} {:>4d}x {}'.format(tableName, scale, 'OK' if not
+                  differences else 'DIFFERS in ' + ', '.join(differences)))
+            if differences:
+                failures.append('{} {}x'.format(tableName, scale))
+
+    if failures:
+        sys.exit('FAIL: the profile differs from the exact values for ' +
+                 ', '.join(failures))
+    print('OK: every profile matches the exact values within the tolerances')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        run_child(sys.argv[2], sys.argv[3], json.loads(sys.argv[4]),
+                  int(sys.argv[5]), sys.argv[6])
+    else:
+        main()
@@ -0,0 +1,80 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchBatchScoring.py
+# ##############################################################################
+#
+# Comparison of the two micromodel scoring layouts of stoRFScoreMM.py on the
+# SCRIPT operator emulator of stoEmulator.py:
+#   - partitioned by state_code; one script process per state, on the AMP the
+#     state hashes to, after a redistribution of the test rows; and
+#   - unpartitioned ("partitioned=false"); one script process per AMP on the
+#     rows the AMP holds, spread by the hash of cust_id, where each chunk is
+#     grouped by state_code and scored with the model of each state.
+# The outputs of both layouts are checked to hold the same rows, irrespective
+# of their order.
+#
+# Usage: python benchBatchScoring.py [nRows [nAmps]]  (default: 50,000 rows, 4 AMPs)
+#
+################################################################################
+
+import os
+import sys
+import tempfile
+
+import benchUtils
+import stoEmulator
+import stoParse
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    nAmps = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    ads = benchUtils.synthetic_ads(nRows)
+    print('Input: {:,} rows on {} AMPs'.format(nRows, nAmps))
+
+    layouts = [('partitioned', stoEmulator.distribute(ads, nAmps, partitionBy='state_code'),
+                ['chunk=10000']),
+               ('unpartitioned', stoEmulator.distribute(ads, nAmps, hashBy='cust_id'),
+                ['chunk=10000', 'partitioned=false'])]
+    outputs = {}
+    print('{:<14s} {:>6s} {:>9s} {:>12s} {:>12s} {:>9s}'.format(
+          'layout', 'procs', 'wall s', 'slowest AMP', 'rows/s', 'peak MB'))
+    with tempfile.TemporaryDirectory() as workDir:
+        benchUtils.make_sandbox(workDir, benchUtils.fit_sandbox_model(1))
+        benchUtils.make_multiple_models(workDir)
+        command = [sys.executable,
+                   os.path.join('.', benchUtils.uifFolder, 'stoRFScoreMM.py')]
+        for label, work, args in layouts:
+            runs, wall = stoEmulator.run_amps(workDir, command + args, work,
+                                              stoParse.adsSchema)
+            if any(run.failed for run in runs):
+                sys.exit('stoRFScoreMM.py failed in the {} layout'.format(label))
+            lines = []
+            for run in runs:
+                with open(run.outPath, 'rb') as fIn:
+                    lines += fIn.read().splitlines()
+            outputs[label] = sorted(lines)
+            print('{:<14s} {:6d} {:9.3f} {:12.3f} {:12,.0f} {:9.1f}'.format(
+                  label, sum(len(run.parts) for run in runs), wall,
+                  max(run.elapsed for run in runs), nRows / wall,
+                  max(run.peakMB for run in runs)))
+
+    if len(outputs['partitioned']) != nRows:
+        sys.exit('FAIL: {:,} output rows for {:,} input rows'.format(
+                 len(outputs['partitioned']), nRows))
+    if outputs['partitioned'] != outputs['unpartitioned']:
+        sys.exit('FAIL: the unpartitioned output differs from the partitioned one')
+    print('PASS: identical output rows in both layouts')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchBinaryIO.py
+# ##############################################################################
+#
+# Benchmark of the binary columnar I/O mode ("io=binary") of the scoring
+# scripts against the default delimited text mode. The input decode and the
+# output encode of both formats are timed in-process, and stoRFScore.py and
+# stoRFScoreMM.py are run end-to-end in both modes. The output of the binary
+# mode is converted back to text with the stoFrame module, and checked to be
+# identical to the output of the text mode. The binary input must also be
+# smaller than the text input.
+# A small forest is used by default, so that the I/O share of the run time
+# stands out; pass a larger number of trees to see it with the demo model.
+#
+# Usage: python benchBinaryIO.py [nRows [nTrees]]  (default: 200,000 rows, 10 trees)
+#
+################################################################################
+
+import io
+import os
+import sys
+import tempfile
+
+import benchUtils
+import stoFrame
+import stoParse
+import stoWrite
+
+
+def run_both(workDir, scriptName, text, frames, args=()):
+    """Run a script on text and binary input; return both outputs and times."""
+    outputs, times = {}, {}
+    for mode, data in [('text', text), ('binary', frames)]:
+        outPath = os.path.join(workDir, mode + '.out')
+        with open(outPath, 'wb') as fOut:
+            rc, times[mode], _ = benchUtils.run_script(
+                workDir, scriptName, list(args) + ['io=' + mode],
+                feed=[data], stdout=fOut)
+        if rc != 0:
+            sys.exit('{} failed in {} mode'.format(scriptName, mode))
+        with open(outPath, 'rb') as fIn:
+            outputs[mode] = fIn.read()
+    return outputs, times
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    nTrees = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    ads = benchUtils.synthetic_ads(nRows)
+    text = benchUtils.engine_text(ads)
+    frames = stoFrame.frames_from_text(text, stoParse.adsSchema)
+    print('Input: {:,} rows; text {:,.1f} MB, binary {:,.1f} MB'.format(
+          nRows, len(text) / 2**20, len(frames) / 2**20))
+    if len(frames) >= len(text):
+        sys.exit('FAIL: the binary input is not smaller than the text input')
+
+    # In-process decode of the input and encode of the output.
+    with benchUtils.Timer() as tParse:
+        dfText = stoParse.parse_text(text)
+    oneFrame = stoFrame.encode_frame([dfText[n] for n in dfText.columns],
+                                     list(dfText.columns))
+    with benchUtils.Timer() as tDecode:
+        dfBinary = next(stoFrame.read_frames(io.BytesIO(oneFrame)))
+    if not dfBinary.equals(dfText):
+        sys.exit('FAIL: the binary input decodes to different columns')
+    outColumns = [dfText['cust_id'], ads['income'].to_numpy() / 1e5,
+                  1.0 - ads['income'].to_numpy() / 1e5, dfText['cc_acct_ind']]
+    with benchUtils.Timer() as tFormat:
+        stoWrite.format_rows(outColumns)
+    with benchUtils.Timer() as tEncode:
+        stoFrame.encode_frame(outColumns, ['ID', 'Prob_0', 'Prob_1', 'Actual'])
+    benchUtils.report('In-process I/O of {:,} rows:'.format(nRows),
+                      [('text input parse', tParse.elapsed, nRows),
+                       ('binary input decode', tDecode.elapsed, nRows),
+                       ('text output format', tFormat.elapsed, nRows),
+                       ('binary output encode', tEncode.elapsed, nRows)])
+
+    # End-to-end runs of the scoring scripts in both modes.
+    failed = False
+    with tempfile.TemporaryDirectory() as workDir:
+        benchUtils.make_sandbox(workDir, benchUtils.fit_sandbox_model(nTrees))
+        outputs, times = run_both(workDir, 'stoRFScore.py', text, frames)
+        rows = [('stoRFScore.py ' + mode, times[mode], nRows)
+                for mode in ('text', 'binary')]
+        if stoFrame.frames_to_text(outputs['binary']).encode() != outputs['text']:
+            print('FAIL: stoRFScore.py binary output differs from text output')
+            failed = True
+
+        benchUtils.make_multiple_models(workDir)
+        part = ads[ads['state_code'] == 'OTHER']
+        partText = benchUtils.engine_text(part)
+        outputs, times = run_both(workDir, 'stoRFScoreMM.py', partText,
+                                  stoFrame.frames_from_text(partText, stoParse.adsSchema))
+        rows += [('stoRFScoreMM.py OTHER ' + mode, times[mode], len(part))
+                 for mode in ('text', 'binary')]
+        if stoFrame.frames_to_text(outputs['binary']).encode() != outputs['text']:
+            print('FAIL: stoRFScoreMM.py binary output differs from text output')
+            failed = True
+    benchUtils.report('End-to-end script runs ({} trees):'.format(nTrees), rows)
+    if failed:
+        sys.exit(1)
+    print('PASS: binary and text modes produce identical results')
+
+
+if __name__ == '__main__':
+    main()
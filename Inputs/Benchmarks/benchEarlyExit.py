@@ -0,0 +1,159 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchEarlyExit.py
+# ##############################################################################
+#
+# Benchmark of the threshold mode of the scoring scripts, in which a row is
+# scored with blocks of trees until its decision Prob_1 > threshold is settled
+# (stoForest.FlatForest.predict_threshold()), against the evaluation of all
+# trees. The forest of 500 trees is fitted on half of the sandbox test data,
+# and scores synthetic rows resampled from the other half, so that not all
+# rows are clear-cut. For several thresholds, and for the sure stops only
+# (confidence=1, the default) and the opt-in statistical stops
+# (confidence=0.9999):
+#   - the mean and maximum trees evaluated per row, the share of the rows that
+#     stop early, and the rows per second, with the speedup over the faster of
+#     the flat engine and scikit-learn on all trees;
+#   - the rate of the decisions that differ from the ones of all trees, and
+#     whether the probabilities of the rows scored with all trees are
+#     identical to the ones of predict_proba().
+# The mismatch rate of the statistical stops over all thresholds is reported,
+# too. Then stoRFScore.py and stoRFScoreMM.py run with "threshold=0.5" on the
+# sandbox data, and their Decision column is checked against the Prob_1 of
+# the default scripts. The benchmark exits with an error on any difference of
+# the sure stops or of the scripts; the statistical stops may differ.
+#
+# Usage: python benchEarlyExit.py [nRows]
+#        (default: 20000 synthetic rows)
+#
+################################################################################
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+import benchUtils
+import stoForest
+
+thresholds = [0.2, 0.35, 0.5, 0.65, 0.8]
+confidences = [1.0, 0.9999]
+repeats = 3
+
+
+def best_time(function):
+    """Return the result and the best time of a few calls of a function."""
+    best = float('inf')
+    for _ in range(repeats):
+        with benchUtils.Timer() as timer:
+            result = function()
+        best = min(best, timer.elapsed)
+    return result, best
+
+
+def script_output(workDir, scriptName, text, args):
+    """Run a scoring script; return its output rows as lists of fields."""
+    outPath = os.path.join(workDir, 'score.out')
+    with open(outPath, 'wb') as fOut:
+        rc = benchUtils.run_script(workDir, scriptName, args, feed=[text],
+                                   stdout=fOut)[0]
+    if rc != 0:
+        raise RuntimeError('{} {} failed'.format(scriptName, ' '.join(args)))
+    with open(outPath) as fIn:
+        return [line.split(' , ') for line in fIn.read().splitlines()]
+
+
+def check_script(workDir, scriptName, texts, probColumn):
+    """Return True if the Decision column of the threshold mode of a script
+    matches the Prob_1 of its default mode, row by row."""
+    full, early = [], []
+    for text in texts:
+        full += script_output(workDir, scriptName, text, [])
+        early += script_output(workDir, scriptName, text, ['threshold=0.5'])
+    match = ([int(float(row[probColumn]) > 0.5) for row in full] ==
+             [int(row[-2]) for row in early])
+    print('  {:<16s} {:,} rows, {:.1f} trees per row, decisions {}'.format(
+          scriptName, len(early), np.mean([int(row[-1]) for row in early]),
+          'match' if match else 'DIFFER'))
+    return match
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    df = benchUtils.load_sandbox_data()
+    trainRows = df.sample(frac=0.5, random_state=0)
+    classifier = benchUtils.fit_sandbox_model(500, trainRows)
+    X = benchUtils.synthetic_ads(nRows, df=df.drop(trainRows.index))[
+        benchUtils.predictor_columns]
+    forest = stoForest.flatten_forest(classifier)
+    nTrees = forest.n_estimators
+    failures = []
+    mismatches, scored = 0, 0
+
+    full, flatTime = best_time(lambda: forest.predict_proba(X))
+    _, sklearnTime = best_time(lambda: classifier.predict_proba(X))
+    fullTime = min(flatTime, sklearnTime)
+    print('Forest of {} trees, {:,} rows: all trees at {:,.0f} rows/s (flat), '
+          '{:,.0f} rows/s (scikit-learn)'.format(nTrees, len(X), len(X) / flatTime,
+                                                 len(X) / sklearnTime))
+    print('  {:>9s} {:>10s} {:>11s} {:>9s} {:>11s} {:>10s} {:>9s} {:>10s} '
+          '{:>11s}'.format('threshold', 'confidence', 'trees/row', 'max',
+                           'early rows', 'rows/s', 'speedup', 'mismatch',
+                           'full rows'))
+    for threshold in thresholds:
+        expected = full[:, 1] > threshold
+        for confidence in confidences:
+            (proba, used), elapsed = best_time(
+                lambda: forest.predict_threshold(X, threshold,
+                                                 confidence=confidence))
+            differing = int(((proba[:, 1] > threshold) != expected).sum())
+            allTrees = used == nTrees
+            identical = np.array_equal(proba[allTrees], full[allTrees])
+            print('  {:9.2f} {:10g} {:11.1f} {:9d} {:10.1f}% {:10,.0f} {:8.1f}x '
+                  '{:9.4f}% {:>11s}'.format(
+                      threshold, confidence, used.mean(), used.max(),
+                      100.0 * (~allTrees).mean(), len(X) / elapsed,
+                      fullTime / elapsed, 100.0 * differing / len(X),
+                      'identical' if identical else 'DIFFER'))
+            if confidence < 1.0:
+                mismatches += differing
+                scored += len(X)
+            elif differing:
+                failures.append('threshold {}: {} decisions of the sure '
+                                'stops differ'.format(threshold, differing))
+            if not identical:
+                failures.append('threshold {} confidence {}: the rows of all '
+                                'trees differ'.format(threshold, confidence))
+    print('Statistical stops: {:,} of {:,} decisions differ ({:.4f}%)'.format(
+          mismatches, scored, 100.0 * mismatches / scored))
+
+    print('Scoring scripts with threshold=0.5 on the sandbox data')
+    with tempfile.TemporaryDirectory() as workDir:
+        benchUtils.make_sandbox(workDir)
+        benchUtils.make_multiple_models(workDir, df)
+        if not check_script(workDir, 'stoRFScore.py',
+                            [benchUtils.engine_text(df)], 2):
+            failures.append('stoRFScore.py decisions differ')
+        if not check_script(workDir, 'stoRFScoreMM.py',
+                            [text for _, text in
+                             sorted(benchUtils.partition_text(df).items())], 3):
+            failures.append('stoRFScoreMM.py decisions differ')
+
+    if failures:
+        sys.exit('FAIL: ' + '; '.join(failures))
+    print('OK: the decisions of the sure stops and of the scripts match the '
+          'evaluation of all trees')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchFitCores.py
+# ##############################################################################
+#
+# Benchmark of the parallel tree fitting of stoRFFitMM.py against the number of
+# cores. A synthetic ADS with a skewed state_code distribution is partitioned
+# like the Database does, and the script fits each partition with "jobs=<n>".
+# The slowest partition is the critical path of the in-Database training job.
+# The fitted models are checked to be identical for all core counts.
+#
+# Usage: python benchFitCores.py [nRows]     (default: 20,000 rows)
+#
+################################################################################
+
+import os
+import sys
+import tempfile
+
+import benchUtils
+import stoParse
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    maxCores = stoParse.available_cores()
+    coreCounts = [n for n in (1, 2, 4, 8, 16, 32) if n < maxCores] + [maxCores]
+    partitions = benchUtils.partition_text(benchUtils.synthetic_ads(nRows))
+    sizes = {code: text.count(b'\n') for code, text in partitions.items()}
+    print('Synthetic ADS partitions: ' + ', '.join(
+          '{} {:,}'.format(code, sizes[code])
+          for code in sorted(sizes, key=lambda c: -sizes[c])))
+
+    models = {}
+    print('Fit time per partition (s) against cores:')
+    print('  {:>5s} {:>9s} {:>9s}'.format('cores', 'OTHER', 'critical'))
+    with tempfile.TemporaryDirectory() as workDir:
+        benchUtils.make_sandbox(workDir, benchUtils.fit_sandbox_model(1))
+        outPath = os.path.join(workDir, 'fit.out')
+        for nCores in coreCounts:
+            times = {}
+            for code, text in partitions.items():
+                with open(outPath, 'wb') as fOut:
+                    rc, times[code], _ = benchUtils.run_script(
+                        workDir, 'stoRFFitMM.py', ['jobs={}'.format(nCores)],
+                        feed=[text], stdout=fOut)
+                if rc != 0:
+                    sys.exit('stoRFFitMM.py failed for ' + code)
+                with open(outPath, 'rb') as fIn:
+                    model = fIn.read()
+                if models.setdefault(code, model) != model:
+                    sys.exit('FAIL: the {} model differs with {} cores'.format(code, nCores))
+            print('  {:>5d} {:9.2f} {:9.2f}'.format(
+                  nCores, times.get('OTHER', 0.0), max(times.values())))
+    print('PASS: identical models for all core counts')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchForest.py
+# ##############################################################################
+#
+# Throughput benchmark of the flat-array forest engine of the stoForest module
+# against scikit-learn's predict_proba(), for the 500-tree sandbox model. The
+# rows are scored in chunks of different sizes, as the scoring scripts do, and
+# the probabilities of both engines are checked to be identical.
+#
+# Usage: python benchForest.py [nRows]       (default: 20,000 rows)
+#
+################################################################################
+
+import sys
+
+import numpy as np
+
+import benchUtils
+import stoForest
+import stoParse
+
+chunkSizes = [50, 100, 500, 1000, 5000]
+
+
+def score_in_chunks(classifier, X, chunkRows):
+    return np.vstack([classifier.predict_proba(X[start:start + chunkRows])
+                      for start in range(0, len(X), chunkRows)])
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    classifier = benchUtils.fit_sandbox_model()
+    with benchUtils.Timer() as tExport:
+        flatForest = stoForest.flatten_forest(classifier)
+    print('Flattened {} trees, {:,} nodes in {:.3f} s'.format(
+          flatForest.n_estimators, flatForest.n_nodes, tExport.elapsed))
+
+    df = stoParse.parse_text(benchUtils.scaled_engine_text(nRows))
+    X = df[benchUtils.predictor_columns]
+    for chunkRows in chunkSizes:
+        with benchUtils.Timer() as tSklearn:
+            expected = score_in_chunks(classifier, X, chunkRows)
+        with benchUtils.Timer() as tFlat:
+            actual = score_in_chunks(flatForest, X, chunkRows)
+        if not np.allclose(actual, expected, rtol=0.0, atol=1e-12):
+            sys.exit('FAIL: probabilities differ for chunks of {} rows'.format(chunkRows))
+        benchUtils.report('Chunks of {:,} rows (identical: {}):'.format(
+                          chunkRows, np.array_equal(actual, expected)),
+                          [('sklearn predict_proba', tSklearn.elapsed, nRows),
+                           ('stoForest flat engine', tFlat.elapsed, nRows)])
+
+
+if __name__ == '__main__':
+    main()
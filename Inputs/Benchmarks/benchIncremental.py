@@ -0,0 +1,131 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchIncremental.py
+# ##############################################################################
+#
+# Benchmark of the incremental training mode of stoRFFitMM.py against a full
+# refit, over a series of daily refreshes of one state_code partition. The
+# sandbox test data are split into a training and a holdout part; the training
+# rows of the partition, and of every daily batch of new rows, are resampled
+# from the training part. Each day, the state's model is
+#   - refitted in full on all the rows so far; and
+#   - updated incrementally from the model of the previous day, with the new
+#     rows of the day only.
+# The training time of the script and the AUC of both models on the holdout
+# rows are reported, together with the AUC drift of the incremental model and
+# its lineage. The incremental models are checked to keep the forest size and
+# to record their lineage correctly.
+#
+# Usage: python benchIncremental.py [nRows [nDays [newShare [replace]]]]
+#        (default: 20,000 rows, 5 days of 5% new rows, replace=0.2)
+#
+################################################################################
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import roc_auc_score
+
+import benchUtils
+import stoModelBundle
+
+stateCode = 'CA'
+
+
+def fit(workDir, df, args=()):
+    """Train the state's model with stoRFFitMM.py; return it and the time."""
+    outPath = os.path.join(workDir, 'fit.out')
+    with open(outPath, 'wb') as fOut:
+        rc, elapsed, _ = benchUtils.run_script(workDir, 'stoRFFitMM.py', args,
+                                               feed=[benchUtils.engine_text(df)],
+                                               stdout=fOut)
+    if rc != 0:
+        raise RuntimeError('stoRFFitMM.py failed with {}'.format(args))
+    with open(outPath) as fIn:
+        modelText = fIn.read().split(',', 1)[1]
+    return stoModelBundle.decode_clob_model(modelText), elapsed
+
+
+def auc(payload, holdout):
+    """Return the AUC of a serialized model on the holdout rows."""
+    model = stoModelBundle.load_payload(payload)
+    proba = model.predict_proba(holdout[benchUtils.predictor_columns])
+    return roc_auc_score(holdout['cc_acct_ind'], proba[:, 1])
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    nDays = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    newShare = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    replace = float(sys.argv[4]) if len(sys.argv) > 4 else 0.2
+    nNew = max(1, int(nRows * newShare))
+
+    sandbox = benchUtils.load_sandbox_data()
+    rng = np.random.RandomState(0)
+    holdoutRows = rng.rand(len(sandbox)) < 0.3
+    holdout, source = sandbox[holdoutRows], sandbox[~holdoutRows]
+    shares = [(stateCode, 1.0)]
+    allRows = benchUtils.synthetic_ads(nRows, shares, seed=0, df=source)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as workDir:
+        benchUtils.make_sandbox(workDir, benchUtils.fit_sandbox_model(1))
+        basePath = os.path.join(workDir, 'base.bundle')
+        incrArgs = ['incremental=true', 'replace={}'.format(replace),
+                    'base=' + basePath]
+
+        model, elapsed = fit(workDir, allRows)
+        stoModelBundle.write_bundle(basePath, {stateCode: model})
+        print('Day 0: full fit on {:,} rows in {:.2f} s; holdout AUC {:.4f} '
+              '({} holdout rows)'.format(nRows, elapsed, auc(model, holdout),
+                                         len(holdout)))
+        print('{:>4s} {:>9s} {:>9s} {:>9s} {:>8s} {:>9s} {:>9s} {:>8s} {:>4s} '
+              '{:>6s}'.format('day', 'rows', 'full s', 'incr s', 'speedup',
+                              'AUC full', 'AUC incr', 'drift', 'gen', 'refit'))
+        for day in range(1, nDays + 1):
+            newRows = benchUtils.synthetic_ads(nNew, shares, seed=day, df=source)
+            newRows['cust_id'] += day * 10000000
+            allRows = pd.concat([allRows, newRows], ignore_index=True)
+            fullModel, fullTime = fit(workDir, allRows)
+            incrModel, incrTime = fit(workDir, newRows, incrArgs)
+            stoModelBundle.write_bundle(basePath, {stateCode: incrModel})
+
+            fullAUC, incrAUC = auc(fullModel, holdout), auc(incrModel, holdout)
+            classifier = stoModelBundle.load_payload(incrModel)
+            lineage = stoModelBundle.model_lineage(classifier)
+            print('{:4d} {:9,d} {:9.2f} {:9.2f} {:7.1f}x {:9.4f} {:9.4f} {:+8.4f} '
+                  '{:4d} {:>6s}'.format(day, len(allRows), fullTime, incrTime,
+                                        fullTime / incrTime, fullAUC, incrAUC,
+                                        incrAUC - fullAUC, lineage['generation'],
+                                        'yes' if lineage['refitDue'] else 'no'))
+
+            nTrees = len(classifier.estimators_)
+            counts = np.bincount(lineage['trees'])
+            if nTrees != 500 or len(lineage['trees']) != nTrees:
+                failures.append('day {}: {} trees, lineage of {}'.format(
+                                day, nTrees, len(lineage['trees'])))
+            if lineage['generation'] != day or counts[day] != round(replace * 500):
+                failures.append('day {}: generation {}, {} new trees'.format(
+                                day, lineage['generation'], counts[-1]))
+            if lineage['rows'] != [nRows] + [nNew] * day:
+                failures.append('day {}: rows {}'.format(day, lineage['rows']))
+
+    if failures:
+        sys.exit('FAIL: ' + '; '.join(failures))
+    print('OK: the incremental models keep 500 trees and record their lineage')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchLocalScoring.py
+# ##############################################################################
+#
+# Benchmark of the parallel client-side scoring of stoScoreLocal.py against a
+# single stoRFScore.py process, on a synthetic test ADS. The input is scored
+#   - by stoRFScore.py from the SCRIPT operator text of the rows, as on an AMP;
+#   - by stoScoreLocal.py from a CSV file with a header row, and from the
+#     SCRIPT operator text, with several numbers of worker processes.
+# Every output of stoScoreLocal.py is checked to be byte-for-byte identical
+# to the output of stoRFScore.py.
+#
+# Usage: python benchLocalScoring.py [nRows [shardMB]]
+#        (default: 200,000 rows in shards of 2 MB)
+#
+################################################################################
+
+import os
+import subprocess
+import sys
+import tempfile
+
+import benchUtils
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    shardMB = sys.argv[2] if len(sys.argv) > 2 else '2'
+    cores = benchUtils.stoParse.available_cores()
+    workerCounts = sorted(set([1, 2, max(2, cores)]))
+
+    df = benchUtils.synthetic_ads(nRows)
+    failures = []
+    with tempfile.TemporaryDirectory() as workDir:
+        uifPath = benchUtils.make_sandbox(workDir)
+        modelPath = os.path.join(uifPath, 'RFmodel_py.out')
+        csvPath = os.path.join(workDir, 'test_ads.csv')
+        textPath = os.path.join(workDir, 'test_ads.txt')
+        df.to_csv(csvPath, index=False)
+        with open(textPath, 'wb') as fOut:
+            fOut.write(benchUtils.engine_text(df))
+
+        refPath = os.path.join(workDir, 'reference.out')
+        with open(textPath, 'rb') as fIn, open(refPath, 'wb') as fOut:
+            rc, elapsed, _ = benchUtils.run_script(workDir, 'stoRFScore.py',
+                                                   stdin=fIn, stdout=fOut)
+        if rc != 0:
+            sys.exit('FAIL: stoRFScore.py exited with {}'.format(rc))
+        with open(refPath, 'rb') as fIn:
+            reference = fIn.read()
+        rows = [('stoRFScore.py, 1 process', elapsed, nRows)]
+
+        for inPath, label in [(csvPath, 'CSV'), (textPath, 'STO text')]:
+            for workers in workerCounts:
+                outPath = os.path.join(workDir, 'local.out')
+                command = [sys.executable,
+                           os.path.join(benchUtils.inputsPath, 'stoScoreLocal.py'),
+                           inPath, outPath, '--model', modelPath,
+                           '--workers', str(workers), '--shard-mb', shardMB]
+                with benchUtils.Timer() as timer:
+                    subprocess.check_call(command, stderr=subprocess.DEVNULL)
+                rows.append(('local, {}, {} worker(s)'.format(label, workers),
+                             timer.elapsed, nRows))
+                with open(outPath, 'rb') as fIn:
+                    if fIn.read() != reference:
+                        failures.append('{} input with {} worker(s)'.format(
+                                        label, workers))
+
+    benchUtils.report('Scoring of {:,} rows on {} core(s), shards of {} MB'.format(
+                      nRows, cores, shardMB), rows)
+    if failures:
+        sys.exit('FAIL: output differs from stoRFScore.py for ' +
+                 ', '.join(failures))
+    print('OK: all local outputs are identical to the stoRFScore.py output')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchModelFormat.py
+# ##############################################################################
+#
+# Benchmark of the model serialization formats: the original base64-encoded
+# pickle of the whole classifier, against the compact model files of the
+# stoModelFile module with each of their compression methods. The size of the
+# files and of their base64 text in the Model CLOB column is reported together
+# with the time to load the full forest, and the first trees of it only. All
+# loaded forests are checked to predict exactly like the fitted classifier.
+#
+# Usage: python benchModelFormat.py [nRows [nTrees]]
+#        (default: a forest of 500 trees fitted on 5,000 synthetic ADS rows)
+#
+################################################################################
+
+import base64
+import pickle
+import sys
+
+import numpy as np
+
+import benchUtils
+import stoModelFile
+
+partialTrees = 50
+repeats = 5
+
+
+def best_time(function):
+    """Return the best of a few timed calls of a function, and its result."""
+    best = float('inf')
+    for _ in range(repeats):
+        with benchUtils.Timer() as timer:
+            result = function()
+        best = min(best, timer.elapsed)
+    return best, result
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    nTrees = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    ads = benchUtils.synthetic_ads(nRows)
+    classifier = benchUtils.fit_sandbox_model(nTrees, ads)
+    X = benchUtils.synthetic_ads(2000, seed=1)[benchUtils.predictor_columns]
+    expected = classifier.predict_proba(X)
+    print('Forest: {} trees, {:,} nodes, fitted on {:,} rows'.format(
+          nTrees, sum(e.tree_.node_count for e in classifier.estimators_), nRows))
+
+    legacy = base64.b64encode(pickle.dumps(classifier))
+    formats = [('pickle+b64 (original)', legacy,
+                lambda: pickle.loads(base64.b64decode(legacy)), None)]
+    for compression in ('zlib', 'lzma', 'none'):
+        data = stoModelFile.dumps(classifier, compression)
+        formats.append(('compact ' + compression, data,
+                        (lambda data=data: stoModelFile.loads(data)),
+                        (lambda data=data: stoModelFile.loads(data, partialTrees))))
+
+    failed = False
+    print('{:<22s} {:>11s} {:>11s} {:>7s} {:>9s} {:>12s}'.format(
+          'format', 'file KB', 'CLOB KB', 'ratio', 'load ms',
+          'load {} ms'.format(partialTrees)))
+    for label, data, load, loadPartial in formats:
+        clobSize = len(data) if data is legacy else len(base64.b64encode(data))
+        loadTime, model = best_time(load)
+        partialText = '-'
+        if loadPartial is not None:
+            partialTime, partial = best_time(loadPartial)
+            partialText = '{:.1f}'.format(partialTime * 1000)
+            if partial.n_estimators != partialTrees:
+                print('FAIL: {} partial load has {} trees'.format(
+                      label, partial.n_estimators))
+                failed = True
+        print('{:<22s} {:11,.1f} {:11,.1f} {:6.1f}x {:9.1f} {:>12s}'.format(
+              label, len(data) / 1024.0, clobSize / 1024.0,
+              len(legacy) / float(len(data)), loadTime * 1000, partialText))
+        if not np.array_equal(model.predict_proba(X), expected):
+            print('FAIL: the {} model predicts differently'.format(label))
+            failed = True
+    if failed:
+        sys.exit(1)
+    print('PASS: all formats load forests with identical predictions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchModelLoad.py
+# ##############################################################################
+#
+# Benchmark of the per-partition model load of stoRFScoreMM.py: the original
+# read of the whole multipleModels_py.csv file with base64 decoding, against
+# the memory-mapped model bundle of the stoModelBundle module, without and with
+# the per-process cache. The files hold the sandbox model under nStates keys.
+# A bundle of compact, quantized and corrupt compact model files is then
+# loaded and closed; the benchmark exits with an error if the close fails.
+#
+# Usage: python benchModelLoad.py [nStates]    (default: 20 state codes)
+#
+################################################################################
+
+import base64
+import os
+import pickle
+import sys
+import tempfile
+
+import pandas as pd
+
+import benchUtils
+import stoModelBundle
+import stoModelFile
+
+
+def legacy_load(csvPath, currStateCode):
+    """The original model load code of stoRFScoreMM.py."""
+    allStateModels = pd.read_csv(csvPath)
+    modelSerB64 = allStateModels.loc[
+        allStateModels['State_Code'].str.strip() == currStateCode,
+        ['Model'] ].iloc[0,0].strip()
+    modelSerB64 = modelSerB64.partition("'")[2]
+    modelSer = base64.b64decode(modelSerB64)
+    return pickle.loads(modelSer)
+
+
+def check_close(workDir, classifier):
+    """Return a failure message if a bundle cannot be closed once its compact
+    model files have been loaded, or have failed to load; else None."""
+    corrupt = bytearray(stoModelFile.dumps(classifier, compression='none'))
+    corrupt[-20] ^= 0xff
+    bundlePath = os.path.join(workDir, 'close.bundle')
+    stoModelBundle.write_bundle(bundlePath, {
+        'compact': stoModelFile.dumps(classifier, compression='none'),
+        'quantized': stoModelFile.dumps(classifier, quantize=True),
+        'corrupt': bytes(corrupt)})
+    bundle = stoModelBundle.ModelBundle(bundlePath)
+    models = [bundle.load('compact'), bundle.load('quantized')]
+    try:
+        bundle.load('corrupt')
+        return 'a corrupt model file loaded'
+    except ValueError as e:
+        # Keep the error, and the frames of its traceback, alive at the close.
+        error = e
+    try:
+        bundle.close()
+    except BufferError as e:
+        return 'the bundle could not be closed after its loads: {}'.format(e)
+    return None
+
+
+def main():
+    nStates = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    classifier = benchUtils.fit_sandbox_model()
+    modelText = " " + repr(base64.b64encode(pickle.dumps(classifier)))
+    keys = ['S{:03d}'.format(i) for i in range(nStates)]
+
+    with tempfile.TemporaryDirectory() as workDir:
+        csvPath = os.path.join(workDir, 'multipleModels_py.csv')
+        bundlePath = os.path.join(workDir, 'multipleModels_py.bundle')
+        pd.DataFrame({'State_Code': keys, 'Model': modelText}).to_csv(
+            csvPath, index=False)
+        stoModelBundle.bundle_from_csv(csvPath, bundlePath)
+        print('{} models: CSV {:,.1f} MB, bundle {:,.1f} MB'.format(
+              nStates, os.path.getsize(csvPath) / 2**20,
+              os.path.getsize(bundlePath) / 2**20))
+
+        # Every partition loads the model of its own state code.
+        with benchUtils.Timer() as tOld:
+            for key in keys:
+                legacy_load(csvPath, key)
+        with benchUtils.Timer() as tNew:
+            for key in keys:
+                stoModelBundle.ModelBundle(bundlePath).load(key)
+        # A process that scores every partition twice hits the cache.
+        with benchUtils.Timer() as tCached:
+            for key in keys + keys:
+                stoModelBundle.load_model(bundlePath, key)
+        failure = check_close(workDir, classifier)
+
+    print('Model load time per partition:')
+    for label, seconds, nLoads in [('legacy CSV + base64', tOld.elapsed, nStates),
+                                   ('bundle, memory-mapped', tNew.elapsed, nStates),
+                                   ('bundle, process cache', tCached.elapsed, 2 * nStates)]:
+        print('  {:<28s} {:10.1f} ms'.format(label, 1000.0 * seconds / nLoads))
+    if failure:
+        sys.exit('FAIL: ' + failure)
+    print('OK: a bundle closes after loads of compact model files')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchParse.py
+# ##############################################################################
+#
+# Benchmark of the SCRIPT operator input parse: the original per-column
+# pd.to_numeric() and apply() chain of stoRFScore.py and stoRFFitMM.py against
+# the single-pass parser of the stoParse module. The input is the sandbox test
+# data in the Database text format, scaled up to the requested number of rows.
+# The parser is also checked on edge cases of a general schema: integers
+# beyond 2^53, blanks inside text values, NULLs, fractions and exponent forms
+# in integer columns. The benchmark exits with an error if a check fails.
+#
+# Usage: python benchParse.py [nRows]       (default: 1,000,000 rows)
+#
+################################################################################
+
+import sys
+
+import pandas as pd
+
+import benchUtils
+import stoParse
+
+
+def legacy_parse(text):
+    """The original read and conversion code of stoRFScore.py."""
+    delimiter = ','
+    inputData = []
+    for line in text.splitlines():
+        line = line.split(delimiter)
+        inputData.append(line)
+
+    df = pd.DataFrame(inputData, columns=[n for n, _ in stoParse.adsSchema])
+    del inputData
+
+    for name, colType in stoParse.adsSchema:
+        if colType == 'float':
+            df[name] = df[name].apply(lambda x: "".join(x.split()))
+        if colType != 'str':
+            df[name] = pd.to_numeric(df[name])
+    return df
+
+
+# Edge cases: input text, and the expected (id, name, x) rows.
+edgeSchema = [('id', 'int'), ('name', 'str'), ('x', 'float')]
+edgeCases = [
+    (b'9007199254740993,New York,1.5E 002\n',
+     [[9007199254740993, 'New York', 150.0]]),
+    (b'-9223372036854775807,TYPE E 2,1.0E 000\n7,A,2\n',
+     [[-9223372036854775807, 'TYPE E 2', 1.0], [7, 'A', 2.0]]),
+    (b'1.000E 002,a b,1\n,c,\n', [[100.0, 'a b', 1.0], [None, 'c', None]]),
+    (b'1.5E 000,z,3\n', [[1.5, 'z', 3.0]])]
+
+
+def check_edge_cases():
+    """Return the edge cases whose parse differs from the expected rows."""
+    failures = []
+    for data, expected in edgeCases:
+        df = stoParse.parse_text(data, edgeSchema)
+        rows = [[None if isinstance(v, float) and v != v else v for v in row]
+                for row in df.astype(object).values.tolist()]
+        if rows != expected:
+            failures.append('{!r}: {} instead of {}'.format(data, rows, expected))
+    return failures
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    data = benchUtils.scaled_engine_text(nRows)
+    print('Input: {:,} rows, {:,.1f} MB'.format(nRows, len(data) / 2**20))
+
+    with benchUtils.Timer() as tNew:
+        dfNew = stoParse.parse_text(data)
+    with benchUtils.Timer() as tOld:
+        dfOld = legacy_parse(data.decode())
+
+    pd.testing.assert_frame_equal(dfNew, dfOld, check_dtype=False)
+    benchUtils.report('Parse of SCRIPT operator input:',
+                      [('legacy to_numeric/apply', tOld.elapsed, nRows),
+                       ('stoParse.parse_text', tNew.elapsed, nRows)])
+    print('  speed-up: {:.1f}x'.format(tOld.elapsed / tNew.elapsed))
+
+    failures = check_edge_cases()
+    if failures:
+        sys.exit('FAIL: the parse differs for ' + '; '.join(failures))
+    print('OK: {} edge cases parse as expected'.format(len(edgeCases)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchPartitionReader.py
+# ##############################################################################
+#
+# Benchmark of the input read of stoRFScoreMM.py against the chunk size: the
+# original first-row input() parse, per-value converters and the splice of the
+# first row into the first chunk with loc[-1] and sort_index(), against the
+# peek-ahead PartitionReader of the stoParse module. The input is a single
+# state_code partition in the Database text format. All chunks of both readers
+# are checked to hold the same rows and values.
+#
+# Usage: python benchPartitionReader.py [nRows]     (default: 200,000 rows)
+#
+################################################################################
+
+import io
+import sys
+
+import pandas as pd
+
+import benchUtils
+import stoParse
+
+chunkSizes = [500, 1000, 5000, 10000, 50000, 100000]
+
+
+def legacy_chunks(text, nRowsIn):
+    """The original read code of stoRFScoreMM.py, yielding the chunks."""
+    delimiter = ','
+    colNames = [name for name, _ in stoParse.adsSchema]
+    sciStrToFloat = lambda x: float("".join(x.split()))
+    sciStrToInt = lambda x: int(float("".join(x.split())))
+    converters = {i: (sciStrToFloat if colType == 'float' else sciStrToInt)
+                  for i, (_, colType) in enumerate(stoParse.adsSchema)
+                  if colType != 'str'}
+    stdin = io.StringIO(text.decode())
+    line = stdin.readline().rstrip('\n')
+    allArgs = line.split(delimiter)
+    args_1 = [int(x.replace(" ","")) for x in allArgs[0:1]]
+    args_2 = [float(x.replace(" ","")) for x in allArgs[1:2]]
+    args_3 = [int(x.replace(" ","")) for x in allArgs[2:9]]
+    args_4 = [int(x.replace(" ","")) for x in allArgs[10:19]]
+    args_5 = [float(x.replace(" ","")) for x in allArgs[19:25]]
+    args_6 = [int(x.replace(" ","")) for x in allArgs[25:]]
+    currStateCode = allArgs[9].strip()
+    rowToScore = args_1 + args_2 + args_3 + [currStateCode] + args_4 + args_5 + args_6
+    reader = pd.read_csv(stdin, sep=delimiter, header=None, names=colNames,
+                         index_col=False, iterator=True, converters=converters)
+    while 1:
+        try:
+            dfToScore = reader.get_chunk(nRowsIn)
+        except (EOFError, StopIteration):
+            return
+        if rowToScore:
+            dfToScore.loc[-1] = rowToScore
+            dfToScore.index = dfToScore.index+1
+            dfToScore = dfToScore.sort_index()
+            rowToScore = []
+        dfToScore.reset_index(drop = True, inplace = True)
+        yield dfToScore
+
+
+def reader_chunks(text, nRowsIn):
+    reader = stoParse.PartitionReader(io.BytesIO(text), nRowsIn)
+    return iter(reader)
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    ads = benchUtils.synthetic_ads(nRows, shares=[('OTHER', 1.0)])
+    text = benchUtils.engine_text(ads)
+    print('Input: one state_code partition of {:,} rows, {:,.1f} MB'.format(
+          nRows, len(text) / 2**20))
+
+    print('Read time (s) against the chunk size:')
+    print('  {:>7s} {:>9s} {:>9s} {:>9s}'.format('chunk', 'legacy', 'reader',
+                                                 'speed-up'))
+    for nRowsIn in chunkSizes:
+        with benchUtils.Timer() as tOld:
+            old = list(legacy_chunks(text, nRowsIn))
+        with benchUtils.Timer() as tNew:
+            new = list(reader_chunks(text, nRowsIn))
+        pd.testing.assert_frame_equal(pd.concat(new, ignore_index=True),
+                                      pd.concat(old, ignore_index=True),
+                                      check_dtype=False)
+        if any(len(chunk) > nRowsIn for chunk in new):
+            sys.exit('FAIL: a reader chunk exceeds {} rows'.format(nRowsIn))
+        print('  {:7d} {:9.3f} {:9.3f} {:8.1f}x'.format(
+              nRowsIn, tOld.elapsed, tNew.elapsed, tOld.elapsed / tNew.elapsed))
+    print('PASS: both readers deliver the same rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchQuantize.py
+# ##############################################################################
+#
+# Benchmark of the quantized forests of the stoModelFile module against the
+# original pickled classifier and the exact compact model file, on the
+# sandbox test data. For the Part 4 forest, with fully grown trees, and for a
+# forest with leaves of at least 5 rows, whose leaves hold class fractions,
+# the following are reported for each format:
+#   - the size of the model file, and of its base64 text in a Model CLOB;
+#   - the time to load the model;
+#   - the memory of the node arrays of the loaded model once it has scored,
+#     which includes the working arrays of the flat forest engine, and the
+#     types of its feature, threshold, child and value arrays. A quantized
+#     forest saves memory on the thresholds, feature indices and leaf values
+#     only: its child indices are int32 in memory, as the ones of an exact
+#     compact forest;
+#   - the maximum deviation of the probabilities from the ones of the
+#     original classifier, and the number of output lines of stoRFScore.py
+#     that differ.
+# A quantized and an exact model file are then merged with
+# stoModelFile.merge(), in both orders, which must fail with a ValueError.
+# The benchmark exits with an error if a deviation exceeds the bound of
+# stoModelFile.quantization_error_bound(), or if such a merge does not fail
+# as expected.
+#
+# Usage: python benchQuantize.py [nTrees]
+#        (default: forests of 500 trees)
+#
+################################################################################
+
+import base64
+import pickle
+import sys
+
+import numpy as np
+
+import benchUtils
+import stoModelFile
+import stoWrite
+
+repeats = 5
+
+
+def best_time(function):
+    """Return the best of a few timed calls of a function."""
+    best = float('inf')
+    for _ in range(repeats):
+        with benchUtils.Timer() as timer:
+            function()
+        best = min(best, timer.elapsed)
+    return best
+
+
+def model_memory(model):
+    """Return the MB of the node arrays that a model holds once it has scored.
+
+    For a scikit-learn forest, these are the node and value arrays of its
+    trees; for a flat forest, its arrays and the working arrays of the engine.
+    """
+    if hasattr(model, 'estimators_'):
+        arrays = []
+        for estimator in model.estimators_:
+            state = estimator.tree_.__getstate__()
+            arrays += [state['nodes'], state['values']]
+    else:
+        arrays = [model.feature, model.threshold, model.children, model.value,
+                  model.roots] + list(model._walk_arrays())
+    unique = dict((id(a), a) for a in arrays)
+    return sum(a.nbytes for a in unique.values()) / 1024.0 / 1024.0
+
+
+def node_types(model):
+    """Return the in-memory types of the node arrays of a flat forest."""
+    if hasattr(model, 'estimators_'):
+        return 'scikit-learn tree nodes'
+    return 'feature {}, threshold {}, children {}, value {}'.format(
+        model.feature.dtype, model.threshold.dtype, model.children.dtype,
+        model.value.dtype)
+
+
+def output_text(df, proba):
+    """Return the stoRFScore.py output lines of the rows and probabilities."""
+    return stoWrite.format_rows([df['cust_id'], proba[:, 0], proba[:, 1],
+                                 df['cc_acct_ind']]).splitlines()
+
+
+def main():
+    nTrees = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    df = benchUtils.load_sandbox_data()
+    X = df[benchUtils.predictor_columns]
+    bound = stoModelFile.quantization_error_bound(2)
+    failures = []
+
+    from sklearn.ensemble import RandomForestClassifier
+    forests = [('fully grown trees', benchUtils.fit_sandbox_model(nTrees, df))]
+    smooth = RandomForestClassifier(n_estimators=nTrees, max_features=5,
+                                    min_samples_leaf=5, random_state=0)
+    forests.append(('leaves of 5+ rows', smooth.fit(X, df['cc_acct_ind'])))
+
+    for title, classifier in forests:
+        expected = classifier.predict_proba(X)
+        expectedText = output_text(df, expected)
+        nNodes = sum(e.tree_.node_count for e in classifier.estimators_)
+        print('Forest of {} trees with {}: {:,} nodes'.format(
+              nTrees, title, nNodes))
+        legacy = base64.b64encode(pickle.dumps(classifier))
+        compact = stoModelFile.dumps(classifier)
+        quantized = stoModelFile.dumps(classifier, quantize=True)
+        formats = [('pickle+b64 (original)', legacy,
+                    lambda: pickle.loads(base64.b64decode(legacy))),
+                   ('compact', compact, lambda: stoModelFile.loads(compact)),
+                   ('compact quantized', quantized,
+                    lambda: stoModelFile.loads(quantized))]
+
+        print('  {:<22s} {:>9s} {:>9s} {:>8s} {:>9s} {:>10s} {:>10s}'.format(
+              'format', 'file KB', 'CLOB KB', 'load ms', 'nodes MB',
+              'max dev', 'diff lines'))
+        for label, data, load in formats:
+            clobSize = len(data) if data is legacy else len(base64.b64encode(data))
+            model = load()
+            proba = model.predict_proba(X)
+            deviation = float(np.abs(proba - expected).max())
+            differing = sum(a != b for a, b in zip(output_text(df, proba),
+                                                   expectedText))
+            print('  {:<22s} {:9,.1f} {:9,.1f} {:8.1f} {:9.1f} {:10.2E} {:10d}'
+                  .format(label, len(data) / 1024.0, clobSize / 1024.0,
+                          best_time(load) * 1000, model_memory(model),
+                          deviation, differing))
+            print('  {:<22s} {}'.format('', node_types(model)))
+            if deviation > bound + 1e-12:
+                failures.append('{}, {} deviates beyond the bound'.format(
+                                title, label))
+        print('  deviation bound of a quantized forest: {:.2E}'.format(bound))
+        for files in ([compact, quantized], [quantized, compact]):
+            try:
+                stoModelFile.merge(files)
+                failures.append('{}, a mixed merge succeeded'.format(title))
+            except ValueError as e:
+                print('  mixed merge rejected: {}'.format(e))
+            except Exception as e:
+                failures.append('{}, a mixed merge raised {!r}'.format(title, e))
+
+    if failures:
+        sys.exit('FAIL: ' + '; '.join(failures))
+    print('OK: all deviations are within the bound, and mixed merges fail')
+
+
+if __name__ == '__main__':
+    main()
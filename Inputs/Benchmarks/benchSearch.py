@@ -0,0 +1,126 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchSearch.py
+# ##############################################################################
+#
+# Benchmark of the search mode of stoRFFitMM.py against one training job per
+# candidate parameter setting, on each state_code partition of the sandbox
+# test data. Like the Database, the script runs once per partition:
+#   - one job per candidate: the script is started, reads and parses the
+#     partition, and fits a single candidate, for every candidate of the grid;
+#   - search mode: the script is started once per partition with the whole
+#     grid ("search=grid").
+# Both use the same number of jobs. The metrics rows of the search are
+# checked to be identical to the ones of the single-candidate jobs, the
+# metric of the partition to be the OOB AUC only if every candidate has one,
+# and the selected model to be byte-for-byte the model of the best
+# single-candidate job by that metric. The benchmark exits with an error on any mismatch.
+#
+# Usage: python benchSearch.py [grid [jobs]]
+#        (default: the default grid of stoRFFitMM.py on all cores)
+#
+################################################################################
+
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+import benchUtils
+import stoModelBundle
+
+
+def search_grid():
+    """Return the default grid setting of stoRFFitMM.py."""
+    with open(os.path.join(benchUtils.inputsPath, 'stoRFFitMM.py')) as fIn:
+        for line in fIn:
+            if line.startswith('searchGrid = '):
+                return line.split('=', 1)[1].strip().strip("'")
+
+
+def run_search(workDir, text, grid, jobs):
+    """Run stoRFFitMM.py in search mode; return the output rows and seconds."""
+    outPath = os.path.join(workDir, 'search.out')
+    with open(outPath, 'wb') as fOut:
+        rc, elapsed, _ = benchUtils.run_script(
+            workDir, 'stoRFFitMM.py', ['search=grid', 'grid=' + grid,
+                                       'jobs={}'.format(jobs)],
+            feed=[text], stdout=fOut)
+    if rc != 0:
+        raise RuntimeError('stoRFFitMM.py failed with grid ' + grid)
+    with open(outPath) as fIn:
+        rows = [line.split(' , ') for line in fIn.read().splitlines()]
+    columns = benchUtils.stoSchema.searchOutput.names
+    return pd.DataFrame(rows, columns=columns), elapsed
+
+
+def main():
+    grid = sys.argv[1] if len(sys.argv) > 1 else search_grid()
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    df = benchUtils.load_sandbox_data()
+    gridValues = benchUtils.stoParse.parameter_grid(grid)
+    # The grid of each single candidate, in the order of the search.
+    singles = [[]]
+    for name, values in gridValues:
+        singles = [single + ['{}:{}'.format(name, value)]
+                   for single in singles for value in values]
+    print('Grid {}: {} candidates, jobs={}'.format(grid, len(singles), jobs))
+    failures = []
+
+    with tempfile.TemporaryDirectory() as workDir:
+        benchUtils.make_sandbox(workDir)
+        print('  {:<6s} {:>6s} {:>14s} {:>10s} {:>8s}  {}'.format(
+              'state', 'rows', 'per-candidate s', 'search s', 'speedup',
+              'selected'))
+        totals = [0.0, 0.0]
+        for stateCode, text in sorted(benchUtils.partition_text(df).items()):
+            singleRows, singleTime = [], 0.0
+            for single in singles:
+                rows, elapsed = run_search(workDir, text, ','.join(single), jobs)
+                singleRows.append(rows)
+                singleTime += elapsed
+            singleRows = pd.concat(singleRows, ignore_index=True)
+            searchRows, searchTime = run_search(workDir, text, grid, jobs)
+            totals[0] += singleTime
+            totals[1] += searchTime
+
+            metrics = ['Params', 'OOB_Accuracy', 'OOB_AUC']
+            if not searchRows[metrics].equals(singleRows[metrics]):
+                failures.append(stateCode + ' metrics')
+            # The best single-candidate job, by OOB AUC if every candidate has
+            # one, else by OOB accuracy; ties go to the first.
+            auc = pd.to_numeric(singleRows['OOB_AUC'])
+            metric = 'auc' if auc.notna().all() else 'accuracy'
+            if (searchRows['Metric'] != metric).any():
+                failures.append(stateCode + ' metric')
+            best = (auc if metric == 'auc' else
+                    pd.to_numeric(singleRows['OOB_Accuracy'])).idxmax()
+            searchRows['Selected'] = pd.to_numeric(searchRows['Selected'])
+            winner = stoModelBundle.search_winners(searchRows)
+            if (len(winner) != 1 or winner['Model'].iloc[0] !=
+                    singleRows['Model'].iloc[best]):
+                failures.append(stateCode + ' selected model')
+            print('  {:<6s} {:6,d} {:14.3f} {:10.3f} {:7.1f}x  {}'.format(
+                  stateCode, text.count(b'\n'), singleTime, searchTime,
+                  singleTime / searchTime, singleRows['Params'].iloc[best]))
+        print('  {:<13s} {:14.3f} {:10.3f} {:7.1f}x'.format(
+              'all states', totals[0], totals[1], totals[0] / totals[1]))
+
+    if failures:
+        sys.exit('FAIL: the search differs from the single-candidate jobs for ' +
+                 ', '.join(failures))
+    print('OK: the search selects the model of the best single-candidate job')
+
+
+if __name__ == '__main__':
+    main()
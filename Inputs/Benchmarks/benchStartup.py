@@ -0,0 +1,89 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchStartup.py
+# ##############################################################################
+#
+# Start-up benchmark of the SCRIPT operator scripts. Each script is run with
+# "python -X importtime" as on an AMP without data, and as on an AMP with one
+# state_code partition of the sandbox data. The report lists the wall time,
+# the total import time, and the most expensive top-level imports per run.
+# As a reference, the eager import of the libraries that the scripts used to
+# load before reading any input is profiled, too.
+#
+# Usage: python benchStartup.py [nTop]    (default: 5 top-level imports)
+#
+################################################################################
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import benchUtils
+
+scripts = ['stoRFScore.py', 'stoRFScoreMM.py', 'stoRFFitMM.py']
+eagerImports = 'import numpy, pandas, pickle, base64, sklearn.ensemble'
+
+
+def import_profile(stderrText):
+    """Parse -X importtime output into {top-level module: cumulative us}."""
+    profile = {}
+    for line in stderrText.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented below the module that triggers them.
+        if not name[1:].startswith(' '):
+            profile[name.strip()] = int(cumulative)
+    return profile
+
+
+def run_profiled(command, workDir, inputData):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + command,
+                          cwd=workDir, input=inputData,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - start
+    return elapsed, import_profile(proc.stderr.decode())
+
+
+def print_profile(label, elapsed, profile, nTop):
+    top = sorted(profile.items(), key=lambda item: -item[1])[:nTop]
+    print('  {:<34s} wall {:7.3f} s  imports {:7.3f} s'.format(
+          label, elapsed, sum(profile.values()) / 1e6))
+    for name, micros in top:
+        print('      {:<30s} {:9.3f} s'.format(name, micros / 1e6))
+
+
+def main():
+    nTop = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    df = benchUtils.load_sandbox_data()
+    partition = benchUtils.engine_text(df[df['state_code'] == 'NY'])
+
+    with tempfile.TemporaryDirectory() as workDir:
+        benchUtils.make_sandbox(workDir)
+        benchUtils.make_multiple_models(workDir, df)
+
+        print('Start-up profile (python -X importtime):')
+        elapsed, profile = run_profiled(['-c', eagerImports], workDir, b'')
+        print_profile('eager library imports (reference)', elapsed, profile, nTop)
+        for scriptName in scripts:
+            command = [os.path.join('.', benchUtils.uifFolder, scriptName)]
+            for label, inputData in [('no data', b''), ('NY partition', partition)]:
+                elapsed, profile = run_profiled(command, workDir, inputData)
+                print_profile('{}, {}'.format(scriptName, label),
+                              elapsed, profile, nTop)
+
+
+if __name__ == '__main__':
+    main()
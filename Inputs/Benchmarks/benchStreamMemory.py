@@ -0,0 +1,71 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchStreamMemory.py
+# ##############################################################################
+#
+# Peak memory check of the chunked scoring mode of stoRFScore.py. The script is
+# fed a synthetic input of 10 million rows through a pipe, and its peak RSS is
+# compared with the one of a run on a small input with the same chunk size.
+# The check fails if the peak RSS grows with the number of input rows.
+#
+# Usage: python benchStreamMemory.py [nRows [chunkRows]]
+#        (defaults: 10,000,000 rows in chunks of 10,000 rows)
+#
+################################################################################
+
+import sys
+import tempfile
+
+import benchUtils
+
+# Allowed growth of the peak RSS of the large run over the small run.
+rssToleranceMB = 32.0
+smallRows = 100000
+
+
+def feed_rows(nRows, blockRows=50000):
+    """Generate the synthetic input in blocks, without holding it in memory."""
+    block = benchUtils.scaled_engine_text(blockRows)
+    full, rest = divmod(nRows, blockRows)
+    for _ in range(full):
+        yield block
+    if rest:
+        yield benchUtils.scaled_engine_text(rest)
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    chunkRows = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    with tempfile.TemporaryDirectory() as workDir:
+        # A small forest keeps the run time short; memory is data-bound.
+        benchUtils.make_sandbox(workDir, benchUtils.fit_sandbox_model(10))
+        args = ['chunk={}'.format(chunkRows)]
+        results = []
+        for rows in (smallRows, nRows):
+            rc, seconds, peakMB = benchUtils.run_script(
+                workDir, 'stoRFScore.py', args, feed=feed_rows(rows))
+            if rc != 0:
+                sys.exit('stoRFScore.py failed with return code {}'.format(rc))
+            results.append((rows, seconds, peakMB))
+
+    print('Peak RSS of stoRFScore.py with chunk={:,}:'.format(chunkRows))
+    for rows, seconds, peakMB in results:
+        print('  {:>12,} rows {:10.1f} s {:10.1f} MB'.format(rows, seconds, peakMB))
+    growthMB = results[1][2] - results[0][2]
+    if growthMB > rssToleranceMB:
+        sys.exit('FAIL: peak RSS grew by {:.1f} MB'.format(growthMB))
+    print('PASS: peak RSS grew by {:.1f} MB'.format(growthMB))
+
+
+if __name__ == '__main__':
+    main()
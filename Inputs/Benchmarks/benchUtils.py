@@ -0,0 +1,236 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchUtils.py
+# ##############################################################################
+#
+# Common helpers for the local benchmarks of the Python scripts that are used
+# with the SCRIPT table operator in the Part 4 "TBv2_Py-4-In_DB_Scripting.ipynb"
+# notebook. The benchmarks run on the client, and need no Vantage system.
+#
+################################################################################
+
+import base64
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Folder with the SCRIPT operator scripts and the sandbox test data.
+inputsPath = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if inputsPath not in sys.path:
+    sys.path.insert(0, inputsPath)
+
+import stoParse
+import stoSchema
+
+sandboxDataFile = os.path.join(inputsPath, 'stoSandboxTestData.csv')
+
+# Name of the folder where the scripts look for their installed files.
+uifFolder = 'TRNG_TECHBYTES'
+
+predictor_columns = stoSchema.ads.names_of('predictor')
+
+
+def load_sandbox_data():
+    """Read the 500-row STO Sandbox test data set into a pandas DataFrame."""
+    return pd.read_csv(sandboxDataFile)
+
+
+# Shares of the state_code partitions in the synthetic ADS. As in the demo
+# data, the "OTHER" bucket of all states outside the top six is the largest.
+stateShares = [('OTHER', 0.55), ('CA', 0.15), ('NY', 0.09), ('TX', 0.09),
+               ('IL', 0.05), ('AZ', 0.04), ('OH', 0.03)]
+
+
+def synthetic_ads(nRows, shares=stateShares, seed=0, df=None):
+    """Return nRows synthetic ADS rows resampled from the sandbox data.
+
+    The rows are drawn with replacement, the balance and amount columns are
+    jittered by up to 5%, cust_id is made unique, and the state_code together
+    with its indicator columns is reassigned according to the shares.
+    """
+    rng = np.random.RandomState(seed)
+    if df is None:
+        df = load_sandbox_data()
+    out = df.iloc[rng.randint(0, len(df), nRows)].reset_index(drop=True)
+    out['cust_id'] = 10000000 + np.arange(nRows)
+    for name, colType in stoParse.adsSchema:
+        if colType == 'float':
+            out[name] = out[name] * rng.uniform(0.95, 1.05, nRows)
+    codes = [code for code, _ in shares]
+    weights = np.array([share for _, share in shares])
+    out['state_code'] = np.array(codes)[
+        rng.choice(len(codes), nRows, p=weights / weights.sum())]
+    for code in ['CA', 'NY', 'TX', 'IL', 'AZ', 'OH']:
+        out[code.lower() + '_resident_ind'] = (out['state_code'] == code).astype(int)
+    return out
+
+
+def engine_float_text(values):
+    """Format floats the way the Advanced SQL Engine sends them to a script.
+
+    The Database uses 14 significant digits and a 3-digit exponent with a blank
+    for a positive sign; e.g., 10575.4 is sent as 1.0575400000000E 004.
+    """
+    out = []
+    for x in values:
+        mantissa, _, exponent = ('%.13E' % x).partition('E')
+        sign = ' ' if exponent[0] == '+' else '-'
+        out.append(mantissa + 'E' + sign + exponent[1:].zfill(3))
+    return out
+
+
+def engine_text(df, schema=stoParse.adsSchema, delimiter=','):
+    """Return the rows of a DataFrame as SCRIPT operator input text (bytes)."""
+    columns = []
+    for name, colType in schema:
+        if colType == 'float':
+            columns.append(engine_float_text(df[name].to_numpy(np.float64)))
+        else:
+            columns.append(df[name].astype(str).tolist())
+    lines = [delimiter.join(row) for row in zip(*columns)]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def scaled_engine_text(nRows, df=None):
+    """Return SCRIPT operator input text with nRows rows of sandbox data.
+
+    The sandbox rows are formatted once and replicated, which is enough for
+    benchmarks whose cost does not depend on the actual values.
+    """
+    if df is None:
+        df = load_sandbox_data()
+    lines = engine_text(df).splitlines(keepends=True)
+    reps, rest = divmod(nRows, len(lines))
+    return b''.join(lines) * reps + b''.join(lines[:rest])
+
+
+def fit_sandbox_model(nEstimators=500, df=None):
+    """Fit the Part 4 Random Forests classifier on the sandbox test data."""
+    from sklearn.ensemble import RandomForestClassifier
+    if df is None:
+        df = load_sandbox_data()
+    classifier = RandomForestClassifier(n_estimators=nEstimators,
+                                        max_features=5, random_state=0)
+    return classifier.fit(df[predictor_columns], df['cc_acct_ind'])
+
+
+def make_sandbox(workDir, classifier=None, sourcePath=None):
+    """Lay out a local stand-in for the Database script folder.
+
+    The scripts and helper modules are copied into workDir/TRNG_TECHBYTES
+    together with the model file RFmodel_py.out, so that the scripts can be
+    run from workDir with the relative paths they use in the Database. The
+    scripts are taken from the Inputs folder, or from sourcePath.
+    """
+    if sourcePath is None:
+        sourcePath = inputsPath
+    uifPath = os.path.join(workDir, uifFolder)
+    os.makedirs(uifPath, exist_ok=True)
+    for fileName in os.listdir(sourcePath):
+        if fileName.endswith('.py'):
+            shutil.copy(os.path.join(sourcePath, fileName), uifPath)
+    if classifier is None:
+        classifier = fit_sandbox_model()
+    with open(os.path.join(uifPath, 'RFmodel_py.out'), 'wb') as fOut:
+        fOut.write(base64.b64encode(pickle.dumps(classifier)))
+    return uifPath
+
+
+def partition_text(df, column='state_code'):
+    """Return {partition value: SCRIPT operator input text} for a DataFrame."""
+    return {key: engine_text(part) for key, part in df.groupby(column)}
+
+
+def make_multiple_models(workDir, df=None, args=()):
+    """Train per-state models with stoRFFitMM.py and save them for scoring.
+
+    Like the Database, the script runs once per state_code partition. The
+    outputs are collected into the "State_Code, Model" CSV file that the
+    Part 4 notebook saves, and into the model bundle file that stoRFScoreMM.py
+    reads, in the sandbox folder.
+    """
+    if df is None:
+        df = load_sandbox_data()
+    rows = []
+    for stateCode, text in sorted(partition_text(df).items()):
+        outPath = os.path.join(workDir, 'fit_{}.out'.format(stateCode))
+        with open(outPath, 'wb') as fOut:
+            rc = run_script(workDir, 'stoRFFitMM.py', args,
+                            feed=[text], stdout=fOut)[0]
+        if rc != 0:
+            raise RuntimeError('stoRFFitMM.py failed for ' + stateCode)
+        with open(outPath) as fIn:
+            for line in fIn.read().splitlines():
+                rows.append(line.split(',', 1))
+        os.remove(outPath)
+    models = pd.DataFrame(rows, columns=['State_Code', 'Model'])
+    csvPath = os.path.join(workDir, uifFolder, 'multipleModels_py.csv')
+    models.to_csv(csvPath, index=False)
+    if os.path.exists(os.path.join(inputsPath, 'stoModelBundle.py')):
+        import stoModelBundle
+        stoModelBundle.bundle_from_csv(
+            csvPath, os.path.join(workDir, uifFolder, 'multipleModels_py.bundle'))
+    return models
+
+
+def run_script(workDir, scriptName, args=(), stdin=None, feed=None,
+               stdout=subprocess.DEVNULL, env=None, stderr=None):
+    """Run a script from the sandbox folder like the SCRIPT operator does.
+
+    The input is either a file object in stdin, or an iterable of byte blocks
+    in feed that is written to the script through a pipe. Returns the tuple
+    (return code, elapsed seconds, peak RSS in MB) of the script process.
+    """
+    command = [sys.executable, os.path.join('.', uifFolder, scriptName)]
+    start = time.perf_counter()
+    proc = subprocess.Popen(command + list(args), cwd=workDir, env=env,
+                            stdin=subprocess.PIPE if feed is not None else stdin,
+                            stdout=stdout, stderr=stderr)
+    if feed is not None:
+        try:
+            for block in feed:
+                proc.stdin.write(block)
+        except BrokenPipeError:
+            pass
+        proc.stdin.close()
+    # Use os.wait4() to get the resource usage of this very child process.
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = (os.WEXITSTATUS(status) if os.WIFEXITED(status)
+                       else -os.WTERMSIG(status))
+    elapsed = time.perf_counter() - start
+    return proc.returncode, elapsed, usage.ru_maxrss / 1024.0
+
+
+class Timer(object):
+    """Context manager that records the elapsed wall time in seconds."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
+
+
+def report(title, rows):
+    """Print a small benchmark table; rows are (label, seconds, nRows)."""
+    print(title)
+    for label, seconds, nRows in rows:
+        print('  {:<28s} {:10.3f} s {:14,.0f} rows/s'.format(
+              label, seconds, nRows / seconds if seconds else float('inf')))
@@ -0,0 +1,151 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchWarmWorker.py
+# ##############################################################################
+#
+# Benchmark of the latency of one script invocation in a warm worker of
+# stoWarmWorker.py against a cold start of a new script process, on the
+# sandbox test data. Each invocation is repeated, and the median latency is
+# reported:
+#   - stoRFScore.py and stoRFScoreSB.py on the whole input;
+#   - stoRFScoreMM.py on each state_code partition;
+# with the default script arguments and with "engine=flat". Every warm
+# output and exit code is checked to be identical to the one of the cold
+# process. The model file is then replaced by a different model, to check
+# that the warm worker does not score with a stale cached model. So is the
+# model bundle, between the run of stoRFScoreMM.py that first opens it and
+# the next one; the bundle is not there when the worker preloads.
+#
+# Usage: python benchWarmWorker.py [repeats]
+#        (default: 5 invocations of each case)
+#
+################################################################################
+
+import base64
+import os
+import pickle
+import shutil
+import statistics
+import sys
+import tempfile
+
+import benchUtils
+import stoModelBundle
+import stoWarmWorker
+
+
+def cold_run(workDir, scriptName, payload, args):
+    outPath = os.path.join(workDir, 'cold.out')
+    with open(outPath, 'wb') as fOut:
+        rc, elapsed, _ = benchUtils.run_script(workDir, scriptName, args,
+                                               feed=[payload], stdout=fOut)
+    with open(outPath, 'rb') as fIn:
+        return rc, fIn.read(), elapsed
+
+
+def warm_run(worker, scriptName, payload, args):
+    with benchUtils.Timer() as timer:
+        rc, output, _ = worker.run(scriptName, payload, args)
+    return rc, output, timer.elapsed
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    df = benchUtils.load_sandbox_data()
+    text = benchUtils.engine_text(df)
+    partitions = sorted(benchUtils.partition_text(df).items())
+    failures = []
+
+    with tempfile.TemporaryDirectory() as workDir:
+        uifPath = benchUtils.make_sandbox(workDir)
+        # stoRFScoreSB.py reads the model file from its working directory.
+        shutil.copy(os.path.join(uifPath, 'RFmodel_py.out'), workDir)
+        benchUtils.make_multiple_models(workDir, df)
+        bundlePath = os.path.join(uifPath, 'multipleModels_py.bundle')
+        os.rename(bundlePath, bundlePath + '.hidden')
+
+        with benchUtils.Timer() as startTimer:
+            worker = stoWarmWorker.WarmWorker(workDir)
+            # The first answer arrives once the worker has preloaded.
+            worker.run('stoRFScore.py', b'')
+        print('Warm worker started and preloaded in {:.3f} s'.format(
+              startTimer.elapsed))
+
+        # A new model bundle must be picked up by the warm worker, even when
+        # the previous one was first opened by the run just before.
+        os.rename(bundlePath + '.hidden', bundlePath)
+        worker.run('stoRFScoreMM.py', partitions[0][1])
+        bundleModel = benchUtils.fit_sandbox_model(50, df.sample(frac=0.5,
+                                                                 random_state=2))
+        stoModelBundle.write_bundle(bundlePath, {stateCode: bundleModel for
+                                                 stateCode, _ in partitions})
+        for stateCode, partText in partitions:
+            coldRc, coldOut, _ = cold_run(workDir, 'stoRFScoreMM.py', partText, [])
+            warmRc, warmOut, _ = warm_run(worker, 'stoRFScoreMM.py', partText, [])
+            if (coldRc, coldOut) != (warmRc, warmOut):
+                failures.append('stoRFScoreMM.py {} after a bundle '
+                                'change'.format(stateCode))
+
+        cases = []
+        for args in [[], ['engine=flat']]:
+            cases += [('stoRFScore.py', args, 'all', text),
+                      ('stoRFScoreSB.py', args, 'all', text)]
+            cases += [('stoRFScoreMM.py', args, stateCode, partText)
+                      for stateCode, partText in partitions]
+
+        print('Median latency of {} invocation(s) per case'.format(repeats))
+        print('  {:<32s} {:>6s} {:>9s} {:>9s} {:>8s}'.format(
+              'case', 'part', 'cold s', 'warm s', 'speedup'))
+        totals = [0.0, 0.0]
+        with worker:
+            for scriptName, args, part, payload in cases:
+                times = [[], []]
+                for _ in range(repeats):
+                    coldRc, coldOut, coldTime = cold_run(workDir, scriptName,
+                                                         payload, args)
+                    warmRc, warmOut, warmTime = warm_run(worker, scriptName,
+                                                         payload, args)
+                    times[0].append(coldTime)
+                    times[1].append(warmTime)
+                    if (coldRc, coldOut) != (warmRc, warmOut):
+                        failures.append('{} {} {}'.format(scriptName,
+                                                          ' '.join(args), part))
+                cold, warm = [statistics.median(t) for t in times]
+                totals[0] += cold
+                totals[1] += warm
+                print('  {:<32s} {:>6s} {:9.3f} {:9.3f} {:7.1f}x'.format(
+                      ' '.join([scriptName] + args), part, cold, warm,
+                      cold / warm))
+            print('  {:<39s} {:9.3f} {:9.3f} {:7.1f}x'.format(
+                  'all cases', totals[0], totals[1], totals[0] / totals[1]))
+
+            # A new model file must be picked up by the warm worker.
+            classifier = benchUtils.fit_sandbox_model(50, df.sample(frac=0.5,
+                                                                    random_state=1))
+            for path in [os.path.join(uifPath, 'RFmodel_py.out'),
+                         os.path.join(workDir, 'RFmodel_py.out')]:
+                with open(path, 'wb') as fOut:
+                    fOut.write(base64.b64encode(pickle.dumps(classifier)))
+            for scriptName in ['stoRFScore.py', 'stoRFScoreSB.py']:
+                coldRc, coldOut, _ = cold_run(workDir, scriptName, text, [])
+                warmRc, warmOut, _ = warm_run(worker, scriptName, text, [])
+                if (coldRc, coldOut) != (warmRc, warmOut):
+                    failures.append(scriptName + ' after a model change')
+
+    if failures:
+        sys.exit('FAIL: warm output differs from the cold output for ' +
+                 ', '.join(failures))
+    print('OK: all warm outputs are identical to the cold outputs')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: benchWrite.py
+# ##############################################################################
+#
+# Throughput benchmark of the scoring scripts output stage: the original
+# DataFrame.iterrows() and print() loop against the buffered writer of the
+# stoWrite module. Both write the stoRFScore.py output schema to an in-memory
+# stream, and the texts are checked to be identical.
+#
+# Usage: python benchWrite.py [nRows]       (default: 1,000,000 rows)
+#
+################################################################################
+
+import contextlib
+import io
+import sys
+
+import numpy as np
+import pandas as pd
+
+import benchUtils
+import stoParse
+import stoWrite
+
+
+def legacy_write(df, delimiter=','):
+    """The original output loop of stoRFScore.py."""
+    for index, row in df.iterrows():
+        print(row['cust_id'], delimiter,
+              row['Prob0'], delimiter, row['Prob1'], delimiter, row['cc_acct_ind'])
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    df = stoParse.parse_text(benchUtils.scaled_engine_text(nRows))
+    prob1 = np.random.RandomState(0).randint(0, 501, nRows) / 500.0
+    PredictionProba = np.column_stack([1.0 - prob1, prob1])
+    df = pd.concat([df, pd.DataFrame(data=PredictionProba, columns=['Prob0', 'Prob1'])], axis=1)
+
+    oldOut = io.StringIO()
+    with benchUtils.Timer() as tOld, contextlib.redirect_stdout(oldOut):
+        legacy_write(df)
+    newOut = io.StringIO()
+    with benchUtils.Timer() as tNew:
+        stoWrite.write_rows([df['cust_id'], PredictionProba[:, 0],
+                             PredictionProba[:, 1], df['cc_acct_ind']],
+                            out=newOut)
+
+    if oldOut.getvalue() != newOut.getvalue():
+        sys.exit('FAIL: the stoWrite output differs from the print() loop')
+    benchUtils.report('Output of {:,} scored rows:'.format(nRows),
+                      [('legacy iterrows/print', tOld.elapsed, nRows),
+                       ('stoWrite.write_rows', tNew.elapsed, nRows)])
+    print('  speed-up: {:.1f}x'.format(tOld.elapsed / tNew.elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: checkOutputs.py
+# ##############################################################################
+#
+# Regression check of the outputs of the SCRIPT operator scripts: the scripts
+# of the working tree are run side by side with the scripts of a git revision
+# (default: HEAD), on the same input, and their outputs are compared byte for
+# byte:
+#   - stoRFFitMM.py on every state_code partition; i.e., the serialized models;
+#   - stoRFScore.py and stoRFScoreSB.py on the whole input;
+#   - stoRFScoreMM.py on every state_code partition;
+# the scoring scripts with each set of script arguments given. Each tree
+# scores with the models that its own stoRFFitMM.py trained. The check exits
+# with an error if any output differs.
+#
+# Usage: python checkOutputs.py [--ref REV] [--rows N] [--args "a=1 b=2" ...]
+# Examples:
+#   python checkOutputs.py
+#   python checkOutputs.py --ref HEAD~3 --rows 20000 --args "" --args engine=flat
+#
+################################################################################
+
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+import benchUtils
+
+
+def export_inputs(ref, destPath):
+    """Extract the Inputs/*.py files of a git revision into a folder."""
+    repoPath = os.path.dirname(benchUtils.inputsPath)
+    archive = subprocess.check_output(['git', 'archive', '--format=tar', ref,
+                                       'Inputs'], cwd=repoPath)
+    os.makedirs(destPath)
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        for member in tar.getmembers():
+            if (member.isfile() and member.name.endswith('.py') and
+                    os.path.dirname(member.name) == 'Inputs'):
+                with open(os.path.join(destPath, os.path.basename(member.name)),
+                          'wb') as fOut:
+                    fOut.write(tar.extractfile(member).read())
+
+
+def run_outputs(workDir, sourcePath, df, classifier, argSets):
+    """Run the scripts of a source folder; return {case: output bytes}."""
+    uifPath = benchUtils.make_sandbox(workDir, classifier, sourcePath)
+    # stoRFScoreSB.py reads the model file from its working directory.
+    shutil.copy(os.path.join(uifPath, 'RFmodel_py.out'), workDir)
+    outputs = {}
+    models = benchUtils.make_multiple_models(workDir, df)
+    outputs['stoRFFitMM.py'] = models.to_csv(index=False).encode()
+
+    outPath = os.path.join(workDir, 'check.out')
+    text = benchUtils.engine_text(df)
+    partitions = sorted(benchUtils.partition_text(df).items())
+    for args in argSets:
+        jobs = [('stoRFScore.py', None, text), ('stoRFScoreSB.py', None, text)]
+        jobs += [('stoRFScoreMM.py', stateCode, partText)
+                 for stateCode, partText in partitions]
+        for scriptName, stateCode, feed in jobs:
+            with open(outPath, 'wb') as fOut:
+                rc = benchUtils.run_script(workDir, scriptName, args, feed=[feed],
+                                           stdout=fOut)[0]
+            with open(outPath, 'rb') as fIn:
+                output = fIn.read()
+            if rc != 0:
+                output += '\n(exit code {})\n'.format(rc).encode()
+            case = ' '.join([scriptName] + args)
+            outputs[case] = outputs.get(case, b'') + output
+    return outputs
+
+
+def first_difference(a, b):
+    """Return the line number and lines of the first difference of 2 texts."""
+    linesA, linesB = a.splitlines(), b.splitlines()
+    for i, (lineA, lineB) in enumerate(zip(linesA, linesB)):
+        if lineA != lineB:
+            return i + 1, lineA[:100], lineB[:100]
+    n = min(len(linesA), len(linesB))
+    return (n + 1, (linesA[n:] or [b'<end>'])[0][:100],
+            (linesB[n:] or [b'<end>'])[0][:100])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the script outputs of the working tree with the '
+                    'ones of a git revision.')
+    parser.add_argument('--ref', default='HEAD',
+                        help='git revision to compare with (default: HEAD)')
+    parser.add_argument('--rows', type=int, default=0,
+                        help='use this many rows of a synthetic ADS instead of '
+                             'the sandbox test data')
+    parser.add_argument('--args', action='append', default=None,
+                        help='script arguments of a scoring run, as one '
+                             'string; repeatable (default: none, and '
+                             '"engine=flat")')
+    args = parser.parse_args()
+    argSets = [a.split() for a in (args.args if args.args is not None
+                                   else ['', 'engine=flat'])]
+
+    df = (benchUtils.synthetic_ads(args.rows) if args.rows > 0
+          else benchUtils.load_sandbox_data())
+    classifier = benchUtils.fit_sandbox_model(500, df)
+    print('Comparing the script outputs of the working tree with {} on {:,} '
+          'rows'.format(args.ref, len(df)))
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        refPath = os.path.join(tempDir, 'ref')
+        export_inputs(args.ref, refPath)
+        expected = run_outputs(os.path.join(tempDir, 'old'), refPath, df,
+                               classifier, argSets)
+        actual = run_outputs(os.path.join(tempDir, 'new'), None, df,
+                             classifier, argSets)
+
+    failures = []
+    for case in expected:
+        same = expected[case] == actual[case]
+        print('  {:<36s} {:>12,d} bytes  {}'.format(
+              case, len(actual[case]), 'identical' if same else 'DIFFERS'))
+        if not same:
+            line, old, new = first_difference(expected[case], actual[case])
+            print('    line {}: {!r}\n         != {!r}'.format(line, old, new))
+            failures.append(case)
+    if failures:
+        sys.exit('FAIL: the outputs of {} changed'.format(', '.join(failures)))
+    print('OK: all outputs are identical')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: profileReport.py
+# ##############################################################################
+#
+# Aggregator of the STO_PROFILE summary lines that the stoRF*.py scripts write
+# to standard error when profiling is enabled (see stoProfile.py). Each line
+# is the profile of one script process; i.e., of one AMP, or of one partition
+# on an AMP. The report shows
+#   - per stage: the calls and the total, mean and maximum seconds across the
+#     processes, and the skew of the stage as its max / mean ratio;
+#   - per process: its key, rows and bytes in and out, wall and stage times,
+#     and peak RSS, slowest first.
+# A skew well above 1 points to the stage, and the processes, that hold up the
+# job.
+#
+# The lines are read from the given files, such as the stderr files of the
+# AMPs of stoEmulator.py --profile, or from standard input; other lines are
+# ignored.
+#
+# Usage: python profileReport.py [stderr files]
+# Examples:
+#   python stoEmulator.py stoRFScoreMM.py --partition-by state_code --profile
+#   STO_PROFILE=1 python stoEmulator.py stoRFScore.py 2> score.err
+#   python profileReport.py score.err
+#
+################################################################################
+
+import sys
+
+import benchUtils    # puts the Inputs folder on the path, for stoProfile
+import stoProfile
+
+
+def stage_table(profiles):
+    """Return the rows (stage, calls, sum, mean, max, skew) of all stages.
+
+    The mean and skew are taken across all processes, counting 0 seconds for
+    a process that did not run the stage. The stages are in order of their
+    total time, the largest first, followed by the wall time of the processes.
+    """
+    names = set()
+    for profile in profiles:
+        names.update(profile['stages'])
+    rows = []
+    for name in names:
+        seconds = [profile['stages'].get(name, [0.0, 0])[0] for profile in profiles]
+        calls = sum(profile['stages'].get(name, [0.0, 0])[1] for profile in profiles)
+        rows.append((name, calls) + _spread(seconds))
+    rows.sort(key=lambda row: -row[2])
+    rows.append(('(wall)', len(profiles)) +
+                _spread([profile['wall'] for profile in profiles]))
+    return rows
+
+
+def _spread(seconds):
+    """Return the sum, mean, max and max / mean skew of some times."""
+    total = sum(seconds)
+    mean = total / len(seconds)
+    top = max(seconds)
+    return total, mean, top, top / mean if mean else 1.0
+
+
+def print_report(profiles, out=None):
+    """Print the stage and process tables of some process profiles."""
+    out = sys.stdout if out is None else out
+    scripts = sorted(set(profile['script'] for profile in profiles))
+    print('{} process profile(s) of {}'.format(len(profiles), ', '.join(scripts)),
+          file=out)
+    print('{:<14s} {:>8s} {:>10s} {:>10s} {:>10s} {:>7s}'.format(
+          'stage', 'calls', 'sum s', 'mean s', 'max s', 'skew'), file=out)
+    for name, calls, total, mean, top, skew in stage_table(profiles):
+        print('{:<14s} {:8d} {:10.3f} {:10.3f} {:10.3f} {:7.2f}'.format(
+              name, calls, total, mean, top, skew), file=out)
+
+    names = sorted(set(name for profile in profiles for name in profile['stages']))
+    print(file=out)
+    print(('{:<8s} {:>10s} {:>12s} {:>10s} {:>12s} {:>8s}' +
+           ' {:>10s}' * len(names) + ' {:>8s}').format(
+          *(['key', 'rows in', 'bytes in', 'rows out', 'bytes out', 'wall s'] +
+            [name[:10] for name in names] + ['peak MB'])), file=out)
+    for profile in sorted(profiles, key=lambda profile: -profile['wall']):
+        key = '-' if profile['key'] is None else str(profile['key'])[:8]
+        stages = [profile['stages'].get(name, [0.0, 0])[0] for name in names]
+        peakMB = ('-' if profile['peakMB'] is None
+                  else '{:.1f}'.format(profile['peakMB']))
+        print(('{:<8s} {:10,d} {:12,d} {:10,d} {:12,d} {:8.3f}' +
+               ' {:10.3f}' * len(names) + ' {:>8s}').format(
+              *([key, profile['rowsIn'], profile['bytesIn'], profile['rowsOut'],
+                 profile['bytesOut'], profile['wall']] + stages + [peakMB])),
+              file=out)
+
+    rowsIn = sum(profile['rowsIn'] for profile in profiles)
+    rowsPerSecond = [profile['rowsIn'] / profile['wall'] for profile in profiles
+                     if profile['wall'] > 0 and profile['rowsIn']]
+    print(file=out)
+    print('Total: {:,} rows in, {:,} rows out; rows/s per process min {:,.0f}, '
+          'max {:,.0f}'.format(rowsIn, sum(profile['rowsOut'] for profile in profiles),
+                               min(rowsPerSecond) if rowsPerSecond else 0.0,
+                               max(rowsPerSecond) if rowsPerSecond else 0.0),
+          file=out)
+
+
+def read_profiles(paths):
+    """Return the process profiles in some files, or in standard input."""
+    if not paths:
+        return stoProfile.parse_lines(sys.stdin)
+    profiles = []
+    for path in paths:
+        with open(path, errors='replace') as fIn:
+            profiles += stoProfile.parse_lines(fIn)
+    return profiles
+
+
+def main():
+    profiles = read_profiles(sys.argv[1:])
+    if not profiles:
+        sys.exit('No STO_PROFILE lines found; enable profiling with '
+                 'STO_PROFILE=1 or a "profile=true" script argument')
+    print_report(profiles)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: simSkewFit.py
+# ##############################################################################
+#
+# Local simulation of the micromodel training job of stoRFFitMM.py with a
+# skewed state_code distribution, where the "OTHER" bucket is much larger than
+# the other states. Two layouts of the job are compared:
+#   - one partition per state_code; i.e., one AMP fits each whole forest.
+#   - the sub-forest mode, where each state with more than rowsPerPart rows is
+#     split into hash sub-partitions on cust_id that fit a share of the trees
+#     each, and the sub-forests are merged with stoModelBundle afterwards.
+# Each partition is fed as SCRIPT operator text through its own script process,
+# as on an AMP. Since every partition runs on a different AMP in the Database,
+# the wall time of the job is the time of its slowest partition.
+# The merged models are checked to have the full number of trees, the models
+# of unsplit states to be identical to the ones of the one-AMP-per-state job,
+# and the merged models to score a hold-out sample like the whole forests do.
+#
+# Usage: python simSkewFit.py [nRows [rowsPerPart]]
+#        (default: 20,000 rows, and the mean state partition size)
+#
+################################################################################
+
+import math
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import benchUtils
+import stoModelBundle
+import stoParse
+
+
+def fit_partitions(workDir, partitions, schema, args):
+    """Run stoRFFitMM.py on each partition; return its outputs and times."""
+    outPath = os.path.join(workDir, 'fit.out')
+    rows, times = [], {}
+    for key, part in sorted(partitions.items()):
+        with open(outPath, 'wb') as fOut:
+            rc, times[key], _ = benchUtils.run_script(
+                workDir, 'stoRFFitMM.py', args,
+                feed=[benchUtils.engine_text(part, schema)], stdout=fOut)
+        if rc != 0:
+            sys.exit('stoRFFitMM.py failed for partition {}'.format(key))
+        with open(outPath) as fIn:
+            rows += [line.split(',', 1) for line in fIn.read().splitlines()]
+    return pd.DataFrame(rows, columns=['State_Code', 'Model']), times
+
+
+def load_models(models):
+    return {str(code).strip(): stoModelBundle.pickle.loads(
+                stoModelBundle.decode_clob_model(text))
+            for code, text in zip(models['State_Code'], models['Model'])}
+
+
+def main():
+    nRows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    ads = benchUtils.synthetic_ads(nRows)
+    counts = ads['state_code'].value_counts()
+    rowsPerPart = (int(sys.argv[2]) if len(sys.argv) > 2
+                   else int(math.ceil(nRows / float(len(counts)))))
+    print('Synthetic ADS partitions: ' + ', '.join(
+          '{} {:,}'.format(code, n) for code, n in counts.items()))
+
+    # Assign the sub-partitions like the notebook does in the Database.
+    subParts = ads['state_code'].map(
+        lambda code: int(math.ceil(counts[code] / float(rowsPerPart))))
+    subAds = ads.assign(sub_part=ads['cust_id'] % subParts, sub_parts=subParts)
+    subSchema = stoParse.adsSchema + stoParse.subPartSchema
+    print('Sub-partitions of at most ~{:,} rows: '.format(rowsPerPart) + ', '.join(
+          '{} {}'.format(code, n) for code, n
+          in subAds.groupby('state_code')['sub_parts'].first().items() if n > 1))
+
+    with tempfile.TemporaryDirectory() as workDir:
+        benchUtils.make_sandbox(workDir, benchUtils.fit_sandbox_model(1))
+        wholeModels, wholeTimes = fit_partitions(
+            workDir, dict(list(ads.groupby('state_code'))),
+            stoParse.adsSchema, [])
+        subModels, subTimes = fit_partitions(
+            workDir, dict(list(subAds.groupby(['state_code', 'sub_part']))),
+            subSchema, ['subforest=true'])
+    with benchUtils.Timer() as tMerge:
+        mergedModels = stoModelBundle.merge_subforests(subModels)
+
+    print('Training job time (s):')
+    print('  {:<28s} {:>9s} {:>9s} {:>6s}'.format('layout', 'wall', 'total', 'AMPs'))
+    for label, times, extra in [('one AMP per state', wholeTimes, 0.0),
+                                ('sub-forests + merge', subTimes, tMerge.elapsed)]:
+        print('  {:<28s} {:9.2f} {:9.2f} {:6d}'.format(
+              label, max(times.values()) + extra, sum(times.values()) + extra,
+              len(times)))
+    print('  merge of the sub-forests: {:.2f} s'.format(tMerge.elapsed))
+    print('  speed-up of the job: {:.2f}x'.format(
+          max(wholeTimes.values()) / (max(subTimes.values()) + tMerge.elapsed)))
+
+    # Check the merged models against the ones of the whole partitions.
+    whole, merged = load_models(wholeModels), load_models(mergedModels)
+    if sorted(whole) != sorted(merged):
+        sys.exit('FAIL: the merged models are for states {}'.format(sorted(merged)))
+    holdOut = benchUtils.synthetic_ads(5000, seed=1)
+    failed = False
+    print('Agreement of the predictions on a hold-out sample:')
+    for code in sorted(whole):
+        nSub = int(subAds.loc[subAds['state_code'] == code, 'sub_parts'].iloc[0])
+        if merged[code].n_estimators != 500 or len(merged[code].estimators_) != 500:
+            print('  FAIL: {} merged model has {} trees'.format(
+                  code, len(merged[code].estimators_)))
+            failed = True
+        X = holdOut[benchUtils.predictor_columns]
+        agreement = np.mean(whole[code].predict(X) == merged[code].predict(X))
+        print('  {:<6s} {:2d} sub-forest(s) {:8.2%}'.format(code, nSub, agreement))
+        if nSub == 1:
+            same = (stoModelBundle.pickle.dumps(whole[code]) ==
+                    stoModelBundle.pickle.dumps(merged[code]))
+            if not same:
+                print('  FAIL: the unsplit {} model differs'.format(code))
+                failed = True
+        elif agreement < 0.9:
+            print('  FAIL: {} merged model disagrees with the whole forest'.format(code))
+            failed = True
+    if failed:
+        sys.exit(1)
+    print('PASS: merged models have 500 trees and match the whole-partition models')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Benchmarks
+# ------------------------------------------------------------------------------
+# File: stoEmulator.py
+# ##############################################################################
+#
+# Local stand-in for the Advanced SQL Engine side of the SCRIPT table operator,
+# to run and time the stoRF*.py scripts on several simulated AMPs without a
+# Vantage system.
+#
+# The rows of an input CSV file are distributed across N AMPs either
+#   - by the hash of a column (default: cust_id), like the rows of a table are
+#     spread by their primary index; one script process runs per AMP; or
+#   - by partitions of a column (--partition-by, like data_partition_column);
+#     the partitions are assigned to AMPs by hash, and each AMP runs one
+#     script process per partition after the other.
+# Numeric float columns are sent in the text format of the Database, e.g.
+# 1.0575400000000E 004. All AMPs run in parallel. The stdout of the processes
+# is collected, and the rows, time to first output, elapsed time, throughput
+# and peak RSS of each AMP are reported together with the totals of the job.
+#
+# The scripts run from a temporary folder that mirrors the Database layout:
+# all Inputs/*.py files are installed in it, together with the files given
+# with --install. If they are not given, RFmodel_py.out is fitted on the
+# sandbox data, and the model bundle of stoRFScoreMM.py is trained with
+# stoRFFitMM.py on the sandbox data.
+#
+# With --profile, the scripts run with profiling enabled (see stoProfile.py),
+# the standard error of each AMP is kept, and the per-stage profiles of all
+# script processes are aggregated with profileReport.py, to show the skew of
+# each stage across the AMPs.
+#
+# Usage: python stoEmulator.py <script> [options] [-- script arguments]
+# Examples:
+#   python stoEmulator.py stoRFScore.py --amps 8 --rows 1000000
+#   python stoEmulator.py stoRFScoreMM.py --amps 4 --partition-by state_code \
+#       --rows 200000 --output mm.out -- engine=flat
+#   python stoEmulator.py stoRFFitMM.py --partition-by state_code --rows 20000
+#   python stoEmulator.py stoRFScore.py --amps 8 --rows 1000000 --profile
+#
+################################################################################
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import benchUtils
+import profileReport
+import stoProfile
+
+
+def csv_schema(df):
+    """Return the SCRIPT operator input schema of the columns of a DataFrame."""
+    schema = []
+    for name, dtype in df.dtypes.items():
+        if pd.api.types.is_float_dtype(dtype):
+            schema.append((name, 'float'))
+        elif pd.api.types.is_integer_dtype(dtype):
+            schema.append((name, 'int'))
+        else:
+            schema.append((name, 'str'))
+    return schema
+
+
+def amp_of(values, nAmps):
+    """Map values to AMP numbers with a stable hash, the same on every run."""
+    return np.array([zlib.crc32(str(v).encode()) % nAmps for v in values])
+
+
+def distribute(df, nAmps, hashBy=None, partitionBy=None):
+    """Return the work of each AMP as a list of lists of DataFrames.
+
+    Each DataFrame is the input of one script process. Rows keep their order
+    of the input file within a process.
+    """
+    work = [[] for _ in range(nAmps)]
+    if partitionBy is None:
+        amps = amp_of(df[hashBy], nAmps)
+        for amp in range(nAmps):
+            part = df[amps == amp]
+            # Every AMP runs the script, even when it gets no rows.
+            work[amp].append(part)
+    else:
+        for key, part in df.groupby(partitionBy, sort=True):
+            work[amp_of([key], nAmps)[0]].append(part)
+    return work
+
+
+class AmpRun(object):
+    """Runs the script processes of one AMP one after the other."""
+
+    def __init__(self, amp, workDir, command, parts, schema, delimiter,
+                 env=None, keepStderr=False):
+        self.amp = amp
+        self.workDir = workDir
+        self.command = command
+        self.env = env
+        self.parts = parts
+        self.texts = [benchUtils.engine_text(part, schema, delimiter)
+                      for part in parts]
+        self.rowsIn = sum(len(part) for part in parts)
+        self.outPath = os.path.join(workDir, 'amp{:03d}.out'.format(amp))
+        self.errPath = (os.path.join(workDir, 'amp{:03d}.err'.format(amp))
+                        if keepStderr else None)
+        self.rowsOut = 0
+        self.firstOutput = None
+        self.elapsed = 0.0
+        self.peakMB = 0.0
+        self.failed = []
+
+    def _collect(self, stream, fOut, start):
+        """Copy the output of a process into the AMP output file."""
+        for block in iter(lambda: stream.read1(1 << 16), b''):
+            if self.firstOutput is None:
+                self.firstOutput = time.perf_counter() - start
+            fOut.write(block)
+            self.rowsOut += block.count(b'\n')
+
+    def run(self, start):
+        fErr = open(self.errPath, 'wb') if self.errPath else None
+        with open(self.outPath, 'wb') as fOut:
+            for text in self.texts:
+                proc = subprocess.Popen(self.command, cwd=self.workDir,
+                                        env=self.env, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=fErr)
+                reader = threading.Thread(target=self._collect,
+                                          args=(proc.stdout, fOut, start))
+                reader.start()
+                try:
+                    proc.stdin.write(text)
+                except BrokenPipeError:
+                    pass
+                proc.stdin.close()
+                reader.join()
+                # Use os.wait4() to get the resource usage of this very process.
+                _, status, usage = os.wait4(proc.pid, 0)
+                proc.returncode = (os.WEXITSTATUS(status) if os.WIFEXITED(status)
+                                   else -os.WTERMSIG(status))
+                self.peakMB = max(self.peakMB, usage.ru_maxrss / 1024.0)
+                if proc.returncode != 0:
+                    self.failed.append(proc.returncode)
+        self.elapsed = time.perf_counter() - start
+        if fErr is not None:
+            fErr.close()
+
+
+def run_amps(workDir, command, work, schema, delimiter=',', env=None,
+             keepStderr=False):
+    """Run the work of all AMPs in parallel; return the AmpRun objects and
+    the wall time of the job."""
+    runs = [AmpRun(amp, workDir, command, parts, schema, delimiter, env,
+                   keepStderr) for amp, parts in enumerate(work)]
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run.run, args=(start,)) for run in runs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return runs, time.perf_counter() - start
+
+
+def install_files(workDir, scriptName, installs):
+    """Lay out the script folder, with the model files the script needs."""
+    installed = set(os.path.basename(path) for path in installs)
+    # Only stoRFScore.py needs the full sandbox model in RFmodel_py.out; a
+    # single tree is enough as a placeholder for the other scripts.
+    classifier = None
+    if scriptName != 'stoRFScore.py' or 'RFmodel_py.out' in installed:
+        classifier = benchUtils.fit_sandbox_model(1)
+    uifPath = benchUtils.make_sandbox(workDir, classifier)
+    for path in installs:
+        shutil.copy(path, uifPath)
+    if scriptName == 'stoRFScoreMM.py' and 'multipleModels_py.bundle' not in installed:
+        print('Training the per-state models on the sandbox data...')
+        benchUtils.make_multiple_models(workDir)
+    return uifPath
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a SCRIPT operator script on simulated AMPs.')
+    parser.add_argument('script', help='script file name in the Inputs folder')
+    parser.add_argument('--amps', type=int, default=4,
+                        help='number of simulated AMPs (default: 4)')
+    parser.add_argument('--data', default=benchUtils.sandboxDataFile,
+                        help='input CSV file with a header row '
+                             '(default: the sandbox test data)')
+    parser.add_argument('--rows', type=int, default=0,
+                        help='instead of --data, use this many rows of a '
+                             'synthetic ADS with a skewed state_code')
+    parser.add_argument('--hash-by', default='cust_id',
+                        help='column that spreads the rows across the AMPs '
+                             '(default: cust_id)')
+    parser.add_argument('--partition-by', default=None,
+                        help='partition column; one script process runs per '
+                             'partition')
+    parser.add_argument('--install', action='append', default=[],
+                        help='file to install next to the scripts; repeatable')
+    parser.add_argument('--output', default=None,
+                        help='file to save the output of all AMPs, in AMP order')
+    parser.add_argument('--delimiter', default=',')
+    parser.add_argument('--profile', action='store_true',
+                        help='profile the script stages, and report them '
+                             'across the AMPs')
+    argv = sys.argv[1:]
+    scriptArgs = []
+    if '--' in argv:
+        argv, scriptArgs = argv[:argv.index('--')], argv[argv.index('--') + 1:]
+    args = parser.parse_args(argv)
+
+    if args.rows > 0:
+        df = benchUtils.synthetic_ads(args.rows)
+    else:
+        df = pd.read_csv(args.data)
+    schema = csv_schema(df)
+    work = distribute(df, args.amps, args.hash_by, args.partition_by)
+    print('Input: {:,} rows to {} AMPs, {} script process(es)'.format(
+          len(df), args.amps, sum(len(parts) for parts in work)))
+
+    with tempfile.TemporaryDirectory() as workDir:
+        install_files(workDir, args.script, args.install)
+        command = [sys.executable,
+                   os.path.join('.', benchUtils.uifFolder, args.script)] + scriptArgs
+        env = None
+        if args.profile:
+            env = dict(os.environ, STO_PROFILE='1')
+        runs, wall = run_amps(workDir, command, work, schema, args.delimiter,
+                              env, keepStderr=args.profile)
+
+        if args.output:
+            with open(args.output, 'wb') as fOut:
+                for run in runs:
+                    with open(run.outPath, 'rb') as fIn:
+                        shutil.copyfileobj(fIn, fOut)
+
+        profiles = []
+        for run in runs:
+            if run.errPath:
+                with open(run.errPath, errors='replace') as fIn:
+                    lines = fIn.readlines()
+                # Pass any other messages of the scripts on to stderr.
+                sys.stderr.writelines(line for line in lines
+                                      if not line.startswith(stoProfile.linePrefix))
+                profiles += [dict(profile, amp=run.amp)
+                             for profile in stoProfile.parse_lines(lines)]
+
+    print('{:>4s} {:>6s} {:>10s} {:>10s} {:>9s} {:>9s} {:>12s} {:>9s}'.format(
+          'AMP', 'procs', 'rows in', 'rows out', 'first s', 'total s',
+          'rows/s', 'peak MB'))
+    for run in runs:
+        print('{:4d} {:6d} {:10,d} {:10,d} {:>9s} {:9.3f} {:12,.0f} {:9.1f}'.format(
+              run.amp, len(run.parts), run.rowsIn, run.rowsOut,
+              '-' if run.firstOutput is None else '{:.3f}'.format(run.firstOutput),
+              run.elapsed, run.rowsIn / run.elapsed if run.elapsed else 0.0,
+              run.peakMB))
+    print('Job: {:,} rows in, {:,} rows out in {:.3f} s; {:,.0f} rows/s; '
+          'slowest AMP {:.3f} s; peak RSS max {:.1f} MB, sum {:.1f} MB'.format(
+          len(df), sum(run.rowsOut for run in runs), wall, len(df) / wall,
+          max(run.elapsed for run in runs), max(run.peakMB for run in runs),
+          sum(run.peakMB for run in runs)))
+
+    if profiles:
+        print()
+        profileReport.print_report(profiles)
+
+    failed = [run.amp for run in runs if run.failed]
+    if failed:
+        sys.exit('FAIL: the script failed on AMP(s) {}'.format(failed))
+
+
+if __name__ == '__main__':
+    main()
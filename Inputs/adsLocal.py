@@ -0,0 +1,253 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 2 - Demo
+# ------------------------------------------------------------------------------
+# File: adsLocal.py
+# ##############################################################################
+#
+# The present file is a client-side tool for the Part 2
+# "TBv2_Py-2-Explore-Transform-ADS.ipynb" notebook in this Using Python with
+# Vantage TechByte.
+#
+# The tool builds the Analytic Data Set (ADS) of the TechBytes offline, from
+# the raw Customer, Accounts and Transactions data files of Inputs/Data,
+# without a Vantage system; e.g., for backfills and what-if runs. It performs
+# the transformations of the notebook: the one-hot encoding of the gender,
+# marital status, state and account type, the median fillna of the balances,
+# the quarter of every transaction from its tran_date, the left joins of the
+# customers with their accounts and transactions, and the roll up by cust_id
+# with max/mean/sum, followed by the dropna() of the notebook.
+#
+# Instead of joining the tables row by row, the tool works on typed NumPy
+# arrays: the transactions are read in chunks, and every chunk is reduced to
+# per-account partial sums with np.bincount(); the joins are then index
+# lookups of the accounts into the customers, and the means of the rolled-up
+# joined rows are computed from the per-account sums and row counts. Only
+# the per-account sums stay in memory, so transaction files that are larger
+# than memory can be processed.
+#
+# Usage: python adsLocal.py <customer> <accounts> <transactions> <output>
+#                           [--chunk-rows N]
+# Example:
+#   python adsLocal.py Data/Customer.csv Data/Accounts.csv \
+#       Data/Transactions.csv.zip ads.csv
+#
+################################################################################
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import stoSchema
+
+# The states with an indicator column of their own in the ADS; all other
+# states are classified jointly as "OTHER".
+topStates = ['CA', 'NY', 'TX', 'IL', 'AZ', 'OH']
+
+accountTypes = ['CC', 'CK', 'SV']
+
+# Columns of the transactions that the ADS needs, and their types.
+transactionTypes = {'acct_nbr': str, 'principal_amt': np.float64,
+                    'interest_amt': np.float64, 'tran_date': str}
+
+###
+### Input files
+###
+
+def read_customer(path):
+    return pd.read_csv(path, dtype={'cust_id': np.int64, 'gender': str,
+                                    'marital_status': str, 'postal_code': str,
+                                    'state_code': str})
+
+
+def read_accounts(path):
+    return pd.read_csv(path, dtype={'acct_nbr': str, 'cust_id': np.int64,
+                                    'acct_type': str})
+
+
+def read_transactions(path, chunkRows=1000000):
+    """Yield the transactions of a CSV file (or a zip of one) in chunks."""
+    for chunk in pd.read_csv(path, usecols=list(transactionTypes),
+                             dtype=transactionTypes, chunksize=chunkRows):
+        yield chunk
+
+
+def date_months(dates):
+    """Return the months of dates in 'YYYY-MM-DD' or 'YY/MM/DD' format.
+
+    Every distinct date of a chunk is parsed once.
+    """
+    codes, uniques = pd.factorize(pd.Series(dates))
+    months = pd.Series(uniques).str.extract(r'^\s*\d+[-/](\d+)', expand=False)
+    months = pd.to_numeric(months).to_numpy(dtype=np.float64)
+    return np.where(codes >= 0, months[np.maximum(codes, 0)], np.nan)
+
+###
+### Per-account partial sums of the transactions
+###
+
+class TransactionSums(object):
+    """Per-account sums of the transactions, accumulated chunk by chunk.
+
+    accountIds : the acct_nbr values of the accounts; transactions of other
+                 accounts are dropped, as by the left join from the accounts.
+    """
+
+    def __init__(self, accountIds):
+        self.index = pd.Index(accountIds)
+        n = len(self.index)
+        self.rows = np.zeros(n, dtype=np.int64)          # transactions
+        self.amountRows = np.zeros(n, dtype=np.int64)    # non-NULL amounts
+        self.amount = np.zeros(n, dtype=np.float64)      # sum of amounts
+        self.quarters = np.zeros((4, n), dtype=np.int64)  # per quarter
+
+    def add(self, chunk):
+        """Add the transactions of a chunk (a DataFrame) to the sums."""
+        positions = self.index.get_indexer(chunk['acct_nbr'].to_numpy())
+        keep = positions >= 0
+        positions = positions[keep]
+        n = len(self.index)
+        amount = (chunk['principal_amt'].to_numpy(dtype=np.float64) +
+                  chunk['interest_amt'].to_numpy(dtype=np.float64))[keep]
+        known = ~np.isnan(amount)
+        self.rows += np.bincount(positions, minlength=n)
+        self.amountRows += np.bincount(positions[known], minlength=n)
+        self.amount += np.bincount(positions[known], weights=amount[known],
+                                   minlength=n)
+        months = date_months(chunk['tran_date'].to_numpy())[keep]
+        quarters = (months - 1) // 3
+        for q in range(4):
+            self.quarters[q] += np.bincount(positions[quarters == q], minlength=n)
+        return self
+
+###
+### ADS build
+###
+
+def build_ads(customer, accounts, transactions, chunkRows=1000000):
+    """Build the ADS from the 3 source tables.
+
+    customer, accounts : DataFrames of the Customer and Accounts tables.
+    transactions       : path of the transactions file, or an iterable of
+                         DataFrame chunks of the Transactions table.
+    Returns the ADS as a DataFrame with the columns of stoSchema.ads.
+    """
+    if isinstance(transactions, str):
+        transactions = read_transactions(transactions, chunkRows)
+
+    # Accounts: type indicators, and balances with NULLs filled by the median.
+    balance = np.zeros(len(accounts), dtype=np.float64)
+    for column in ['starting_balance', 'ending_balance']:
+        values = accounts[column].to_numpy(dtype=np.float64)
+        balance += np.where(np.isnan(values), np.nanmedian(values), values)
+    acctType = accounts['acct_type'].to_numpy()
+    indicators = {t: (acctType == t).astype(np.int64) for t in accountTypes}
+
+    sums = TransactionSums(accounts['acct_nbr'].to_numpy())
+    for chunk in transactions:
+        sums.add(chunk)
+
+    # Left join of the customers with the accounts: position of the customer
+    # of every account. Customers without accounts have NULL indicators, and
+    # are dropped by dropna() in the end.
+    custIds = customer['cust_id'].to_numpy(dtype=np.int64)
+    owner = pd.Index(custIds).get_indexer(accounts['cust_id'].to_numpy())
+    keep = owner >= 0
+    owner = owner[keep]
+    nCust = len(custIds)
+
+    def per_customer(values):
+        return np.bincount(owner, weights=np.asarray(values, np.float64)[keep],
+                           minlength=nCust)
+
+    # Every account contributes as many joined rows as it has transactions,
+    # or 1 row with NULL transaction columns if it has none.
+    joinedRows = np.maximum(sums.rows, 1)
+    custRows = per_customer(joinedRows)
+    hasAccounts = per_customer(np.ones(len(accounts))) > 0
+
+    ads = {'cust_id': custIds,
+           'income': customer['income'].to_numpy(dtype=np.float64),
+           'age': customer['age'].to_numpy(),
+           'tot_cust_years': customer['years_with_bank'].to_numpy(),
+           'tot_children': customer['nbr_children'].to_numpy()}
+    gender = customer['gender'].to_numpy()
+    marital = customer['marital_status'].to_numpy()
+    state = customer['state_code'].to_numpy()
+    ads['female_ind'] = (gender == 'F').astype(np.int64)
+    for code, name in [('1', 'single'), ('2', 'married'), ('3', 'separated')]:
+        ads[name + '_ind'] = (marital == code).astype(np.int64)
+    ads['state_code'] = np.where(np.isin(state, topStates), state, 'OTHER')
+    for s in topStates:
+        ads[s.lower() + '_resident_ind'] = (state == s).astype(np.int64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for t in accountTypes:
+            prefix = t.lower()
+            ind = indicators[t]
+            # max() of the indicator over the accounts of the customer.
+            ads[prefix + '_acct_ind'] = np.where(
+                hasAccounts, per_customer(ind) > 0, np.nan)
+            # mean() of the balance over the joined rows.
+            ads[prefix + '_avg_bal'] = (per_customer(ind * balance * joinedRows) /
+                                        custRows)
+        # mean() of the transaction amounts over the joined rows: an account of
+        # the type contributes its non-NULL amounts, any other account 0 for
+        # each of its rows. As in the notebook, the sv_tran_amt of a row is
+        # taken for the checking accounts, so that the ADS is the same.
+        for prefix, t in [('cc', 'CC'), ('ck', 'CK'), ('sv', 'CK')]:
+            ind = indicators[t]
+            total = per_customer(ind * sums.amount)
+            count = per_customer(np.where(ind == 1, sums.amountRows, joinedRows))
+            ads[prefix + '_avg_tran_amt'] = np.where(count > 0, total / count,
+                                                     np.nan)
+    # sum() of the quarter indicators; NULL for customers without transactions.
+    hasTransactions = per_customer(sums.rows) > 0
+    for q in range(4):
+        ads['q{}_trans_cnt'.format(q + 1)] = np.where(
+            hasTransactions, per_customer(sums.quarters[q]), np.nan)
+
+    # dropna() of the notebook, on the arrays before they become a DataFrame.
+    valid = np.ones(len(custIds), dtype=bool)
+    for name, colType in stoSchema.ads:
+        if colType != 'str':
+            valid &= ~np.isnan(np.asarray(ads[name], dtype=np.float64))
+    types = {'int': np.int64, 'float': np.float64, 'str': object}
+    return pd.DataFrame({name: np.asarray(ads.pop(name))[valid].astype(
+                         types[colType], copy=False)
+                         for name, colType in stoSchema.ads})
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build the ADS of the TechBytes from the raw Customer, '
+                    'Accounts and Transactions data files.')
+    parser.add_argument('customer', help='Customer CSV file')
+    parser.add_argument('accounts', help='Accounts CSV file')
+    parser.add_argument('transactions', help='Transactions CSV file, or a zip '
+                                             'of it')
+    parser.add_argument('output', help='output CSV file of the ADS')
+    parser.add_argument('--chunk-rows', type=int, default=1000000,
+                        help='transactions read at a time (default: 1000000)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ads = build_ads(read_customer(args.customer), read_accounts(args.accounts),
+                    args.transactions, args.chunk_rows)
+    ads.to_csv(args.output, index=False)
+    print('Built an ADS of {:,} rows in {:.3f} s'.format(
+          len(ads), time.perf_counter() - start), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 2 - Demo
+# ------------------------------------------------------------------------------
+# File: adsPipeline.py
+# ##############################################################################
+#
+# The present file is a client-side helper module for the Part 2
+# "TBv2_Py-2-Explore-Transform-ADS.ipynb" notebook in this Using Python with
+# Vantage TechByte.
+#
+# The module builds the Analytic Data Set (ADS) of the TechBytes from the
+# Customer, Accounts and Transactions tables as a lazy pipeline of SQL
+# queries, the way teradataml DataFrames work: every transformation step of
+# the notebook (cust, acct, trans, cust_acct, cust_acct_tran) is a Relation
+# that only holds its SQL, and nothing runs in the Database until rows are
+# asked for. The ADS is then created in the Database with a single statement,
+# in which the final aggregation by customer runs in one pass over the joined
+# rows, without any round trip of the intermediate results to the client.
+# Steps are inspected with head(), which transfers only the rows shown, and
+# histograms are computed from per-bin partial counts that the Database
+# aggregates and the client streams in batches, instead of from a transfer of
+# the whole column.
+#
+# The pipeline works with any Python DB-API connection; e.g., a teradatasql
+# connection to Vantage ("teradata" dialect), or a sqlite3 connection to a
+# local stand-in of the tables ("sqlite" dialect). It counts the queries, rows
+# and bytes that it transfers to the client.
+#
+# Example:
+#   import sqlite3, adsPipeline
+#   pipeline = adsPipeline.AdsPipeline(sqlite3.connect('demo.db'), 'sqlite')
+#   pipeline.cust_acct_tran().head(5)
+#   pipeline.materialize(pipeline.ads(), 'ak_TBv2_ADS_Py')
+#   counts, edges = pipeline.histogram(pipeline.customer(), 'income', 10000)
+#
+################################################################################
+
+import numpy as np
+import pandas as pd
+
+import stoSchema
+
+# The states with an indicator column of their own in the ADS; all other
+# states are classified jointly as "OTHER".
+topStates = ['CA', 'NY', 'TX', 'IL', 'AZ', 'OH']
+
+dialects = ('teradata', 'sqlite')
+
+
+class Relation(object):
+    """A lazy SQL query of the pipeline; nothing runs until rows are fetched."""
+
+    def __init__(self, pipeline, name, sql):
+        self.pipeline = pipeline
+        self.name = name
+        self.sql = sql
+
+    def __repr__(self):
+        return '<Relation {}>'.format(self.name)
+
+    def head(self, n=5):
+        """Return the first n rows as a pandas DataFrame; only they move."""
+        return self.pipeline.to_pandas(self.pipeline.limit_sql(self.sql, n))
+
+    def to_pandas(self):
+        """Return all rows as a pandas DataFrame; the whole result moves."""
+        return self.pipeline.to_pandas(self.sql)
+
+    def count(self):
+        """Return the number of rows, counted in the Database."""
+        return self.pipeline.scalar('SELECT COUNT(*) FROM ({}) t'.format(self.sql))
+
+
+class AdsPipeline(object):
+    """Lazy SQL pipeline of the ADS transformations of the Part 2 notebook.
+
+    connection : DB-API connection to the Database.
+    dialect    : 'teradata' or 'sqlite'; the SQL differs in a few functions.
+    The names of the 3 source tables can be given with their database name.
+    """
+
+    def __init__(self, connection, dialect='teradata', customer='Customer',
+                 accounts='Accounts', transactions='Transactions',
+                 batchRows=10000):
+        if dialect not in dialects:
+            raise ValueError("Unknown dialect '{}'; use one of {}".format(
+                             dialect, dialects))
+        self.connection = connection
+        self.dialect = dialect
+        self.tables = {'customer': customer, 'accounts': accounts,
+                       'transactions': transactions}
+        self.batchRows = batchRows
+        self.transfer = {'queries': 0, 'rows': 0, 'bytes': 0}
+        self._relations = {}
+
+    ###
+    ### Database access
+    ###
+
+    def _batches(self, sql):
+        """Run a query, and yield its rows in batches of up to batchRows.
+
+        The rows and bytes of the result are counted as they arrive; the bytes
+        are the lengths of the values in text form plus a delimiter each.
+        """
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(sql)
+            self.transfer['queries'] += 1
+            self.columns = ([d[0].lower() for d in cursor.description]
+                            if cursor.description else [])
+            while True:
+                rows = cursor.fetchmany(self.batchRows)
+                if not rows:
+                    return
+                self.transfer['rows'] += len(rows)
+                self.transfer['bytes'] += sum(len(str(value)) + 1 for row in rows
+                                              for value in row)
+                yield rows
+        finally:
+            cursor.close()
+
+    def execute(self, sql):
+        """Run a statement that returns no rows to the client."""
+        for _ in self._batches(sql):
+            pass
+
+    def scalar(self, sql):
+        """Return the single value of a one-row query."""
+        rows = [row for batch in self._batches(sql) for row in batch]
+        return rows[0][0] if rows else None
+
+    def to_pandas(self, sql):
+        """Return the rows of a query as a pandas DataFrame."""
+        rows = [row for batch in self._batches(sql) for row in batch]
+        return pd.DataFrame.from_records(rows, columns=self.columns)
+
+    def limit_sql(self, sql, n):
+        if self.dialect == 'teradata':
+            return 'SELECT TOP {} * FROM ({}) t'.format(int(n), sql)
+        return 'SELECT * FROM ({}) t LIMIT {}'.format(sql, int(n))
+
+    def materialize(self, relation, tableName, replace=True):
+        """Create a table from a relation in the Database; no rows move."""
+        if replace:
+            try:
+                self.execute('DROP TABLE {}'.format(tableName))
+            except Exception:
+                pass
+        if self.dialect == 'teradata':
+            self.execute('CREATE TABLE {} AS ({}) WITH DATA'.format(
+                         tableName, relation.sql))
+        else:
+            self.execute('CREATE TABLE {} AS {}'.format(tableName, relation.sql))
+        if hasattr(self.connection, 'commit'):
+            self.connection.commit()
+        return Relation(self, tableName, 'SELECT * FROM {}'.format(tableName))
+
+    def _median_sql(self, table, column):
+        """Return a scalar subquery of the median of a column."""
+        if self.dialect == 'teradata':
+            return '(SELECT MEDIAN({0}) FROM {1})'.format(column, table)
+        # The mean of the 1 or 2 middle values of the non-NULL values.
+        return ('(SELECT AVG({0}) FROM (SELECT {0} FROM {1} WHERE {0} IS NOT NULL '
+                'ORDER BY {0} LIMIT 2 - (SELECT COUNT({0}) FROM {1}) % 2 '
+                'OFFSET ((SELECT COUNT({0}) FROM {1}) - 1) / 2) m)'.format(
+                column, table))
+
+    def _month_sql(self, column):
+        if self.dialect == 'teradata':
+            return 'EXTRACT(MONTH FROM {})'.format(column)
+        return "CAST(strftime('%m', {}) AS INTEGER)".format(column)
+
+    def _relation(self, name, build):
+        """Return the cached relation of a step, building its SQL once."""
+        if name not in self._relations:
+            self._relations[name] = Relation(self, name, build())
+        return self._relations[name]
+
+    ###
+    ### Transformation steps of the Part 2 notebook
+    ###
+
+    def customer(self):
+        return self._relation('customer', lambda: 'SELECT * FROM {}'.format(
+                              self.tables['customer']))
+
+    def cust(self):
+        """Customer demographics with gender, marital status and state indicators."""
+        def build():
+            columns = ['cust_id', 'income', 'age',
+                       'years_with_bank AS tot_cust_years',
+                       'nbr_children AS tot_children',
+                       "CASE WHEN gender = 'M' THEN 1 ELSE 0 END AS male_ind",
+                       "CASE WHEN gender = 'F' THEN 1 ELSE 0 END AS female_ind",
+                       "CASE WHEN marital_status = '1' THEN 1 ELSE 0 END AS single_ind",
+                       "CASE WHEN marital_status = '2' THEN 1 ELSE 0 END AS married_ind",
+                       "CASE WHEN marital_status = '3' THEN 1 ELSE 0 END AS separated_ind",
+                       'CASE ' + ' '.join("WHEN state_code = '{0}' THEN '{0}'".format(s)
+                                          for s in topStates) +
+                       " ELSE 'OTHER' END AS state_code"]
+            columns += ["CASE WHEN state_code = '{}' THEN 1 ELSE 0 END AS {}_resident_ind"
+                        .format(s, s.lower()) for s in topStates]
+            return 'SELECT {} FROM {}'.format(', '.join(columns),
+                                              self.tables['customer'])
+        return self._relation('cust', build)
+
+    def acct(self):
+        """Accounts with type indicators, and balances by type; NULL balances
+        are filled with the median balance."""
+        def build():
+            table = self.tables['accounts']
+            start = 'COALESCE(starting_balance, {})'.format(
+                    self._median_sql(table, 'starting_balance'))
+            end = 'COALESCE(ending_balance, {})'.format(
+                  self._median_sql(table, 'ending_balance'))
+            columns = ['acct_nbr', 'cust_id', 'acct_type',
+                       '{} AS starting_balance'.format(start),
+                       '{} AS ending_balance'.format(end)]
+            for accountType in ['CC', 'CK', 'SV']:
+                prefix = accountType.lower()
+                columns += ["CASE WHEN acct_type = '{}' THEN 1 ELSE 0 END AS "
+                            "{}_acct_ind".format(accountType, prefix),
+                            "CASE WHEN acct_type = '{}' THEN {} + {} ELSE 0 END AS "
+                            "{}_bal".format(accountType, start, end, prefix)]
+            return 'SELECT {} FROM {}'.format(', '.join(columns), table)
+        return self._relation('acct', build)
+
+    def trans(self):
+        """Transactions with indicators of the quarter they were made in."""
+        def build():
+            month = self._month_sql('tran_date')
+            columns = ['acct_nbr', 'principal_amt', 'interest_amt']
+            columns += ['CASE WHEN {0} BETWEEN {1} AND {2} THEN 1 ELSE 0 END AS '
+                        'q{3}_trans'.format(month, 3 * q - 2, 3 * q, q)
+                        for q in range(1, 5)]
+            return 'SELECT {} FROM {}'.format(', '.join(columns),
+                                              self.tables['transactions'])
+        return self._relation('trans', build)
+
+    def cust_acct(self):
+        """Customers left-joined to their accounts."""
+        def build():
+            return ('SELECT c.*, a.acct_nbr, a.acct_type, a.starting_balance, '
+                    'a.ending_balance, a.cc_acct_ind, a.cc_bal, a.ck_acct_ind, '
+                    'a.ck_bal, a.sv_acct_ind, a.sv_bal FROM ({}) c LEFT JOIN '
+                    '({}) a ON c.cust_id = a.cust_id'.format(self.cust().sql,
+                                                             self.acct().sql))
+        return self._relation('cust_acct', build)
+
+    def cust_acct_tran(self):
+        """Customer accounts left-joined to their transactions, with the
+        transaction amounts by account type."""
+        def build():
+            amount = 't.principal_amt + t.interest_amt'
+            # As in the notebook, the sv_tran_amt of a row is taken for the
+            # checking accounts (ck_acct_ind), so that the ADS is the same.
+            return ('SELECT ca.*, t.principal_amt, t.interest_amt, t.q1_trans, '
+                    't.q2_trans, t.q3_trans, t.q4_trans, '
+                    'CASE WHEN ca.cc_acct_ind = 1 THEN {0} ELSE 0 END AS cc_tran_amt, '
+                    'CASE WHEN ca.ck_acct_ind = 1 THEN {0} ELSE 0 END AS ck_tran_amt, '
+                    'CASE WHEN ca.ck_acct_ind = 1 THEN {0} ELSE 0 END AS sv_tran_amt '
+                    'FROM ({1}) ca LEFT JOIN ({2}) t ON ca.acct_nbr = t.acct_nbr'
+                    .format(amount, self.cust_acct().sql, self.trans().sql))
+        return self._relation('cust_acct_tran', build)
+
+    def ads(self):
+        """The ADS: one row per customer, rolled up in a single aggregation."""
+        def build():
+            aggregates = {'ck_avg_bal': 'AVG(ck_bal)', 'sv_avg_bal': 'AVG(sv_bal)',
+                          'cc_avg_bal': 'AVG(cc_bal)',
+                          'ck_avg_tran_amt': 'AVG(ck_tran_amt)',
+                          'sv_avg_tran_amt': 'AVG(sv_tran_amt)',
+                          'cc_avg_tran_amt': 'AVG(cc_tran_amt)'}
+            aggregates.update({'q{}_trans_cnt'.format(q): 'SUM(q{}_trans)'.format(q)
+                               for q in range(1, 5)})
+            columns = []
+            for name in stoSchema.ads.names:
+                if name == 'cust_id':
+                    columns.append('cust_id')
+                else:
+                    columns.append('{} AS {}'.format(
+                                   aggregates.get(name, 'MAX({})'.format(name)), name))
+            # As with dropna() in the notebook, customers with any NULL value
+            # (e.g., without accounts or transactions) are left out.
+            return ('SELECT * FROM (SELECT {} FROM ({}) cat GROUP BY cust_id) r '
+                    'WHERE {}'.format(', '.join(columns), self.cust_acct_tran().sql,
+                                      ' AND '.join('{} IS NOT NULL'.format(name)
+                                                   for name in stoSchema.ads.names)))
+        return self._relation('ads', build)
+
+    ###
+    ### Aggregates for plots
+    ###
+
+    def histogram(self, relation, column, width, start=0, stop=None):
+        """Return the counts and bin edges of a histogram of a column.
+
+        The bins are those of np.histogram(values, bins=range(start, stop,
+        width)) on the non-NULL values of the column; by default, stop is the
+        rounded maximum of the column, as in the notebook. Each bin is counted
+        in the Database, and the client adds up the per-bin counts as they
+        stream in, so that only one row per bin moves to the client.
+        """
+        source = '({}) h'.format(relation.sql)
+        if stop is None:
+            stop = int(round(float(self.scalar('SELECT MAX({}) FROM {}'.format(
+                                                column, source)))))
+        edges = np.arange(start, stop, width)
+        counts = np.zeros(max(len(edges) - 1, 0), dtype=np.int64)
+        if len(counts) == 0:
+            return counts, edges
+        last = edges[-1]
+        # The last bin is closed on the right, as with np.histogram().
+        binSql = ('CASE WHEN {0} = {1} THEN {2} ELSE CAST(({0} - {3}) / {4} '
+                  'AS INTEGER) END'.format(column, last, len(counts) - 1, start,
+                                           float(width)))
+        sql = ('SELECT {0} AS bin, COUNT(*) AS cnt FROM {1} WHERE {2} >= {3} AND '
+               '{2} <= {4} GROUP BY {0}'.format(binSql, source, column, start, last))
+        for rows in self._batches(sql):
+            bins, binCounts = np.array(rows, dtype=np.int64).reshape(-1, 2).T
+            np.add.at(counts, bins, binCounts)
+        return counts, edges
+
+    def value_counts(self, relation, column):
+        """Return the number of rows per value of a column, sorted by value."""
+        return self.to_pandas(
+            'SELECT {0}, COUNT(*) AS count_{0} FROM ({1}) v GROUP BY {0} '
+            'ORDER BY {0}'.format(column, relation.sql))
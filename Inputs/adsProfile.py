@@ -0,0 +1,639 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 2 - Demo
+# ------------------------------------------------------------------------------
+# File: adsProfile.py
+# ##############################################################################
+#
+# The present file is a client-side tool for the Part 2
+# "TBv2_Py-2-Explore-Transform-ADS.ipynb" notebook in this Using Python with
+# Vantage TechByte.
+#
+# The tool profiles a data table for its exploration without a Vantage system
+# and without loading the table into memory; e.g., the Customer and Accounts
+# data files of Inputs/Data. The table is read in a single pass, and every
+# column is summarized by mergeable sketches:
+#   - the count of values and NULLs, and for numeric columns the min, max,
+#     mean and variance, and the counts of zeros, positive and negative values,
+#     as the Values and Statistics functions of VAL report them;
+#   - a KLL quantile sketch of the numeric columns, for their quartiles and
+#     approximate histograms;
+#   - exact fixed-width histograms of selected numeric columns;
+#   - a HyperLogLog sketch for an estimate of the distinct values;
+#   - the frequent values of the text columns (a Misra-Gries summary), which
+#     are exact counts as long as a column has few distinct values, such as
+#     the customers per state.
+# The sketches of a table chunk are merged with the ones of other chunks, so
+# the file is split into byte ranges that are profiled in parallel by worker
+# processes, and each worker reads its range in chunks of rows. The memory of
+# the sketches does not depend on the number of rows of the table.
+#
+# A table is given either as a CSV file with a header row, whose column types
+# are inferred from its first rows, or as a fastload script of Inputs/Data,
+# whose CREATE TABLE statement declares the column types, and whose data file,
+# delimiter and first record are read from the script.
+#
+# Usage: python adsProfile.py <table> [--jobs N] [--chunk-rows N]
+#                             [--width COLUMN=WIDTH ...]
+# Example:
+#   python adsProfile.py Data/Customer.fastload --jobs 0 --width income=10000
+#
+################################################################################
+
+import argparse
+import io
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import stoParse
+import stoSchema
+
+###
+### Mergeable sketches of a column
+###
+
+class NumericSummary(object):
+    """Count, NULLs, min, max, mean and variance of a numeric column.
+
+    The partial means and sums of squared deviations of chunks are combined
+    with the pairwise formula of Chan et al., which is exact up to rounding.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.min = np.nan
+        self.max = np.nan
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.zeros = 0
+        self.positives = 0
+        self.negatives = 0
+
+    def add(self, values):
+        """Add a float array of a chunk; NaNs are NULLs."""
+        known = values[~np.isnan(values)]
+        self.nulls += len(values) - len(known)
+        if len(known):
+            other = NumericSummary()
+            other.count = len(known)
+            other.min, other.max = known.min(), known.max()
+            other.mean = known.mean()
+            other.m2 = float(((known - other.mean) ** 2).sum())
+            other.zeros = int((known == 0).sum())
+            other.positives = int((known > 0).sum())
+            other.negatives = other.count - other.zeros - other.positives
+            self._merge_values(other)
+        return self
+
+    def _merge_values(self, other):
+        if other.count == 0:
+            return
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / n
+        self.mean += delta * other.count / n
+        self.count = n
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.zeros += other.zeros
+        self.positives += other.positives
+        self.negatives += other.negatives
+
+    def merge(self, other):
+        self.nulls += other.nulls
+        self._merge_values(other)
+        return self
+
+    def variance(self, ddof=1):
+        return self.m2 / (self.count - ddof) if self.count > ddof else np.nan
+
+
+class TextSummary(object):
+    """Count and NULLs of a text column; empty fields are NULLs."""
+
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+
+    def add(self, values):
+        """Add an object array of a chunk; return its non-NULL values."""
+        known = values[(values != '') & pd.notna(values)]
+        self.count += len(known)
+        self.nulls += len(values) - len(known)
+        return known
+
+    def merge(self, other):
+        self.count += other.count
+        self.nulls += other.nulls
+        return self
+
+
+class QuantileSketch(object):
+    """KLL quantile sketch of a numeric column (Karnin, Lang and Liberty).
+
+    The values are kept in levels of compactors; an item of level h stands for
+    2^h values. A level that exceeds its capacity is sorted, and every other
+    item, from a random offset, moves up a level. The capacities shrink by 2/3
+    from the top level down, so the sketch holds O(k) items, and the rank
+    error of a quantile is about 1.7 / k of the count.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self.rng = np.random.RandomState(seed)
+
+    def capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def add(self, values):
+        """Add the non-NULL values of a float array."""
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        return self._compress()
+
+    def merge(self, other):
+        self.n += other.n
+        for h, items in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        return self._compress()
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) <= self.capacity(h):
+                h += 1
+                continue
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(items)
+            # An odd item stays behind, so that only pairs are compacted.
+            nPairs = len(items) // 2
+            kept, items = items[2 * nPairs:], items[:2 * nPairs]
+            promoted = items[self.rng.randint(2)::2]
+            self.levels[h] = kept
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            # The capacities depend on the number of levels; start over.
+            h = 0
+        return self
+
+    def _weighted(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** h)
+                                  for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        return values[order], np.cumsum(weights[order])
+
+    def quantiles(self, qs):
+        """Return the values at the quantiles qs (an array of fractions)."""
+        if self.n == 0:
+            return np.full(len(qs), np.nan)
+        values, cumWeights = self._weighted()
+        positions = np.searchsorted(cumWeights,
+                                    np.asarray(qs, dtype=np.float64) *
+                                    cumWeights[-1], side='left')
+        return values[np.minimum(positions, len(values) - 1)]
+
+    def ranks(self, points):
+        """Return the estimated counts of values less than each point."""
+        if self.n == 0:
+            return np.zeros(len(points))
+        values, cumWeights = self._weighted()
+        positions = np.searchsorted(values, points, side='left')
+        ranks = np.concatenate([[0.0], cumWeights])[positions]
+        return ranks * self.n / cumWeights[-1]
+
+    def size(self):
+        return sum(len(items) for items in self.levels)
+
+
+class DistinctSketch(object):
+    """HyperLogLog sketch of the distinct values of a column (Flajolet et al.).
+
+    Every value is hashed to 64 bits; the first p bits select one of 2^p
+    registers, which keeps the highest position of the first 1 bit of the
+    remaining bits. The relative error of the estimate is about 1.04/2^(p/2).
+    """
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, values):
+        """Add the non-NULL values of an array; equal values hash equally."""
+        hashes = pd.util.hash_array(np.asarray(values))
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # The bit length of the remaining bits (at most 52) is the exponent of
+        # their exact float64 value.
+        bitLength = np.frexp(rest.astype(np.float64))[1]
+        rank = (64 - self.p - bitLength + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = float(len(self.registers))
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(np.float64))
+        zeros = int((self.registers == 0).sum())
+        # Linear counting is more accurate for small cardinalities.
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class FrequentValues(object):
+    """Misra-Gries summary of the most frequent values of a column.
+
+    The counts are exact while the column has at most k distinct values.
+    Beyond that, the (k+1)-th largest count is subtracted from all counts and
+    the values without a positive count are dropped, so that every kept count
+    undercounts by at most the accumulated error. The summaries of chunks
+    merge by adding their counts (Agarwal et al., "Mergeable summaries").
+    """
+
+    def __init__(self, k=1000):
+        self.k = k
+        self.counts = pd.Series(dtype=np.int64)
+        self.error = 0
+
+    @property
+    def exact(self):
+        return self.error == 0
+
+    def add(self, values):
+        counts = pd.Series(values).value_counts(sort=False)
+        return self._combine(counts)
+
+    def merge(self, other):
+        self.error += other.error
+        return self._combine(other.counts)
+
+    def _combine(self, counts):
+        if len(self.counts):
+            counts = pd.concat([self.counts, counts]).groupby(level=0).sum()
+        if len(counts) > self.k:
+            cut = int(np.sort(counts.to_numpy())[::-1][self.k])
+            counts = counts[counts > cut] - cut
+            self.error += cut
+        self.counts = counts.astype(np.int64)
+        return self
+
+    def top(self, n=10):
+        """Return the n most frequent values and their counts as a Series."""
+        return self.counts.sort_values(ascending=False, kind='stable').head(n)
+
+
+class FixedHistogram(object):
+    """Exact counts of a numeric column in bins [start + i*width, + width)."""
+
+    def __init__(self, width, start=0.0):
+        self.width = float(width)
+        self.start = float(start)
+        self.counts = {}
+
+    def add(self, values):
+        values = values[~np.isnan(values)]
+        bins, counts = np.unique(np.floor((values - self.start) / self.width),
+                                 return_counts=True)
+        for b, c in zip(bins.astype(np.int64).tolist(), counts.tolist()):
+            self.counts[b] = self.counts.get(b, 0) + c
+        return self
+
+    def merge(self, other):
+        for b, c in other.counts.items():
+            self.counts[b] = self.counts.get(b, 0) + c
+        return self
+
+    def histogram(self):
+        """Return the counts and bin edges from the lowest to the highest bin,
+        like numpy.histogram()."""
+        if not self.counts:
+            return np.zeros(0, dtype=np.int64), np.array([self.start])
+        low, high = min(self.counts), max(self.counts)
+        counts = np.array([self.counts.get(b, 0) for b in range(low, high + 1)],
+                          dtype=np.int64)
+        edges = self.start + self.width * np.arange(low, high + 2)
+        return counts, edges
+
+###
+### Profile of a table
+###
+
+class TableProfile(object):
+    """Mergeable profile of the columns of a table.
+
+    schema : stoSchema.Schema, or list of (name, type) pairs, of the columns;
+             'int' and 'float' columns are numeric, 'str' columns text.
+    widths : dict of {column: bin width} of the exact histograms.
+    """
+
+    def __init__(self, schema, widths=None, k=200, seed=0):
+        self.schema = stoSchema.as_schema(schema)
+        self.rows = 0
+        self.columns = {}
+        for name, colType in self.schema:
+            column = {'distinct': DistinctSketch()}
+            if colType == 'str':
+                column['summary'] = TextSummary()
+                column['frequent'] = FrequentValues()
+            else:
+                column['summary'] = NumericSummary()
+                column['quantiles'] = QuantileSketch(k, seed)
+                if widths and name in widths:
+                    column['histogram'] = FixedHistogram(widths[name])
+            self.columns[name] = column
+
+    def add(self, chunk):
+        """Add the rows of a DataFrame chunk with the columns of the schema."""
+        self.rows += len(chunk)
+        for name, colType in self.schema:
+            column = self.columns[name]
+            if colType == 'str':
+                known = column['summary'].add(chunk[name].to_numpy(dtype=object))
+                column['frequent'].add(known)
+                column['distinct'].add(known.astype(str))
+            else:
+                values = chunk[name].to_numpy(dtype=np.float64)
+                for key in ('summary', 'quantiles', 'histogram'):
+                    if key in column:
+                        column[key].add(values)
+                column['distinct'].add(values[~np.isnan(values)])
+        return self
+
+    def merge(self, other):
+        """Merge the profile of another part of the same table."""
+        self.rows += other.rows
+        for name, column in self.columns.items():
+            for key, sketch in column.items():
+                sketch.merge(other.columns[name][key])
+        return self
+
+    def describe(self):
+        """Return the summary of every column as a DataFrame, one row per column.
+
+        The quartiles are approximate; std is the sample standard deviation,
+        as in pandas.DataFrame.describe().
+        """
+        rows = []
+        for name, colType in self.schema:
+            column = self.columns[name]
+            summary = column['summary']
+            row = {'column': name, 'type': colType, 'count': summary.count,
+                   'nulls': summary.nulls,
+                   'distinct': column['distinct'].estimate()}
+            if colType == 'str':
+                top = column['frequent'].top(1)
+                if len(top):
+                    row.update(top=top.index[0], freq=int(top.iloc[0]))
+            else:
+                q1, q2, q3 = column['quantiles'].quantiles([0.25, 0.5, 0.75])
+                row.update(mean=summary.mean if summary.count else np.nan,
+                           std=np.sqrt(summary.variance()), min=summary.min,
+                           q1=q1, median=q2, q3=q3, max=summary.max,
+                           zeros=summary.zeros, positives=summary.positives,
+                           negatives=summary.negatives)
+            rows.append(row)
+        columns = ['type', 'count', 'nulls', 'distinct', 'mean', 'std', 'min',
+                   'q1', 'median', 'q3', 'max', 'zeros', 'positives',
+                   'negatives', 'top', 'freq']
+        return pd.DataFrame(rows).set_index('column').reindex(columns=columns)
+
+    def histogram(self, name, bins=20):
+        """Return the counts and bin edges of a numeric column.
+
+        The counts are exact for a column with a bin width given to the
+        profile; otherwise, they are estimated from the quantile sketch, in
+        equal-width bins between the min and the max.
+        """
+        column = self.columns[name]
+        if 'histogram' in column:
+            return column['histogram'].histogram()
+        summary = column['summary']
+        edges = np.linspace(summary.min, summary.max, bins + 1)
+        ranks = column['quantiles'].ranks(edges)
+        ranks[-1] = summary.count
+        return np.round(np.diff(ranks)).astype(np.int64), edges
+
+    def value_counts(self, name, n=None):
+        """Return the counts of the most frequent values of a text column."""
+        frequent = self.columns[name]['frequent']
+        return frequent.top(len(frequent.counts) if n is None else n)
+
+###
+### Tables in CSV or fastload form
+###
+
+_fastloadTypes = [(r'(BYTEINT|SMALLINT|INTEGER|BIGINT)\b', 'int'),
+                  (r'(DECIMAL|NUMERIC|NUMBER|FLOAT|REAL|DOUBLE)\b', 'float')]
+
+
+def read_fastload(path):
+    """Return the table of a fastload script as a dictionary of
+      schema  : list of (name, type) pairs of the CREATE TABLE columns
+      path    : path of the data file, next to the script
+      sep     : field delimiter of the VARTEXT records
+      skip    : number of lines before the first record
+    Column types other than integers and numbers (VARCHAR, DATE, ...) are
+    profiled as text.
+    """
+    with open(path) as fIn:
+        text = re.sub(r'/\*.*?\*/', '', fIn.read(), flags=re.S)
+    create = re.search(r'CREATE\s.*?TABLE[^(]*\((.*?)\)\s*(UNIQUE|PRIMARY|NO|;)',
+                       text, re.S | re.I)
+    if create is None:
+        raise ValueError('No CREATE TABLE statement in ' + path)
+    schema = []
+    for line in re.split(r',\s*\n', create.group(1)):
+        name, _, declaration = line.strip().partition(' ')
+        colType = 'str'
+        for pattern, fastloadType in _fastloadTypes:
+            if re.match(pattern, declaration.strip(), re.I):
+                colType = fastloadType
+        schema.append((name, colType))
+    dataFile = re.search(r'FILE\s*=\s*([^;\s]+)\s*;', text, re.I).group(1)
+    sep = re.search(r'VARTEXT\s+"([^"]*)"', text, re.I)
+    record = re.search(r'\bRECORD\s+(\d+)\s*;', text, re.I)
+    return {'schema': schema,
+            'path': os.path.join(os.path.dirname(path), dataFile),
+            'sep': sep.group(1) if sep else '|',
+            'skip': int(record.group(1)) - 1 if record else 0}
+
+
+def _column_type(values):
+    """Return the profile type of a column of text values from a sample."""
+    values = pd.Series(values[values != ''], dtype=object)
+    # Codes with leading zeros, such as account numbers, stay text.
+    if values.str.match(r'-?0\d').any():
+        return 'str'
+    if values.str.fullmatch(r'-?\d+').all():
+        return 'int'
+    return 'float' if pd.to_numeric(values, errors='coerce').notna().all() else 'str'
+
+
+def read_csv_table(path, sep=',', sampleRows=10000):
+    """Return the table of a CSV file with a header row, like read_fastload().
+
+    The column types are inferred from the first rows of the file.
+    """
+    sample = pd.read_csv(path, sep=sep, nrows=sampleRows, dtype=str,
+                         keep_default_na=False)
+    schema = [(name, _column_type(sample[name].to_numpy(dtype=object)))
+              for name in sample.columns]
+    return {'schema': schema, 'path': path, 'sep': sep, 'skip': 1}
+
+
+def read_table(path):
+    """Return the table of a fastload script or of a CSV file."""
+    if path.lower().endswith('.fastload'):
+        return read_fastload(path)
+    return read_csv_table(path)
+
+
+class _ByteRange(io.RawIOBase):
+    """Read-only view of the bytes [start, end) of a file."""
+
+    def __init__(self, fileObject, start, end):
+        self.file = fileObject
+        self.file.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.file.read(min(len(buffer), self.remaining))
+        self.remaining -= len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def split_ranges(path, parts, skip=0):
+    """Split a data file into at most parts byte ranges of whole lines.
+
+    The first skip lines of the file are left out. Compressed files are not
+    split.
+    """
+    with open(path, 'rb') as fIn:
+        for _ in range(skip):
+            fIn.readline()
+        start = fIn.tell()
+        size = os.fstat(fIn.fileno()).st_size
+        if path.lower().endswith(('.zip', '.gz', '.bz2', '.xz')):
+            return [(start, size)]
+        bounds = [start]
+        for i in range(1, parts):
+            fIn.seek(max(bounds[-1], start + (size - start) * i // parts))
+            # Move to the start of the next line, unless already there.
+            fIn.seek(fIn.tell() - 1)
+            fIn.readline()
+            if fIn.tell() < size and fIn.tell() > bounds[-1]:
+                bounds.append(fIn.tell())
+        bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def profile_range(task):
+    """Profile a byte range of a data file; run by the worker processes."""
+    table, start, end, options = task
+    profile = TableProfile(table['schema'], options['widths'], options['k'],
+                           seed=start)
+    schema = stoSchema.as_schema(table['schema'])
+    readOptions = dict(schema.read_options(table['sep']), chunksize=options['chunkRows'])
+    compressed = table['path'].lower().endswith(('.zip', '.gz', '.bz2', '.xz'))
+    with open(table['path'], 'rb') as fIn:
+        if compressed:
+            source = table['path']
+            readOptions['skiprows'] = table['skip']
+        else:
+            source = io.BufferedReader(_ByteRange(fIn, start, end), 1 << 20)
+        for chunk in pd.read_csv(source, **readOptions):
+            profile.add(chunk)
+    return profile
+
+
+def profile_table(path, jobs=1, chunkRows=100000, widths=None, k=200,
+                  rangesPerJob=4):
+    """Profile a table in a CSV file or a fastload script in a single pass.
+
+    The data file is split into byte ranges, which are profiled in chunks of
+    chunkRows rows by jobs worker processes (jobs=0: all available cores);
+    their profiles are merged into the TableProfile that is returned.
+    """
+    table = read_table(path) if isinstance(path, str) else path
+    if jobs <= 0:
+        jobs = stoParse.available_cores()
+    options = {'widths': widths, 'k': k, 'chunkRows': chunkRows}
+    tasks = [(table, start, end, options) for start, end in
+             split_ranges(table['path'], jobs * rangesPerJob if jobs > 1 else 1,
+                          table['skip'])]
+    profile = TableProfile(table['schema'], widths, k)
+    if jobs == 1:
+        for task in tasks:
+            profile.merge(profile_range(task))
+    else:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for part in pool.imap_unordered(profile_range, tasks):
+                profile.merge(part)
+        finally:
+            pool.close()
+            pool.join()
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Profile the columns of a data table in a single pass.')
+    parser.add_argument('table', help='CSV file with a header row, or fastload '
+                                      'script of the table')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='worker processes; 0 for all cores (default: 1)')
+    parser.add_argument('--chunk-rows', type=int, default=100000,
+                        help='rows read at a time (default: 100000)')
+    parser.add_argument('--width', action='append', default=[],
+                        metavar='COLUMN=WIDTH',
+                        help='exact histogram of a column with bins of a width')
+    args = parser.parse_args()
+    widths = dict((name, float(width)) for name, width in
+                  (entry.split('=', 1) for entry in args.width))
+
+    start = time.perf_counter()
+    profile = profile_table(args.table, args.jobs, args.chunk_rows, widths)
+    elapsed = time.perf_counter() - start
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(profile.describe())
+        for name in widths:
+            counts, edges = profile.histogram(name)
+            print('\nHistogram of {}'.format(name))
+            print(pd.Series(counts, index=edges[:-1]).to_string())
+    print('Profiled {:,} rows in {:.3f} s'.format(profile.rows, elapsed),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Demo
+# ------------------------------------------------------------------------------
+# File: stoForest.py
+# ##############################################################################
+#
+# The present file is a helper module for the Python scoring scripts that are
+# used with the SCRIPT table operator in the Part 4
+# "TBv2_Py-4-In_DB_Scripting.ipynb" notebook in this Using Python with Vantage
+# TechByte.
+#
+# The module flattens a fitted scikit-learn RandomForestClassifier into a few
+# contiguous NumPy arrays that hold the nodes of all trees, and scores a chunk
+# of rows across all trees at once with vectorized array operations, instead
+# of one predict_proba() call per tree. The results are identical to the ones
+# of predict_proba(). The flat engine removes the per-tree call overhead, and
+# is therefore fastest on small chunks of up to a few hundred rows; on larger
+# chunks, the compiled per-tree loops of scikit-learn take the lead again.
+# For threshold decisions, the engine can also score each row with blocks of
+# trees only until its decision is settled; see predict_threshold().
+# Install it in the Database next to the scripts that import it.
+#
+################################################################################
+
+import numpy as np
+
+# Maximum number of (row, tree) pairs that are traversed together; bounds the
+# size of the temporary arrays when scoring large chunks.
+blockPairs = 1 << 20
+
+# Number of tree levels between two removals of the (row, tree) pairs that
+# have already reached a leaf.
+compactEvery = 4
+
+
+def _float32_floor(values):
+    """Round float64 values down to the nearest float32 values.
+
+    For a float32 x and a float64 t, x > t holds exactly when x > floor32(t).
+    Comparing float32 rows with such thresholds is thus exact, and halves the
+    memory traffic of the threshold look-ups.
+    """
+    values32 = values.astype(np.float32)
+    over = values32.astype(np.float64) > values
+    values32[over] = np.nextafter(values32[over], np.float32(-np.inf))
+    return values32
+
+
+class FlatForest(object):
+    """A random forest classifier as flat node arrays.
+
+    All nodes of all trees are stored back-to-back. For node i:
+      feature[i]        : index of the split feature (0 for leaves)
+      threshold[i]      : split threshold; rows with x <= threshold go left
+      children[2*i]     : left child (the node itself for leaves)
+      children[2*i + 1] : right child (the node itself for leaves)
+      value[i]          : class probabilities of the node, as a tree predicts
+    roots[t] is the node index of the root of tree t, and depth is the depth
+    of the deepest tree.
+
+    A quantized forest (see stoModelFile) stores the values as integer class
+    fractions in units of 1 / valueScale, the thresholds as float32 values
+    that are rounded down, and the feature indices as the narrow integers of
+    its file; these are traversed as they are. Its children and roots are
+    global node indices, int32 like the ones of an exact forest, as the node
+    indices of a file are relative to their tree.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, depth,
+                 classes, nFeatures, valueScale=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.classes_ = classes
+        self.n_features_in_ = nFeatures
+        self.valueScale = valueScale
+        self._walk = None
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def _walk_arrays(self):
+        """Return the node arrays in the layout the traversal works on."""
+        if self._walk is None:
+            nodes = np.arange(self.n_nodes)
+            isLeaf = self.children[0::2] == nodes
+            if self.threshold.dtype == np.float32:
+                self._walk = (self.feature, self.threshold, self.children, isLeaf)
+            else:
+                self._walk = (self.feature.astype(np.intp),
+                              _float32_floor(self.threshold),
+                              self.children.astype(np.intp), isLeaf)
+        return self._walk
+
+    def apply(self, X, trees=None):
+        """Return the leaf index of each row in each tree, shape (rows, trees).
+
+        All (row, tree) pairs descend one tree level per step together. X is
+        converted to float32 before the comparisons, like scikit-learn trees
+        do; inputs are expected to have no missing values. trees optionally
+        selects the trees, as a slice or an index array.
+        """
+        feature, threshold, children, isLeaf = self._walk_arrays()
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        roots = self.roots if trees is None else self.roots[trees]
+        nRows, nTrees = X.shape[0], len(roots)
+        flatX = X.ravel()
+        nodes = np.tile(roots.astype(np.intp), nRows)
+        rowBase = np.repeat(np.arange(nRows, dtype=np.intp) * X.shape[1], nTrees)
+        pairs = np.arange(nRows * nTrees)
+        leaves = np.empty(nRows * nTrees, dtype=np.intp)
+        for level in range(self.depth):
+            goRight = flatX[rowBase + feature[nodes]] > threshold[nodes]
+            nodes = children[2 * nodes + goRight]
+            # Set aside the pairs that have reached a leaf every few levels.
+            if level % compactEvery == compactEvery - 1:
+                done = isLeaf[nodes]
+                leaves[pairs[done]] = nodes[done]
+                active = ~done
+                nodes, rowBase, pairs = nodes[active], rowBase[active], pairs[active]
+                if not len(nodes):
+                    break
+        leaves[pairs] = nodes
+        return leaves.reshape(nRows, nTrees)
+
+    def predict_proba(self, X, nTrees=None):
+        """Return the class probabilities of the rows of X, like scikit-learn.
+
+        The per-tree probabilities are accumulated in tree order with a running
+        sum, as RandomForestClassifier.predict_proba() does, so that the result
+        matches it to the last bit. nTrees limits scoring to the first trees.
+        The integer values of a quantized forest are summed exactly instead.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        forest = self if nTrees is None else self.subset(nTrees)
+        nRows = X.shape[0]
+        proba = np.empty((nRows, self.value.shape[1]))
+        step = max(1, blockPairs // max(1, forest.n_estimators))
+        for start in range(0, nRows, step):
+            leaves = forest.apply(X[start:start + step])
+            if forest.valueScale is None:
+                proba[start:start + step] = np.cumsum(forest.value[leaves],
+                                                      axis=1)[:, -1]
+            else:
+                proba[start:start + step] = forest.value[leaves].sum(
+                    axis=1, dtype=np.int64)
+        if forest.valueScale is not None:
+            proba /= forest.valueScale
+        proba /= forest.n_estimators
+        return proba
+
+    def predict_threshold(self, X, threshold, blockTrees=50, confidence=1.0):
+        """Score the rows of X for the decision Prob_1 > threshold only.
+
+        The trees are evaluated in blocks of blockTrees trees, and a row stops
+        once its decision is settled:
+          - for sure, when the votes of the remaining trees cannot carry the
+            mean of all trees across the threshold; or
+          - with a confidence below 1 only, when the mean vote of the trees so
+            far is farther from the threshold than the Hoeffding-Serfling
+            bound for a sample of the trees drawn without replacement; the
+            trees of a random forest are exchangeable, so the first trees are
+            such a sample. The error probability is split among the blocks.
+        With confidence=1, the default, only the sure stops are made, and the
+        decisions are exactly the ones of a full evaluation; a lower
+        confidence saves more trees, but a decision may then differ. Returns
+        the probabilities and the number of trees used for each row; the
+        probabilities of a row that stopped early are the means of its trees
+        so far, and the ones of the other rows equal predict_proba().
+        """
+        if self.value.shape[1] != 2:
+            raise ValueError('Threshold scoring needs a forest of 2 classes')
+        X = np.asarray(X, dtype=np.float32)
+        nRows, nTrees = X.shape[0], self.n_estimators
+        scale = 1.0 if self.valueScale is None else float(self.valueScale)
+        starts = list(range(0, nTrees, blockTrees))
+        logTerm = (np.log(2.0 * len(starts) / (1.0 - confidence))
+                   if confidence < 1.0 else np.inf)
+        sums = np.zeros((nRows, 2), dtype=self.value.dtype
+                        if self.valueScale is None else np.int64)
+        used = np.zeros(nRows, dtype=np.int64)
+        active = np.arange(nRows)
+        for start in starts:
+            end = min(start + blockTrees, nTrees)
+            leaves = self.apply(X[active], slice(start, end))
+            # Accumulate in tree order, so that the sums of the rows that use
+            # all trees match the ones of predict_proba() to the last bit.
+            values = self.value[leaves]
+            if self.valueScale is None:
+                sums[active] = np.cumsum(np.concatenate(
+                    [sums[active][:, np.newaxis], values], axis=1), axis=1)[:, -1]
+            else:
+                sums[active] += values.sum(axis=1, dtype=np.int64)
+            used[active] = end
+            if end == nTrees:
+                break
+            votes = sums[active, 1] / scale
+            sureAbove = votes / nTrees > threshold
+            sureBelow = (votes + (nTrees - end)) / nTrees <= threshold
+            epsilon = np.sqrt((1.0 - (end - 1.0) / nTrees) * logTerm / (2.0 * end))
+            mean = votes / end
+            settled = (sureAbove | sureBelow | (mean - epsilon > threshold) |
+                       (mean + epsilon < threshold))
+            active = active[~settled]
+            if not len(active):
+                break
+        proba = sums / scale if self.valueScale is not None else sums
+        proba /= used[:, np.newaxis]
+        return proba, used
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def subset(self, nTrees):
+        """Return a FlatForest of the first nTrees trees."""
+        end = (self.roots[nTrees] if nTrees < len(self.roots)
+               else len(self.feature))
+        return FlatForest(self.feature[:end], self.threshold[:end],
+                          self.children[:2 * end], self.value[:end],
+                          self.roots[:nTrees], self.depth, self.classes_,
+                          self.n_features_in_, self.valueScale)
+
+
+def flatten_forest(classifier):
+    """Export a fitted RandomForestClassifier into a FlatForest.
+
+    Only single-output classifiers are supported.
+    """
+    if getattr(classifier, 'n_outputs_', 1) != 1:
+        raise ValueError('Only single-output forests can be flattened')
+    features, thresholds, children, values, roots = [], [], [], [], []
+    depth, offset = 0, 0
+    for estimator in classifier.estimators_:
+        tree = estimator.tree_
+        nNodes = tree.node_count
+        left = tree.children_left.astype(np.int64)
+        right = tree.children_right.astype(np.int64)
+        isLeaf = left == -1
+        own = np.arange(nNodes, dtype=np.int64)
+        left = np.where(isLeaf, own, left) + offset
+        right = np.where(isLeaf, own, right) + offset
+        children.append(np.column_stack([left, right]).ravel())
+        features.append(np.where(isLeaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        # Normalize the node values the same way DecisionTreeClassifier does
+        # in predict_proba(); older scikit-learn versions keep class counts.
+        value = tree.value[:, 0, :classifier.n_classes_].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(value / normalizer)
+        roots.append(offset)
+        depth = max(depth, tree.max_depth)
+        offset += nNodes
+
+    nNodes = offset
+    indexType = np.int32 if 2 * nNodes < 2**31 else np.int64
+    return FlatForest(feature=np.concatenate(features).astype(np.int32),
+                      threshold=np.concatenate(thresholds).astype(np.float64),
+                      children=np.concatenate(children).astype(indexType),
+                      value=np.ascontiguousarray(np.concatenate(values)),
+                      roots=np.array(roots, dtype=indexType),
+                      depth=depth,
+                      classes=np.asarray(classifier.classes_),
+                      nFeatures=classifier.n_features_in_
+                                if hasattr(classifier, 'n_features_in_')
+                                else classifier.n_features_)
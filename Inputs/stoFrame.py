@@ -0,0 +1,242 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Demo
+# ------------------------------------------------------------------------------
+# File: stoFrame.py
+# ##############################################################################
+#
+# The present file is a helper module for the Python scoring scripts that are
+# used with the SCRIPT table operator in the Part 4
+# "TBv2_Py-4-In_DB_Scripting.ipynb" notebook in this Using Python with Vantage
+# TechByte.
+#
+# The module implements a compact binary columnar alternative to the
+# delimited text that the scripts read and write by default. A stream is a
+# sequence of frames; each frame holds a batch of rows as typed columns, so
+# that it is read into and written from NumPy arrays without any per-value
+# text parsing or formatting. Integer columns are stored in the narrowest
+# integer type that holds their values, and text columns with few distinct
+# values, such as the state_code, as codes into a dictionary of the values.
+# The scripts use it with an "io=binary" argument in the script command.
+#
+# The SCRIPT operator itself cannot use the binary format: it exchanges only
+# delimited text with the Advanced SQL Engine, so the text format remains the
+# default, and the one to use in the Database. The binary mode serves
+# producers and consumers of the scripts' I/O outside the Database, such as
+# the local harnesses in the Benchmarks folder.
+#
+# Frame layout (all integers little-endian):
+#   magic   : 4 bytes, b'STOF'
+#   size    : uint64, number of bytes of the frame that follow
+#   nRows   : uint32
+#   nCols   : uint16
+#   columns : nCols entries of [type: 1 byte, name length: uint16,
+#                               name: UTF-8 bytes, data]
+# where the data of a column of type
+#   b'b', b'h', b'l', b'i' : nRows int8, int16, int32 or int64 values
+#   b'f' : nRows float64 values; NULLs are NaN
+#   b's' : nRows + 1 uint32 end offsets, starting with 0, then the UTF-8 bytes
+#          of all strings back-to-back
+#   b'd' : nValues as uint32, the nValues distinct strings as in b's', then
+#          nRows codes into them, as uint8 values if nValues <= 256, uint16
+#          values if nValues <= 65536, else uint32 values
+# Integer and dictionary columns are decoded into int64 and string columns,
+# as the text mode reads them.
+#
+# The module also converts between the two formats on the client, to prepare
+# binary input for a script from SCRIPT operator text, and to compare binary
+# output with the one of the text mode.
+#
+################################################################################
+
+import struct
+import sys
+
+import numpy as np
+import pandas as pd
+
+frameMagic = b'STOF'
+_sizeFormat = '<Q'
+_shapeFormat = '<IH'
+_nameLenFormat = '<H'
+_int64 = np.dtype('<i8')
+_float64 = np.dtype('<f8')
+_offset = np.dtype('<u4')
+_count = struct.Struct('<I')
+
+# Integer column types, narrowest first.
+_intTypes = [(b'b', np.dtype('i1')), (b'h', np.dtype('<i2')),
+             (b'l', np.dtype('<i4')), (b'i', _int64)]
+_intTypeOf = dict(_intTypes)
+
+###
+### Encoding
+###
+
+def _encode_strings(strings):
+    """Return the end offsets and the bytes of a list of encoded strings."""
+    ends = np.cumsum([0] + [len(s) for s in strings]).astype(_offset)
+    return ends.tobytes() + b''.join(strings)
+
+
+def _code_type(nValues):
+    """Return the type of the codes of a dictionary of nValues strings."""
+    return (np.dtype('u1') if nValues <= 1 << 8 else
+            np.dtype('<u2') if nValues <= 1 << 16 else _offset)
+
+
+def _encode_column(name, values):
+    """Return the type code, name and data bytes of a column."""
+    values = np.asarray(values)
+    if values.dtype.kind in 'iub':
+        values = values.astype(_int64)
+        low, high = (values.min(), values.max()) if len(values) else (0, 0)
+        for typeCode, dtype in _intTypes:
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                break
+        data = values.astype(dtype).tobytes()
+    elif values.dtype.kind == 'f':
+        typeCode, data = b'f', values.astype(_float64).tobytes()
+    else:
+        strings = [str(v) for v in values.tolist()]
+        codes, uniques = pd.factorize(pd.Series(strings, dtype=object))
+        if 2 * len(uniques) <= len(strings):
+            typeCode = b'd'
+            data = b''.join([_count.pack(len(uniques)),
+                             _encode_strings([v.encode('utf-8') for v in uniques]),
+                             codes.astype(_code_type(len(uniques))).tobytes()])
+        else:
+            typeCode = b's'
+            data = _encode_strings([v.encode('utf-8') for v in strings])
+    nameBytes = name.encode('utf-8')
+    return b''.join([typeCode, struct.pack(_nameLenFormat, len(nameBytes)),
+                     nameBytes, data])
+
+
+def encode_frame(columns, names):
+    """Return a batch of rows as one binary frame.
+
+    columns : sequence of equal-length arrays, pandas Series or lists.
+    names   : the column names, in the same order.
+    Integer and boolean columns are stored as the narrowest integers that hold
+    their values, floats as float64, and any other columns as strings, with a
+    dictionary if at most half of their values are distinct.
+    """
+    nRows = len(columns[0]) if len(columns) else 0
+    body = [struct.pack(_shapeFormat, nRows, len(columns))]
+    body += [_encode_column(name, values) for name, values in zip(names, columns)]
+    body = b''.join(body)
+    return frameMagic + struct.pack(_sizeFormat, len(body)) + body
+
+
+def write_frame(columns, names, out=None):
+    """Export a batch of output columns to standard output (or out) as a frame."""
+    data = encode_frame(columns, names)
+    (sys.stdout.buffer if out is None else out).write(data)
+    return len(data)
+
+###
+### Decoding
+###
+
+def _decode_strings(body, nValues, pos):
+    """Return nValues strings at a position of a frame body as an object
+    array, and the position after them."""
+    ends = np.frombuffer(body, dtype=_offset, count=nValues + 1, offset=pos)
+    pos += (nValues + 1) * _offset.itemsize
+    text = bytes(body[pos:pos + int(ends[-1])])
+    bounds = ends.tolist()
+    values = np.array([text[start:end].decode('utf-8') for start, end
+                       in zip(bounds[:-1], bounds[1:])], dtype=object)
+    return values, pos + int(ends[-1])
+
+
+def decode_frame(body):
+    """Return the columns of a frame body (after the size) as a DataFrame."""
+    body = memoryview(body)
+    nRows, nCols = struct.unpack_from(_shapeFormat, body, 0)
+    pos = struct.calcsize(_shapeFormat)
+    columns = {}
+    for _ in range(nCols):
+        typeCode = bytes(body[pos:pos + 1])
+        nameLen, = struct.unpack_from(_nameLenFormat, body, pos + 1)
+        pos += 1 + struct.calcsize(_nameLenFormat)
+        name = bytes(body[pos:pos + nameLen]).decode('utf-8')
+        pos += nameLen
+        if typeCode in _intTypeOf or typeCode == b'f':
+            dtype = _intTypeOf.get(typeCode, _float64)
+            values = np.frombuffer(body, dtype=dtype, count=nRows, offset=pos)
+            pos += nRows * dtype.itemsize
+            # Native-endian int64 or float64 copies, so that the columns are
+            # writable and aligned.
+            values = values.astype(_int64.newbyteorder('=') if typeCode != b'f'
+                                   else _float64.newbyteorder('='))
+        elif typeCode in (b's', b'd'):
+            nValues = nRows
+            if typeCode == b'd':
+                nValues, = _count.unpack_from(body, pos)
+                pos += _count.size
+            values, pos = _decode_strings(body, nValues, pos)
+            if typeCode == b'd':
+                codeType = _code_type(nValues)
+                codes = np.frombuffer(body, dtype=codeType, count=nRows, offset=pos)
+                pos += nRows * codeType.itemsize
+                values = values[codes]
+        else:
+            raise ValueError('Unknown column type {!r} in frame'.format(typeCode))
+        columns[name] = values
+    return pd.DataFrame(columns)
+
+
+def read_frames(stream):
+    """Yield the frames of a binary stream as DataFrames, one at a pass.
+
+    Each frame is read only when it is requested, so that a script can process
+    and export one batch before the next one is read.
+    """
+    headerSize = len(frameMagic) + struct.calcsize(_sizeFormat)
+    while True:
+        header = stream.read(headerSize)
+        if not header:
+            return
+        if len(header) < headerSize or header[:len(frameMagic)] != frameMagic:
+            raise ValueError('Input is not a stream of binary frames')
+        size, = struct.unpack_from(_sizeFormat, header, len(frameMagic))
+        body = stream.read(size)
+        if len(body) < size:
+            raise ValueError('Truncated binary frame in input')
+        yield decode_frame(body)
+
+###
+### Conversion from and to the text format
+###
+
+def frames_from_text(data, schema, nRows=10000, sep=','):
+    """Convert SCRIPT operator input text into binary frames of nRows rows.
+
+    The text is parsed with the stoParse module according to the schema, so
+    that the frames carry the same typed columns as the text mode reads.
+    """
+    import io
+    import stoParse
+    frames = []
+    for df in stoParse.read_chunks(io.BytesIO(data), nRows, schema, sep):
+        frames.append(encode_frame([df[name] for name in df.columns],
+                                   list(df.columns)))
+    return b''.join(frames)
+
+
+def frames_to_text(data, sep=','):
+    """Convert binary output frames into the text the text mode writes."""
+    import io
+    import stoWrite
+    return ''.join(stoWrite.format_rows([df[name] for name in df.columns], sep)
+                   for df in read_frames(io.BytesIO(data)))
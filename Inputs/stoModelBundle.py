@@ -0,0 +1,306 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Demo
+# ------------------------------------------------------------------------------
+# File: stoModelBundle.py
+# ##############################################################################
+#
+# The present file is a helper module for the micromodeling use case of the
+# Part 4 "TBv2_Py-4-In_DB_Scripting.ipynb" notebook in this Using Python with
+# Vantage TechByte.
+#
+# The module stores the per-state models that stoRFFitMM.py produces in a
+# single indexed model bundle file. The bundle starts with a header table of
+# the state codes and the offsets of their serialized models, so that a scoring
+# script can memory-map the file and deserialize only the model it needs.
+#
+# Bundle layout (all integers little-endian):
+#   magic  : 8 bytes, b'STOMB01\n'
+#   count  : uint32, number of models
+#   index  : count entries of [key length: uint16, key: UTF-8 bytes,
+#                              offset: uint64, length: uint64]
+#   models : the serialized models at their offsets from the start of the file;
+#            pickles, or compact model files of the stoModelFile module
+#
+# Use on the client to convert the "State_Code, Model" output of stoRFFitMM.py
+# into a bundle, either with the write_bundle() function or on the command line:
+#   python stoModelBundle.py multipleModels_py.csv multipleModels_py.bundle
+#
+################################################################################
+
+import base64
+import copy
+import mmap
+import pickle
+import struct
+import sys
+
+bundleMagic = b'STOMB01\n'
+_countFormat = '<I'
+_keyLenFormat = '<H'
+_entryFormat = '<QQ'
+
+
+def decode_clob_model(modelText):
+    """Return the pickled model from a Model value of stoRFFitMM.py output.
+
+    The training script prints each model as the repr of its base64 bytes,
+    e.g. " b'gASV...'", which arrives in the Model CLOB column as text.
+    """
+    modelText = modelText.strip()
+    if modelText.startswith("b'"):
+        modelText = modelText.partition("'")[2]
+    return base64.b64decode(modelText)
+
+
+def write_bundle(path, models):
+    """Write a model bundle file.
+
+    models : dict of {key: model}, where the model is either a fitted
+             estimator, or its pickle as bytes. Keys are stripped of blanks.
+    """
+    payloads = []
+    for key, model in models.items():
+        if not isinstance(model, (bytes, bytearray)):
+            model = pickle.dumps(model)
+        payloads.append((str(key).strip().encode('utf-8'), bytes(model)))
+
+    headerSize = len(bundleMagic) + struct.calcsize(_countFormat)
+    for keyBytes, _ in payloads:
+        headerSize += (struct.calcsize(_keyLenFormat) + len(keyBytes) +
+                       struct.calcsize(_entryFormat))
+
+    with open(path, 'wb') as fOut:
+        fOut.write(bundleMagic)
+        fOut.write(struct.pack(_countFormat, len(payloads)))
+        offset = headerSize
+        for keyBytes, payload in payloads:
+            fOut.write(struct.pack(_keyLenFormat, len(keyBytes)))
+            fOut.write(keyBytes)
+            fOut.write(struct.pack(_entryFormat, offset, len(payload)))
+            offset += len(payload)
+        for _, payload in payloads:
+            fOut.write(payload)
+
+
+def bundle_from_csv(csvPath, bundlePath):
+    """Convert a multipleModels_py.csv file of the notebook into a bundle."""
+    import pandas as pd
+    allStateModels = pd.read_csv(csvPath)
+    write_bundle(bundlePath,
+                 {stateCode: decode_clob_model(modelText) for stateCode, modelText
+                  in zip(allStateModels['State_Code'], allStateModels['Model'])})
+
+
+def encode_clob_model(model):
+    """Return a model as a Model value in the format of stoRFFitMM.py output.
+
+    The model is either a fitted estimator, which is pickled, or serialized
+    model bytes, such as a compact model file of the stoModelFile module.
+    """
+    if not isinstance(model, (bytes, bytearray)):
+        model = pickle.dumps(model)
+    return ' ' + repr(base64.b64encode(bytes(model)))
+
+
+def _is_model_file(payload):
+    """Return True for a compact model file of the stoModelFile module."""
+    return bytes(payload[:8]) == b'STOFRST\n'
+
+
+def load_payload(payload):
+    """Deserialize a model from its bytes in a bundle or a Model value.
+
+    Pickled models are unpickled; compact model files are loaded with the
+    stoModelFile module, which is imported only for them.
+    """
+    if _is_model_file(payload):
+        import stoModelFile
+        return stoModelFile.loads(payload)
+    return pickle.loads(payload)
+
+
+def merge_forests(forests):
+    """Merge random forests of the same classes into a single forest.
+
+    Sub-forests that stoRFFitMM.py tags with their sub-partition are merged in
+    sub-partition order, so that the merged forest does not depend on the
+    order in which the training outputs arrive.
+    """
+    forests = sorted(forests, key=lambda f: getattr(f, 'sto_subforest_', (0, 1)))
+    merged = copy.copy(forests[0])
+    for forest in forests[1:]:
+        if list(forest.classes_) != list(merged.classes_):
+            raise ValueError('Cannot merge forests with different classes {} '
+                             'and {}'.format(list(merged.classes_),
+                                             list(forest.classes_)))
+    merged.estimators_ = [tree for forest in forests for tree in forest.estimators_]
+    merged.n_estimators = len(merged.estimators_)
+    if hasattr(merged, 'sto_subforest_'):
+        del merged.sto_subforest_
+    return merged
+
+
+def merge_subforests(models):
+    """Merge the per-sub-partition output of stoRFFitMM.py into one per state.
+
+    models : pandas DataFrame with the "State_Code, Model" output of the
+             training script in sub-forest mode; i.e., one row per
+             sub-partition of each state code.
+    Returns a DataFrame of the same format with one merged forest per state.
+    """
+    import pandas as pd
+    payloads = {}
+    for stateCode, modelText in zip(models['State_Code'], models['Model']):
+        payloads.setdefault(str(stateCode).strip(), []).append(
+            decode_clob_model(modelText))
+    merged = []
+    for stateCode, statePayloads in payloads.items():
+        # Compact model files are merged block by block, without loading them.
+        if all(_is_model_file(payload) for payload in statePayloads):
+            import stoModelFile
+            model = stoModelFile.merge(statePayloads)
+        else:
+            model = merge_forests([pickle.loads(payload)
+                                   for payload in statePayloads])
+        merged.append((stateCode, encode_clob_model(model)))
+    return pd.DataFrame(merged, columns=['State_Code', 'Model'])
+
+
+def search_winners(output):
+    """Return the selected models of the search mode output of stoRFFitMM.py.
+
+    output : pandas DataFrame with the stoSchema.searchOutput columns of the
+             training script in search mode; i.e., one row per candidate of
+             each state code.
+    Returns a DataFrame in the "State_Code, Model" format of a plain training
+    run, with the model of the best candidate of each state.
+    """
+    winners = output[output['Selected'] == 1]
+    return winners[['State_Code', 'Model']].reset_index(drop=True)
+
+
+###
+### Model lineage of incremental training
+###
+
+def model_lineage(model):
+    """Return the lineage of a per-state model of stoRFFitMM.py as a dictionary.
+
+    An incremental training run of stoRFFitMM.py records in the model
+      generation : number of incremental runs since the last full fit
+      trees      : the generation in which each tree of the forest was fitted
+      rows       : the rows of the full fit, then the rows of each incremental
+                   run since
+      refitDue   : True when the model is due for a full refit
+    A model without a lineage is the result of a full fit, i.e. generation 0.
+    """
+    lineage = getattr(model, 'sto_lineage_', None)
+    if lineage is None:
+        lineage = (getattr(model, 'metadata', None) or {}).get('lineage')
+    if lineage is None:
+        # Every tree of a full fit is grown on a bootstrap sample of all rows,
+        # which is weighted to the number of rows.
+        baseRows = None
+        if hasattr(model, 'estimators_'):
+            baseRows = int(round(model.estimators_[0].tree_.weighted_n_node_samples[0]))
+        lineage = {'generation': 0, 'trees': [0] * model.n_estimators,
+                   'rows': [baseRows], 'refitDue': False}
+    return copy.deepcopy(lineage)
+
+
+def refits_due(models):
+    """Return the state codes of the models that are due for a full refit.
+
+    models : pandas DataFrame with the "State_Code, Model" output of the
+             training script.
+    Retrain these states with the full partitions of the training table, and
+    the other states incrementally with the new or changed rows only.
+    """
+    return sorted(str(stateCode).strip() for stateCode, modelText
+                  in zip(models['State_Code'], models['Model'])
+                  if model_lineage(load_payload(
+                      decode_clob_model(modelText)))['refitDue'])
+
+
+class ModelBundle(object):
+    """Read-only, memory-mapped access to the models in a bundle file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fIn:
+            self._map = mmap.mmap(fIn.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(bundleMagic)] != bundleMagic:
+            raise ValueError("'{}' is not a model bundle file".format(path))
+        pos = len(bundleMagic)
+        count, = struct.unpack_from(_countFormat, self._map, pos)
+        pos += struct.calcsize(_countFormat)
+        self.index = {}
+        for _ in range(count):
+            keyLen, = struct.unpack_from(_keyLenFormat, self._map, pos)
+            pos += struct.calcsize(_keyLenFormat)
+            key = self._map[pos:pos + keyLen].decode('utf-8')
+            pos += keyLen
+            self.index[key] = struct.unpack_from(_entryFormat, self._map, pos)
+            pos += struct.calcsize(_entryFormat)
+
+    def keys(self):
+        return list(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def load(self, key):
+        """Deserialize and return the model stored under key."""
+        offset, length = self.index[key]
+        payload = memoryview(self._map)[offset:offset + length]
+        # Decode compact model files from a copy, so that no array of a model,
+        # nor the traceback of a failed decode, keeps a view of the mapping.
+        if _is_model_file(payload):
+            payload = bytes(payload)
+        return load_payload(payload)
+
+    def close(self):
+        """Close the mapping of the file, unless views of it are still alive;
+        it is then released with the last of them."""
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+
+
+###
+### Per-process cache
+###
+
+# A process that scores several partitions loads each bundle index and each
+# model only once.
+_bundles = {}
+_models = {}
+
+
+def open_bundle(path):
+    """Return the cached ModelBundle object of a bundle file."""
+    if path not in _bundles:
+        _bundles[path] = ModelBundle(path)
+    return _bundles[path]
+
+
+def load_model(path, key):
+    """Return the model stored under key in a bundle file, loading it once."""
+    if (path, key) not in _models:
+        _models[(path, key)] = open_bundle(path).load(key)
+    return _models[(path, key)]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('Usage: python stoModelBundle.py <models.csv> <models.bundle>')
+    bundle_from_csv(sys.argv[1], sys.argv[2])
@@ -0,0 +1,447 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Demo
+# ------------------------------------------------------------------------------
+# File: stoModelFile.py
+# ##############################################################################
+#
+# The present file is a helper module for the Python scripts that are used with
+# the SCRIPT table operator in the Part 4 "TBv2_Py-4-In_DB_Scripting.ipynb"
+# notebook in this Using Python with Vantage TechByte.
+#
+# The module serializes a fitted Random Forests classifier into a compact model
+# file, as an alternative to the base64-encoded pickle of the whole estimator.
+# Only the node arrays that are needed for scoring are kept. The trees are
+# stored in blocks, each compressed on its own, so that the first trees of a
+# forest can be loaded without decompressing the rest. A model file loads as a
+# stoForest.FlatForest, whose predict_proba() results are identical to the
+# ones of the original classifier. The loader also accepts the models in the
+# original format, either pickled or base64-encoded pickled, and returns them
+# as they were saved. Install it in the Database, together with stoForest.py,
+# next to the scripts that read such model files.
+#
+# Opt-in, a forest can be quantized when it is saved: the thresholds are kept
+# as float32 values, rounded down so that the splits of float32 inputs stay
+# exact, the node and feature indices as the narrowest integers that fit, and
+# the class fractions of the leaves as uint16 units of 1/65535. The file is a
+# few times smaller again, and the loaded forest keeps the thresholds, feature
+# indices and class fractions in these narrow types in memory; its child node
+# indices are widened to int32 global indices, as for an exact forest. Its
+# probabilities deviate from the ones of the original classifier by at most
+# quantization_error_bound() (7.6E-06 for 2 classes); they are identical on
+# pure leaves.
+#
+# File layout (all integers little-endian):
+#   magic   : 8 bytes, b'STOFRST\n'
+#   version : uint16, format version of the file (1, or 2 when quantized)
+#   hlen    : uint32, length of the header
+#   hcrc    : uint32, CRC-32 of the header
+#   header  : UTF-8 JSON object with the forest attributes, the compression
+#             method, and the offset, length, number of trees and CRC-32 of
+#             each block, relative to the end of the header
+#   blocks  : the compressed blocks of trees
+# A block holds, for its nTrees trees and nNodes nodes in tree order:
+#   nodes    : nTrees uint32, number of nodes of each tree
+#   depths   : nTrees uint16, depth of each tree
+#   feature  : nNodes int16 (int32 for more than 32767 features)
+#   left     : nNodes int32, left child in the tree, -1 for leaves
+#   right    : nNodes int32, right child in the tree, -1 for leaves
+#   threshold: nNodes float64, byte-shuffled
+#   value    : nLeaves x nClasses float64 class values of the leaves as the
+#              tree stores them, byte-shuffled
+# In a quantized file (version 2, header "quantized": true), the arrays are:
+#   feature  : nNodes uint8 (int16 or int32 for more features)
+#   left     : nNodes uint16 (uint32 for trees of 65536 nodes or more), left
+#              child in the tree, 0 for leaves
+#   right    : as left, for the right child
+#   threshold: nNodes float32, rounded down, byte-shuffled
+#   value    : nLeaves x nClasses uint16 class fractions of the leaves in units
+#              of 1/65535, summing up to 65535 on each leaf, byte-shuffled
+#
+################################################################################
+
+import base64
+import binascii
+import json
+import pickle
+import struct
+import zlib
+
+import numpy as np
+
+import stoForest
+
+fileMagic = b'STOFRST\n'
+formatVersion = 2
+_prefixFormat = '<HII'
+
+# Units of the class fractions of the leaves of a quantized forest.
+valueScale = 65535
+
+# Number of trees per compressed block; the unit of partial loading.
+treesPerBlock = 25
+
+
+def _compressor(method):
+    if method == 'zlib':
+        return (lambda data: zlib.compress(data, 6)), zlib.decompress
+    if method == 'lzma':
+        import lzma
+        return lzma.compress, lzma.decompress
+    if method == 'none':
+        return bytes, bytes
+    raise ValueError("Unknown compression method '{}'".format(method))
+
+
+def _shuffle(values):
+    """Group the bytes of an array by significance, for better compression."""
+    return np.ascontiguousarray(
+        values.view(np.uint8).reshape(-1, values.itemsize).T).tobytes()
+
+
+def _unshuffle(data, dtype, count):
+    dtype = np.dtype(dtype)
+    grouped = np.frombuffer(data, dtype=np.uint8, count=count * dtype.itemsize)
+    return np.ascontiguousarray(
+        grouped.reshape(dtype.itemsize, count).T).view(dtype).ravel()
+
+###
+### Quantization
+###
+
+def quantization_error_bound(nClasses=2):
+    """Return the bound of the probability deviation of a quantized forest.
+
+    Every class fraction of a leaf is off by less than 1 unit of 1/65535, and
+    by at most half a unit for 2 classes; a probability of the forest is the
+    mean over its trees, and is off by no more.
+    """
+    return (0.5 if nClasses <= 2 else 1.0) / valueScale
+
+
+def quantize_values(value):
+    """Return class values as uint16 fractions that sum up to valueScale.
+
+    The fractions are rounded down, and the missing units are given to the
+    classes with the largest remainders; leaves without any value stay 0.
+    """
+    value = np.asarray(value, dtype=np.float64)
+    total = value.sum(axis=1, keepdims=True)
+    scaled = value / np.where(total == 0.0, 1.0, total) * valueScale
+    units = np.floor(scaled)
+    missing = np.where(total[:, 0] > 0.0, valueScale - units.sum(axis=1), 0.0)
+    missing = np.clip(np.round(missing), 0, value.shape[1])
+    rank = np.argsort(np.argsort(units - scaled, axis=1, kind='stable'),
+                      axis=1, kind='stable')
+    units += rank < missing[:, np.newaxis]
+    return units.astype('<u2')
+
+###
+### Saving
+###
+
+def _encode_block(estimators, nClasses, featureType):
+    counts, depths, features, lefts, rights, thresholds, values = \
+        [], [], [], [], [], [], []
+    for estimator in estimators:
+        tree = estimator.tree_
+        counts.append(tree.node_count)
+        depths.append(tree.max_depth)
+        features.append(tree.feature)
+        lefts.append(tree.children_left)
+        rights.append(tree.children_right)
+        thresholds.append(tree.threshold)
+        values.append(tree.value[tree.children_left == -1, 0, :nClasses])
+    feature = np.concatenate(features)
+    return b''.join([
+        np.array(counts, dtype='<u4').tobytes(),
+        np.array(depths, dtype='<u2').tobytes(),
+        np.where(feature < 0, 0, feature).astype(featureType).tobytes(),
+        np.concatenate(lefts).astype('<i4').tobytes(),
+        np.concatenate(rights).astype('<i4').tobytes(),
+        _shuffle(np.concatenate(thresholds).astype('<f8')),
+        _shuffle(np.concatenate(values).astype('<f8'))])
+
+
+def _encode_quantized_block(estimators, nClasses, featureType, nodeType):
+    counts, depths, features, lefts, rights, thresholds, values = \
+        [], [], [], [], [], [], []
+    for estimator in estimators:
+        tree = estimator.tree_
+        counts.append(tree.node_count)
+        depths.append(tree.max_depth)
+        features.append(tree.feature)
+        lefts.append(tree.children_left)
+        rights.append(tree.children_right)
+        thresholds.append(tree.threshold)
+        values.append(tree.value[tree.children_left == -1, 0, :nClasses])
+    feature = np.concatenate(features)
+    # The root is no child of any node, so 0 can mark the leaves.
+    left, right = np.concatenate(lefts), np.concatenate(rights)
+    return b''.join([
+        np.array(counts, dtype='<u4').tobytes(),
+        np.array(depths, dtype='<u2').tobytes(),
+        np.where(feature < 0, 0, feature).astype(featureType).tobytes(),
+        np.maximum(left, 0).astype(nodeType).tobytes(),
+        np.maximum(right, 0).astype(nodeType).tobytes(),
+        _shuffle(stoForest._float32_floor(
+            np.concatenate(thresholds).astype(np.float64)).astype('<f4')),
+        _shuffle(quantize_values(np.concatenate(values)))])
+
+
+def _pack(header, blocks):
+    """Return the bytes of a model file with a header and compressed blocks."""
+    headerBytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    version = 2 if header.get('quantized') else 1
+    return b''.join([fileMagic,
+                     struct.pack(_prefixFormat, version, len(headerBytes),
+                                 zlib.crc32(headerBytes) & 0xffffffff),
+                     headerBytes] + [bytes(block) for block in blocks])
+
+
+def dumps(classifier, compression='zlib', metadata=None, quantize=False):
+    """Return a fitted RandomForestClassifier as compact model file bytes.
+
+    compression : 'zlib' (default), 'lzma' or 'none'.
+    metadata    : optional dictionary of JSON values to keep with the model;
+                  available as the metadata attribute of the loaded forest.
+    quantize    : if True, save a quantized forest; see the module notes.
+    """
+    if getattr(classifier, 'n_outputs_', 1) != 1:
+        raise ValueError('Only single-output forests can be saved')
+    compress = _compressor(compression)[0]
+    nFeatures = (classifier.n_features_in_ if hasattr(classifier, 'n_features_in_')
+                 else classifier.n_features_)
+    featureType = '<i2' if nFeatures < 2**15 else '<i4'
+    nClasses = int(classifier.n_classes_)
+    estimators = classifier.estimators_
+    if quantize:
+        if nFeatures < 2**8:
+            featureType = '|u1'
+        maxNodes = max(e.tree_.node_count for e in estimators) if estimators else 0
+        nodeType = '<u2' if maxNodes <= 2**16 else '<u4'
+
+        def encode(trees):
+            return _encode_quantized_block(trees, nClasses, featureType, nodeType)
+    else:
+        def encode(trees):
+            return _encode_block(trees, nClasses, featureType)
+    blocks, entries, offset = [], [], 0
+    for start in range(0, len(estimators), treesPerBlock):
+        block = compress(encode(estimators[start:start + treesPerBlock]))
+        entries.append({'offset': offset, 'length': len(block),
+                        'trees': len(estimators[start:start + treesPerBlock]),
+                        'crc32': zlib.crc32(block) & 0xffffffff})
+        blocks.append(block)
+        offset += len(block)
+    classes = np.asarray(classifier.classes_)
+    header = {'nTrees': len(estimators), 'nFeatures': int(nFeatures),
+              'classes': classes.tolist(), 'classesType': classes.dtype.str,
+              'featureType': featureType, 'compression': compression,
+              'blocks': entries, 'metadata': metadata or {}}
+    if quantize:
+        header.update({'quantized': True, 'nodeType': nodeType,
+                       'valueScale': valueScale})
+    if hasattr(classifier, 'feature_names_in_'):
+        header['featureNames'] = [str(n) for n in classifier.feature_names_in_]
+    return _pack(header, blocks)
+
+
+def save(classifier, path, compression='zlib', metadata=None, quantize=False):
+    """Save a fitted RandomForestClassifier in a compact model file."""
+    with open(path, 'wb') as fOut:
+        fOut.write(dumps(classifier, compression, metadata, quantize))
+
+###
+### Loading
+###
+
+def is_model_file(data):
+    """Return True if data begin like a compact model file."""
+    return bytes(data[:len(fileMagic)]) == fileMagic
+
+
+def read_header(data):
+    """Return the header of compact model file bytes, and where blocks begin."""
+    data = memoryview(data)
+    if not is_model_file(data):
+        raise ValueError('Not a compact model file')
+    pos = len(fileMagic)
+    version, headerLen, headerCrc = struct.unpack_from(_prefixFormat, data, pos)
+    if version > formatVersion:
+        raise ValueError('Model file format version {} is newer than the '
+                         'supported version {}'.format(version, formatVersion))
+    pos += struct.calcsize(_prefixFormat)
+    headerBytes = bytes(data[pos:pos + headerLen])
+    if zlib.crc32(headerBytes) & 0xffffffff != headerCrc:
+        raise ValueError('Model file header checksum mismatch')
+    return json.loads(headerBytes.decode('utf-8')), pos + headerLen
+
+
+def _decode_blocks(data, header, blocksStart, nTrees):
+    """Return the node arrays of the first nTrees trees."""
+    decompress = _compressor(header['compression'])[1]
+    featureType = np.dtype(header['featureType'])
+    quantized = header.get('quantized', False)
+    nodeType = np.dtype(header['nodeType'] if quantized else '<i4')
+    thresholdType = np.dtype('<f4' if quantized else '<f8')
+    valueType = np.dtype('<u2' if quantized else '<f8')
+    parts = {name: [] for name in ('counts', 'depths', 'feature', 'left',
+                                   'right', 'threshold', 'value')}
+    nClasses = len(header['classes'])
+    loaded = 0
+    for entry in header['blocks']:
+        if loaded >= nTrees:
+            break
+        start = blocksStart + entry['offset']
+        raw = data[start:start + entry['length']]
+        if zlib.crc32(raw) & 0xffffffff != entry['crc32']:
+            raise ValueError('Model file block checksum mismatch')
+        block = decompress(raw)
+        nBlockTrees = entry['trees']
+        counts = np.frombuffer(block, dtype='<u4', count=nBlockTrees)
+        pos = counts.nbytes
+        depths = np.frombuffer(block, dtype='<u2', count=nBlockTrees, offset=pos)
+        pos += depths.nbytes
+        nNodes = int(counts.sum())
+        feature = np.frombuffer(block, dtype=featureType, count=nNodes, offset=pos)
+        pos += feature.nbytes
+        left = np.frombuffer(block, dtype=nodeType, count=nNodes, offset=pos)
+        pos += left.nbytes
+        right = np.frombuffer(block, dtype=nodeType, count=nNodes, offset=pos)
+        pos += right.nbytes
+        if quantized:
+            # Leaves are marked with 0 instead of -1 in a quantized file.
+            left = np.where(left == 0, -1, left.astype(np.int64))
+            right = np.where(right == 0, -1, right.astype(np.int64))
+        size = thresholdType.itemsize * nNodes
+        threshold = _unshuffle(block[pos:pos + size], thresholdType, nNodes)
+        pos += size
+        nLeaves = int((left == -1).sum())
+        size = valueType.itemsize * nLeaves * nClasses
+        value = _unshuffle(block[pos:pos + size], valueType,
+                           nLeaves * nClasses).reshape(nLeaves, nClasses)
+        # Keep only the trees that are asked for from the last block.
+        keep = min(nBlockTrees, nTrees - loaded)
+        if keep < nBlockTrees:
+            nNodes = int(counts[:keep].sum())
+            nLeaves = int((left[:nNodes] == -1).sum())
+            counts, depths = counts[:keep], depths[:keep]
+            feature, left, right = feature[:nNodes], left[:nNodes], right[:nNodes]
+            threshold, value = threshold[:nNodes], value[:nLeaves]
+        for name, values in (('counts', counts), ('depths', depths),
+                             ('feature', feature), ('left', left),
+                             ('right', right), ('threshold', threshold),
+                             ('value', value)):
+            parts[name].append(values)
+        loaded += keep
+    return {name: np.concatenate(values) for name, values in parts.items()}
+
+
+def loads(data, nTrees=None):
+    """Load a model from bytes.
+
+    Compact model file bytes load as a stoForest.FlatForest of the first
+    nTrees trees (all trees by default); only the blocks of those trees are
+    decompressed. Any other bytes are taken for a model in the original
+    format, a pickle or a base64-encoded pickle, and are unpickled.
+    """
+    if not is_model_file(data):
+        data = bytes(data)
+        if not data.startswith(b'\x80'):
+            try:
+                data = base64.b64decode(data, validate=False)
+            except (binascii.Error, ValueError):
+                pass
+            if is_model_file(data):
+                return loads(data, nTrees)
+        return pickle.loads(data)
+
+    header, blocksStart = read_header(data)
+    nTrees = header['nTrees'] if nTrees is None else min(nTrees, header['nTrees'])
+    arrays = _decode_blocks(memoryview(data), header, blocksStart, nTrees)
+
+    # Rebuild the flat node arrays of stoForest: global node indices, leaves
+    # pointing to themselves, and normalized class values on the leaves.
+    counts = arrays['counts'].astype(np.int64)
+    roots = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    nNodes = int(counts.sum())
+    treeBase = np.repeat(roots, counts)
+    own = np.arange(nNodes, dtype=np.int64)
+    left, right = arrays['left'].astype(np.int64), arrays['right'].astype(np.int64)
+    isLeaf = left == -1
+    left = np.where(isLeaf, own, left + treeBase)
+    right = np.where(isLeaf, own, right + treeBase)
+    nClasses = len(header['classes'])
+    indexType = np.int32 if 2 * nNodes < 2**31 else np.int64
+    if header.get('quantized', False):
+        # Keep the narrow values, features and thresholds of a quantized
+        # forest; the children are global int32 indices, as below.
+        value = np.zeros((nNodes, nClasses), dtype=np.uint16)
+        value[isLeaf] = arrays['value']
+        feature = arrays['feature'].astype(np.dtype(header['featureType']).type)
+        threshold = arrays['threshold'].astype(np.float32)
+        scale = header['valueScale']
+    else:
+        value = np.zeros((nNodes, nClasses))
+        leafValue = arrays['value'].astype(np.float64)
+        normalizer = leafValue.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        value[isLeaf] = leafValue / normalizer
+        feature = arrays['feature'].astype(np.int32)
+        threshold = arrays['threshold'].astype(np.float64)
+        scale = None
+    forest = stoForest.FlatForest(
+        feature=feature, threshold=threshold,
+        children=np.column_stack([left, right]).ravel().astype(indexType),
+        value=value, roots=roots.astype(indexType),
+        depth=int(arrays['depths'].max()) if len(counts) else 0,
+        classes=np.array(header['classes'], dtype=header['classesType']),
+        nFeatures=header['nFeatures'], valueScale=scale)
+    forest.metadata = header['metadata']
+    return forest
+
+
+def load(path, nTrees=None):
+    """Load a model from a file; see loads()."""
+    with open(path, 'rb') as fIn:
+        return loads(fIn.read(), nTrees)
+
+
+def merge(files):
+    """Merge compact model files of forests of the same classes into one.
+
+    The blocks of trees are copied over as they are, without decompression.
+    Files of sub-forests that stoRFFitMM.py tags in their metadata with their
+    sub-partition are merged in sub-partition order, and the tag is dropped.
+    """
+    parsed = []
+    for data in files:
+        header, blocksStart = read_header(data)
+        parsed.append((header.get('metadata', {}).get('subforest', [0, 1]),
+                       header, memoryview(data)[blocksStart:]))
+    parsed.sort(key=lambda item: item[0])
+    merged = dict(parsed[0][1])
+    merged['blocks'], merged['nTrees'], blocks, offset = [], 0, [], 0
+    for _, header, blockData in parsed:
+        for key in ('quantized', 'classes', 'nFeatures', 'compression',
+                    'featureType', 'nodeType'):
+            if header.get(key) != merged.get(key):
+                raise ValueError('Cannot merge model files with different '
+                                 '{}: {} and {}'.format(key, merged.get(key),
+                                                        header.get(key)))
+        for entry in header['blocks']:
+            merged['blocks'].append(dict(entry, offset=offset))
+            blocks.append(blockData[entry['offset']:entry['offset'] + entry['length']])
+            offset += entry['length']
+        merged['nTrees'] += header['nTrees']
+    merged['metadata'] = dict(merged['metadata'])
+    merged['metadata'].pop('subforest', None)
+    return _pack(merged, blocks)
@@ -0,0 +1,323 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Demo
+# ------------------------------------------------------------------------------
+# File: stoParse.py
+# ##############################################################################
+#
+# The present file is a helper module for the Python scripts that are used with
+# the SCRIPT table operator in the Part 4 "TBv2_Py-4-In_DB_Scripting.ipynb"
+# notebook in this Using Python with Vantage TechByte.
+#
+# The module turns the comma-delimited text stream that the Advanced SQL Engine
+# sends to a script into a pandas DataFrame of typed NumPy columns in a single
+# vectorized pass, based on a declarative schema of the incoming columns.
+# Install it in the Database next to the scripts that import it.
+#
+################################################################################
+
+import io
+import itertools
+import os
+import sys
+import time
+
+import pandas as pd
+
+import stoSchema
+
+delimiter = ','
+
+###
+### Input schema of the Analytic Data Set (ADS)
+###
+
+# Know your data: You must know in advance the number and data types of the
+# incoming columns from the database! The schemas are declared once in the
+# stoSchema module; each schema iterates over pairs of a column name and one
+# of the types 'int', 'float' or 'str'. The functions of the present module
+# also accept plain lists of such pairs as schemas.
+#
+adsSchema = stoSchema.ads
+
+# Trailing columns of the ADS when a large state_code partition is split into
+# hash sub-partitions for training.
+subPartSchema = stoSchema.subPart
+
+###
+### Script settings
+###
+
+def script_options(defaults, argv=None):
+    """Return the settings of a script as a dictionary.
+
+    Each setting is taken from a "key=value" argument in the script command
+    (e.g., "python3 ./TRNG_TECHBYTES/stoRFScore.py chunk=50000"), else from the
+    environment variable STO_<KEY> (e.g., STO_CHUNK), else from the defaults.
+    Values are cast to the type of the corresponding default value.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    args = dict(arg.split('=', 1) for arg in argv if '=' in arg)
+    options = {}
+    for key, default in defaults.items():
+        value = args.get(key, os.environ.get('STO_' + key.upper()))
+        if value is None:
+            options[key] = default
+        elif isinstance(default, bool):
+            options[key] = value.strip().lower() in ('1', 'true', 'yes', 'on')
+        else:
+            options[key] = type(default)(value)
+    return options
+
+
+def _parameter_value(text):
+    """Cast a parameter value to an int, a float or None, else keep the text."""
+    if text == 'None':
+        return None
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parameter_grid(text):
+    """Return a list of (name, values) pairs for a parameter grid setting.
+
+    The parameters are separated by commas, and the values of a parameter by
+    slashes; e.g., "n_estimators:100/300,max_features:3/5/sqrt,max_depth:None".
+    """
+    grid = []
+    for entry in text.split(','):
+        name, sep, values = entry.partition(':')
+        if not sep or not name.strip() or not values.strip():
+            raise ValueError("Invalid parameter grid entry '{}'; expected "
+                             "'<name>:<value>/<value>...'".format(entry))
+        grid.append((name.strip(), [_parameter_value(value.strip())
+                                    for value in values.split('/')]))
+    return grid
+
+
+def available_cores():
+    """Return the number of CPU cores the present process may run on.
+
+    The CPU affinity mask reflects the cores that the system gives to the
+    SCRIPT operator process, which can be fewer than the cores of the node.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+###
+### Parsing
+###
+
+def empty_frame(schema=adsSchema):
+    """Return an empty DataFrame with the column types of a schema."""
+    return stoSchema.as_schema(schema).empty()
+
+
+def parse_text(data, schema=adsSchema, sep=delimiter):
+    """Parse a block of SCRIPT operator text into a typed DataFrame.
+
+    data   : bytes (or str) with one delimited row per line, as read from
+             sys.stdin.buffer.
+    schema : list of (name, type) pairs in input column order.
+
+    For numeric columns, the database sends in floats in scientific format with
+    a blank space when the exponential is positive; e.g., 1.0 is sent as
+    1.000E 000. The blank after the exponent mark is replaced by a plus sign
+    in a single pass over the block before it is handed to the pandas C
+    parser. Integer columns are read as floats, and cast to int64 if they
+    hold whole numbers only; the few columns with values beyond 2^53 are read
+    again as text, so that their integers are exact. Text columns are kept as
+    they are sent, blanks included.
+    """
+    schema = stoSchema.as_schema(schema)
+    if isinstance(data, str):
+        data = data.encode()
+    original = data
+    data = data.replace(b'E ', b'E+')
+    if b'e ' in data:
+        data = data.replace(b'e ', b'e+')
+    if not data.strip():
+        return schema.empty()
+    df = pd.read_csv(io.BytesIO(data), **schema.read_options(sep))
+    wide = schema.wide_int_names(df)
+    if wide:
+        exact = pd.read_csv(io.BytesIO(data), usecols=wide,
+                            **schema.read_options(sep, str))
+        for name in wide:
+            df[name] = exact[name]
+    schema.cast(df)
+    # Text values with an exponent-like "E " lost their blank above; read such
+    # columns again from the block as it was sent.
+    changed = [name for name, colType in schema if colType == 'str' and
+               df[name].str.contains('[Ee]\\+', na=False).any()]
+    if changed:
+        sent = pd.read_csv(io.BytesIO(original), usecols=changed,
+                           **schema.read_options(sep))
+        for name in changed:
+            df[name] = sent[name]
+    return df
+
+
+def read_chunks(stream, nRows, schema=adsSchema, sep=delimiter):
+    """Yield typed DataFrames of up to nRows rows each from a binary stream.
+
+    The stream can also be any iterable of lines as bytes. Every chunk is
+    parsed only when it is requested, so that a script can process and export
+    one chunk before the next one is read. Each chunk has its own row index
+    starting from 0. A value of 0 for nRows reads the entire stream as a
+    single chunk. nRows can also be a callable, such as an AdaptiveChunker,
+    that returns the size of each next chunk.
+    """
+    if not callable(nRows) and nRows <= 0:
+        data = stream.read() if hasattr(stream, 'read') else b''.join(stream)
+        if data.strip():
+            yield parse_text(data, schema, sep)
+        return
+    while True:
+        lines = list(itertools.islice(stream, nRows() if callable(nRows) else nRows))
+        if not lines:
+            return
+        data = b''.join(lines)
+        del lines
+        if data.strip():
+            yield parse_text(data, schema, sep)
+
+
+class PartitionReader(object):
+    """Peek-ahead chunk reader of a partition of SCRIPT operator input.
+
+    The first record is read ahead and kept, so that the partition key (e.g.,
+    the state_code of a micromodeling partition) is known before the data are
+    processed, while the record still goes out with the first chunk. Iterate
+    over the reader to get typed DataFrames of up to nRows rows each, through
+    the same parse as read_chunks() for every chunk, the first one included.
+    The key is None if the input is empty or its first line is blank.
+    """
+
+    def __init__(self, stream, nRows, schema=adsSchema, sep=delimiter,
+                 keyColumn='state_code'):
+        self.stream = stream
+        self.nRows = nRows
+        self.schema = schema
+        self.sep = sep
+        self._first = stream.readline()
+        self.key = None
+        if self._first.strip():
+            keyIndex = stoSchema.as_schema(schema).index(keyColumn)
+            fields = self._first.rstrip(b'\r\n').split(sep.encode())
+            self.key = fields[keyIndex].decode('utf-8').strip()
+
+    def __iter__(self):
+        if self.key is None:
+            return iter(())
+        return read_chunks(itertools.chain([self._first], self.stream),
+                           self.nRows, self.schema, self.sep)
+
+
+###
+### Adaptive chunk sizing
+###
+
+def current_rss_mb():
+    """Return the resident memory of the present process in MB.
+
+    Where /proc is not available, the peak resident memory is returned.
+    """
+    try:
+        with open('/proc/self/statm') as fIn:
+            pages = int(fIn.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2.0**20
+    except (IOError, OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class AdaptiveChunker(object):
+    """Chunk size controller based on the measured throughput and memory.
+
+    Pass the chunker as the nRows argument of read_chunks() or of a
+    PartitionReader, and call update() with the number of rows after each
+    chunk is parsed, processed and exported. The chunk size starts small and
+    grows by a factor while the rows per second of a whole cycle improve; when
+    they stop improving, the size settles on the best one seen. The size is
+    capped so that the projected resident memory stays below memoryMB, and is
+    halved whenever the memory is found above it. Every change of the size is
+    logged to standard error with the given label.
+    """
+
+    def __init__(self, start=500, minRows=100, maxRows=1000000, memoryMB=1024,
+                 growth=2.0, tolerance=0.05, label='', log=None):
+        self.size = start
+        self.minRows = minRows
+        self.maxRows = maxRows
+        self.memoryMB = memoryMB
+        self.growth = growth
+        self.tolerance = tolerance
+        self.label = label
+        self.log = sys.stderr if log is None else log
+        self.settled = False
+        self.bestRate, self.bestSize = 0.0, start
+        self.baseMB = current_rss_mb()
+        self._last = time.perf_counter()
+
+    def __call__(self):
+        return self.size
+
+    def restart(self):
+        """Start timing the next cycle from now; e.g., after a model is loaded."""
+        self._last = time.perf_counter()
+        self.baseMB = current_rss_mb()
+
+    def _log(self, message):
+        self.log.write('{}{}\n'.format(self.label + ': ' if self.label else '',
+                                       message))
+        self.log.flush()
+
+    def update(self, nRows):
+        """Account for a finished cycle of nRows rows; return the next size."""
+        now = time.perf_counter()
+        elapsed, self._last = now - self._last, now
+        rssMB = current_rss_mb()
+        # A short last chunk says nothing about the throughput of the size.
+        if nRows < self.size or elapsed <= 0.0:
+            return self.size
+        rate = nRows / elapsed
+        newSize = self.size
+        justSettled = False
+        if rssMB > self.memoryMB:
+            newSize = self.size // 2
+            self.settled = True
+        elif not self.settled:
+            if rate > self.bestRate * (1.0 + self.tolerance):
+                self.bestRate, self.bestSize = rate, self.size
+                newSize = int(self.size * self.growth)
+            else:
+                newSize = self.bestSize
+                self.settled = justSettled = True
+        # Project the memory of a chunk from the memory of the present one.
+        perRowMB = max(rssMB - self.baseMB, 0.0) / nRows
+        if perRowMB > 0.0:
+            newSize = min(newSize, int((self.memoryMB - self.baseMB) / perRowMB))
+        newSize = max(self.minRows, min(self.maxRows, newSize))
+        if newSize != self.size:
+            self._log('chunk {} -> {} rows ({:.0f} rows/s, RSS {:.0f} MB)'.format(
+                      self.size, newSize, rate, rssMB))
+            self.size = newSize
+        if justSettled:
+            self._log('chunk settles at {} rows (best {:.0f} rows/s)'.format(
+                      self.size, self.bestRate))
+        return self.size
@@ -0,0 +1,194 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Demo
+# ------------------------------------------------------------------------------
+# File: stoProfile.py
+# ##############################################################################
+#
+# The present file is a helper module for the Python scripts that are used with
+# the SCRIPT table operator in the Part 4 "TBv2_Py-4-In_DB_Scripting.ipynb"
+# notebook in this Using Python with Vantage TechByte.
+#
+# The module is an opt-in profiler of the stages of a script. It is enabled
+# with a "profile=true" argument in the script command, or with the STO_PROFILE
+# environment variable set to 1. A script then times each of its stages, such
+# as the library imports, model load, input read and parse, prediction and
+# output write, counts its rows and bytes in and out, and writes one summary
+# line to standard error at exit:
+#   STO_PROFILE {"script": ..., "pid": ..., "stages": {name: [seconds, calls]},
+#                "rowsIn": ..., "bytesIn": ..., "rowsOut": ..., ...}
+# The lines of all AMPs can be merged with Benchmarks/profileReport.py. When
+# the profiler is not enabled, its calls do nothing. The module imports only
+# standard libraries, so that it can be loaded before any heavy library.
+# Install it in the Database next to the scripts that import it.
+#
+################################################################################
+
+import atexit
+import json
+import os
+import sys
+import time
+
+linePrefix = 'STO_PROFILE '
+
+
+def profiling_enabled(argv=None):
+    """Return True if profiling is asked for in the arguments or environment.
+
+    Like stoParse.script_options(), a "profile=<value>" argument takes
+    precedence over the STO_PROFILE environment variable.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    args = dict(arg.split('=', 1) for arg in argv if '=' in arg)
+    value = args.get('profile', os.environ.get('STO_PROFILE', ''))
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class _NoStage(object):
+    """Context manager that does nothing, for a disabled profiler."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_noStage = _NoStage()
+
+
+class _Stage(object):
+    """Context manager that adds its elapsed time to a stage of a profile."""
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _CountingStream(object):
+    """Binary input stream wrapper that counts the bytes read through it."""
+
+    def __init__(self, stream, profile):
+        self._stream = stream
+        self._profile = profile
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self._profile.counters['bytesIn'] += len(data)
+        return data
+
+    def readline(self, size=-1):
+        line = self._stream.readline(size)
+        self._profile.counters['bytesIn'] += len(line)
+        return line
+
+    def peek(self, size=0):
+        return self._stream.peek(size)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self._stream)
+        self._profile.counters['bytesIn'] += len(line)
+        return line
+
+    next = __next__
+
+
+class Profile(object):
+    """Stage timers and row and byte counters of one script process."""
+
+    def __init__(self, script, enabled):
+        self.script = script
+        self.enabled = enabled
+        self.key = None
+        self.stages = {}
+        self.counters = {'rowsIn': 0, 'bytesIn': 0, 'rowsOut': 0, 'bytesOut': 0}
+        self.start = time.perf_counter()
+        if enabled:
+            atexit.register(self.report)
+
+    def stage(self, name):
+        """Return a context manager that times a stage."""
+        return _Stage(self, name) if self.enabled else _noStage
+
+    def add_time(self, name, seconds, calls=1):
+        entry = self.stages.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    def count(self, name, n):
+        """Add n to a counter, such as rowsIn, rowsOut or bytesOut."""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def input_stream(self, stream):
+        """Return the input stream, counting its bytes if enabled."""
+        return _CountingStream(stream, self) if self.enabled else stream
+
+    def timed_iter(self, iterable, name):
+        """Iterate over iterable, timing each step as the given stage."""
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(iter(iterable), name)
+
+    def _timed_iter(self, iterator, name):
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - start)
+                return
+            self.add_time(name, time.perf_counter() - start)
+            yield item
+
+    def summary(self):
+        """Return the profile as a dictionary."""
+        summary = {'script': self.script, 'pid': os.getpid(), 'key': self.key,
+                   'wall': round(time.perf_counter() - self.start, 6),
+                   'stages': {name: [round(seconds, 6), calls] for name,
+                              (seconds, calls) in self.stages.items()}}
+        summary.update(self.counters)
+        try:
+            import resource
+            summary['peakMB'] = round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+        except ImportError:
+            summary['peakMB'] = None
+        return summary
+
+    def report(self, out=None):
+        """Write the summary line of the process to standard error (or out)."""
+        out = sys.stderr if out is None else out
+        out.write(linePrefix + json.dumps(self.summary(), sort_keys=True) + '\n')
+        out.flush()
+
+
+def start(script, argv=None):
+    """Return the Profile of a script process; enabled only if asked for."""
+    return Profile(script, profiling_enabled(argv))
+
+
+def parse_lines(lines):
+    """Return the summaries of the STO_PROFILE lines among some text lines."""
+    return [json.loads(line[line.index(linePrefix) + len(linePrefix):])
+            for line in lines if linePrefix in line]
@@ -25,117 +25,332 @@
 ################################################################################
 
 import sys
-import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-import pickle
-import base64
+
+# Optionally, profile the stages of the script with the stoProfile module; see
+# stoProfile.py. The profiler does nothing unless it is enabled with the
+# STO_PROFILE=1 environment variable, or a "profile=true" argument.
+import stoProfile
+profile = stoProfile.start('stoRFFitMM.py')
 
 ###
 ### Read input
 ###
 
 delimiter = ','
-inputData = []
 
-for line in sys.stdin.read().splitlines():
-    line = line.split(delimiter)
-    inputData.append(line)
+# Read the entire input at once as raw bytes.
+with profile.stage('read'):
+    inputData = profile.input_stream(sys.stdin.buffer).read()
 
 ###
 ### If no data received, gracefully exit rather than producing an error later.
 ###
 
-if not inputData:
+if not inputData.strip():
     sys.exit()
 
+# Every AMP launches its own Python process for the present script, including
+# AMPs without any data. To keep the start-up cost of such processes low, the
+# heavy libraries are imported only after input data are confirmed present.
+#
+with profile.stage('import'):
+    import pickle
+    import base64
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+    import stoParse
+    import stoSchema
+
 ###
 ### Set up input DataFrame according to input schema
 ###
 
 # Know your data: You must know in advance the number and data types of the
-# incoming columns from the database!
+# incoming columns from the database! The input schema of the ADS is declared
+# once in the stoSchema module, and parsed with the stoParse module; both must
+# be installed in the Database together with the present script.
 # For numeric columns, the database sends in floats in scientific format with a
 # blank space when the exponential is positive; e.g., 1.0 is sent as 1.000E 000.
-# The following input data read deals with any such blank spaces in numbers.
-
-columns = ['cust_id', 'income', 'age', 'tot_cust_years', 'tot_children',
-           'female_ind', 'single_ind', 'married_ind', 'separated_ind',
-           'state_code', 'ca_resident_ind', 'ny_resident_ind', 'tx_resident_ind',
-           'il_resident_ind', 'az_resident_ind', 'oh_resident_ind',
-           'ck_acct_ind', 'sv_acct_ind', 'cc_acct_ind',
-           'ck_avg_bal', 'sv_avg_bal', 'cc_avg_bal', 'ck_avg_tran_amt',
-           'sv_avg_tran_amt', 'cc_avg_tran_amt', 'q1_trans_cnt',
-           'q2_trans_cnt', 'q3_trans_cnt', 'q4_trans_cnt']
-
-df = pd.DataFrame(inputData, columns=columns)
+# The parser deals with any such blank spaces in numbers, and converts all
+# columns to their types in a single pass.
+
+# The trees of a forest can be built in parallel on several cores. Specify the
+# number of cores as a "jobs=<n>" argument in the script command, or in the
+# STO_JOBS environment variable; jobs=0 uses all the cores that the SCRIPT
+# operator process may run on. By default, the trees are built on one core.
+#
+# In the sub-forest mode ("subforest=true"), a large state_code partition is
+# split in the Database into several hash sub-partitions that are trained on
+# different AMPs. The input then carries 2 more columns with the index of the
+# sub-partition and the number of sub-partitions of the state code, and the
+# script fits only its share of the trees of the state's forest. The Model
+# outputs of all sub-partitions of a state are merged on the client with the
+# stoModelBundle.merge_subforests() function.
+#
+# With a "format=compact" argument, each model is exported as a compact model
+# file of the stoModelFile module instead of a pickle; it is many times smaller
+# and faster to load. With "format=quantized", the compact model file holds a
+# quantized forest with float32 thresholds, narrow node indices and uint16 leaf
+# class fractions, which is smaller again, and whose probabilities deviate
+# from the ones of the fitted forest by less than 1E-05. Install
+# stoModelFile.py and stoForest.py too for these formats, and next to the
+# scoring script.
+#
+# In the incremental mode ("incremental=true"), the input holds only the new
+# or changed rows of each state_code partition since the last training run.
+# The previous model of the state is read from the model bundle file given as
+# "base=<path>" (default: the multipleModels_py.bundle file of the scoring
+# script; install stoModelBundle.py too), and a share "replace=<fraction>" of
+# its trees (default: 0.2), the oldest first, is replaced by trees that are
+# fitted on the input rows with warm start. A state without a previous model
+# gets a full fit. The model records its lineage, and is marked as due for a
+# full refit after "maxgen=<n>" incremental runs (default: 10), or when the
+# rows of the incremental runs reach the share "maxrows=<fraction>" of the
+# rows of the last full fit (default: 0.5). List the states due with the
+# stoModelBundle.refits_due() function on the client; a run without the
+# incremental argument always refits in full. The previous models must be
+# pickled; the updated models may still be exported in the compact format.
+#
+# In the search mode ("search=grid" or "search=random"), the parsed partition
+# is fitted with several candidate parameter settings of the forest in turn,
+# instead of rerunning the whole training job once per setting. The grid of
+# the candidates is given as "grid=<name>:<value>/<value>,..." (default: see
+# searchGrid below); the random search fits "candidates=<n>" settings of the
+# grid that are drawn at random (default: 8). Each candidate is scored with
+# the out-of-bag rows of its own trees, so no rows are held out and the data
+# are not read again: by its OOB ROC AUC ("metric=auc", the default), or by
+# its OOB accuracy ("metric=accuracy"). The metric is the same for all the
+# candidates of a partition: if any candidate has no OOB AUC, because its
+# out-of-bag rows hold a single class, as in small or imbalanced partitions,
+# all candidates are ranked by their OOB accuracy. The output then follows the
+# stoSchema.searchOutput schema, with a metrics row per candidate, and the
+# model of the best candidate only; extract the models in the "State_Code,
+# Model" format with the stoModelBundle.search_winners() function on the
+# client. In the search mode, the trees are built on all available cores
+# unless a "jobs=<n>" argument is given.
+searchGrid = 'n_estimators:100/300/500,max_features:3/5/7,min_samples_leaf:1/5'
+defaults = {'jobs': 1, 'subforest': False, 'format': 'pickle',
+            'incremental': False, 'replace': 0.2, 'maxgen': 10, 'maxrows': 0.5,
+            'base': './TRNG_TECHBYTES/multipleModels_py.bundle',
+            'search': '', 'grid': searchGrid, 'candidates': 8, 'metric': 'auc'}
+if stoParse.script_options({'search': ''})['search']:
+    defaults['jobs'] = 0
+options = stoParse.script_options(defaults)
+if options['search'] not in ('', 'grid', 'random'):
+    raise ValueError("Unknown search mode '{}'; use 'grid' or 'random'".format(
+                     options['search']))
+if options['metric'] not in ('auc', 'accuracy'):
+    raise ValueError("Unknown search metric '{}'; use 'auc' or 'accuracy'".format(
+                     options['metric']))
+if options['search'] and (options['subforest'] or options['incremental']):
+    raise ValueError('The search mode cannot be combined with the sub-forest '
+                     'or the incremental mode')
+nJobs = options['jobs'] if options['jobs'] > 0 else stoParse.available_cores()
+
+schema = stoParse.adsSchema
+if options['subforest']:
+    schema = stoParse.adsSchema + stoParse.subPartSchema
+
+with profile.stage('parse'):
+    df = stoParse.parse_text(inputData, schema, delimiter)
 del inputData
+stateCode = str(df['state_code'].iloc[0]).strip()
+profile.key = stateCode
+profile.count('rowsIn', len(df))
 
-df['cust_id'] = pd.to_numeric(df['cust_id'])
-
-df['income'] = df['income'].apply(lambda x: "".join(x.split()))
-df['income'] = pd.to_numeric(df['income'])
-
-df['age'] = pd.to_numeric(df['age'])
-df['tot_cust_years'] = pd.to_numeric(df['tot_cust_years'])
-df['tot_children'] = pd.to_numeric(df['tot_children'])
-df['female_ind'] = pd.to_numeric(df['female_ind'])
-df['single_ind'] = pd.to_numeric(df['single_ind'])
-df['married_ind'] = pd.to_numeric(df['married_ind'])
-df['separated_ind'] = pd.to_numeric(df['separated_ind'])
-df['state_code'] = df['state_code'].apply(lambda x: x.replace('"', ''))
-df['ca_resident_ind'] = pd.to_numeric(df['ca_resident_ind'])
-df['ny_resident_ind'] = pd.to_numeric(df['ny_resident_ind'])
-df['tx_resident_ind'] = pd.to_numeric(df['tx_resident_ind'])
-df['il_resident_ind'] = pd.to_numeric(df['il_resident_ind'])
-df['az_resident_ind'] = pd.to_numeric(df['az_resident_ind'])
-df['oh_resident_ind'] = pd.to_numeric(df['oh_resident_ind'])
-
-df['ck_acct_ind'] = pd.to_numeric(df['ck_acct_ind'])
-df['sv_acct_ind'] = pd.to_numeric(df['sv_acct_ind'])
-df['cc_acct_ind'] = pd.to_numeric(df['cc_acct_ind'])
-
-df['ck_avg_bal'] = df['ck_avg_bal'].apply(lambda x: "".join(x.split()))
-df['ck_avg_bal'] = pd.to_numeric(df['ck_avg_bal'])
-df['sv_avg_bal'] = df['sv_avg_bal'].apply(lambda x: "".join(x.split()))
-df['sv_avg_bal'] = pd.to_numeric(df['sv_avg_bal'])
-df['cc_avg_bal'] = df['cc_avg_bal'].apply(lambda x: "".join(x.split()))
-df['cc_avg_bal'] = pd.to_numeric(df['cc_avg_bal'])
-df['ck_avg_tran_amt'] = df['ck_avg_tran_amt'].apply(lambda x: "".join(x.split()))
-df['ck_avg_tran_amt'] = pd.to_numeric(df['ck_avg_tran_amt'])
-df['sv_avg_tran_amt'] = df['sv_avg_tran_amt'].apply(lambda x: "".join(x.split()))
-df['sv_avg_tran_amt'] = pd.to_numeric(df['sv_avg_tran_amt'])
-df['cc_avg_tran_amt'] = df['cc_avg_tran_amt'].apply(lambda x: "".join(x.split()))
-df['cc_avg_tran_amt'] = pd.to_numeric(df['cc_avg_tran_amt'])
-
-df['q1_trans_cnt'] = pd.to_numeric(df['q1_trans_cnt'])
-df['q2_trans_cnt'] = pd.to_numeric(df['q2_trans_cnt'])
-df['q3_trans_cnt'] = pd.to_numeric(df['q3_trans_cnt'])
-df['q4_trans_cnt'] = pd.to_numeric(df['q4_trans_cnt'])
+# Load the previous model of the state code in the incremental mode.
+baseClassifier = None
+if options['incremental']:
+    if options['subforest']:
+        raise ValueError('The incremental and sub-forest modes cannot be combined')
+    import numpy as np
+    import stoModelBundle
+    with profile.stage('model_load'):
+        bundle = stoModelBundle.open_bundle(options['base'])
+        if stateCode in bundle:
+            baseClassifier = bundle.load(stateCode)
+    if baseClassifier is not None and not hasattr(baseClassifier, 'estimators_'):
+        raise ValueError('Incremental training needs the pickled model of state '
+                         'code {}; compact model files cannot be refitted'.format(
+                         stateCode))
 
 ###
 ### Perform classification model fitting
 ###
 
-predictor_columns = ["income", "age", "tot_cust_years", "tot_children",
-                     "female_ind", "single_ind", "married_ind", "separated_ind",
-                     "ck_acct_ind", "sv_acct_ind", "ck_avg_bal", "sv_avg_bal",
-                     "ck_avg_tran_amt", "sv_avg_tran_amt", "q1_trans_cnt",
-                     "q2_trans_cnt", "q3_trans_cnt", "q4_trans_cnt"]
+# The predictors of the model, in model feature order, are declared together
+# with the input schema in the stoSchema module.
+predictor_columns = stoSchema.ads.names_of('predictor')
 # For the classifier, specify the equivalent parameter values used in the R example:
 # ntree: n_estimators=500, mtry: max_features=5, nodesize: min_samples_leaf=1 (default; skipped)
-classifier = RandomForestClassifier(n_estimators=500, max_features=5, random_state=0)
+nTrees = 500
+randomState = 0
+
+# A sub-partition fits an even share of the trees, with a random state of its
+# own. A state that is not split (1 sub-partition) gets the usual forest.
+if options['subforest']:
+    subPart, subParts = int(df['sub_part'].iloc[0]), int(df['sub_parts'].iloc[0])
+    nTrees = nTrees // subParts + (1 if subPart < nTrees % subParts else 0)
+    randomState = randomState + subPart
+
 X = df[predictor_columns]
 y = df["cc_acct_ind"]
-classifier = classifier.fit(X, y)
+
+if options['search']:
+    import itertools
+    import time
+    import warnings
+    import numpy as np
+    from sklearn.metrics import roc_auc_score
+
+    grid = stoParse.parameter_grid(options['grid'])
+    candidates = list(itertools.product(*[values for _, values in grid]))
+    if options['search'] == 'random' and options['candidates'] < len(candidates):
+        drawn = np.random.RandomState(randomState).choice(
+            len(candidates), options['candidates'], replace=False)
+        candidates = [candidates[i] for i in sorted(drawn)]
+
+    # Fit the candidates one after the other, each on all jobs, and keep only
+    # the best forest so far by each metric in memory, until the metric of the
+    # partition is known. Ties go to the earlier candidate.
+    yValues = y.to_numpy()
+    metrics = []
+    metric = options['metric']
+    best = {}
+    for values in candidates:
+        params = {'n_estimators': nTrees, 'max_features': 5}
+        params.update(zip([name for name, _ in grid], values))
+        candidate = RandomForestClassifier(random_state=randomState,
+                                           n_jobs=nJobs, oob_score=True,
+                                           **params)
+        start = time.perf_counter()
+        # The rows without an OOB prediction are left out of the metrics below,
+        # so the warning of scikit-learn about them is not shown.
+        with profile.stage('fit'), warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=UserWarning,
+                                    message='Some inputs do not have OOB scores')
+            candidate.fit(X, y)
+        fitSeconds = time.perf_counter() - start
+
+        # Rows that are in the bootstrap sample of every tree have no OOB
+        # prediction (NaNs, or zeros in newer scikit-learn versions); the AUC
+        # needs both classes among the remaining rows.
+        oobProba = candidate.oob_decision_function_
+        scored = oobProba.sum(axis=1) > 0
+        oobAuc = float('nan')
+        if oobProba.shape[1] == 2 and len(np.unique(yValues[scored])) == 2:
+            oobAuc = roc_auc_score(yValues[scored], oobProba[scored, 1])
+        # A candidate without an OOB AUC sets the metric of the partition to
+        # the OOB accuracy, which is tracked for all candidates.
+        if metric == 'auc' and np.isnan(oobAuc):
+            metric = 'accuracy'
+            best.pop('auc', None)
+        metrics.append([' '.join('{}:{}'.format(name, value) for name, value
+                                 in zip([name for name, _ in grid], values)),
+                        candidate.oob_score_, oobAuc, fitSeconds])
+        scores = {'auc': oobAuc, 'accuracy': candidate.oob_score_}
+        for name in set([metric, 'accuracy']):
+            if name not in best or scores[name] > best[name][0]:
+                best[name] = (scores[name], len(metrics) - 1, candidate)
+        del candidate
+    _, selected, classifier = best.pop(metric)
+    del best
+    # The OOB predictions hold a row per training row; drop them from the
+    # exported model.
+    del classifier.oob_decision_function_
+elif baseClassifier is None:
+    classifier = RandomForestClassifier(n_estimators=nTrees, max_features=5,
+                                        random_state=randomState, n_jobs=nJobs)
+    with profile.stage('fit'):
+        classifier = classifier.fit(X, y)
+else:
+    # Drop the oldest trees of the previous model, and let warm start fit the
+    # same number of new trees on the input rows next to the remaining ones.
+    # Each generation draws the random seeds of its trees from a random state
+    # of its own. Warm start refits the classes from the input, so rows of a
+    # single class cannot refresh a model of two classes; the previous model is
+    # then exported unchanged.
+    classifier = baseClassifier
+    lineage = stoModelBundle.model_lineage(classifier)
+    generation = lineage['generation'] + 1
+    nReplace = int(round(options['replace'] * len(classifier.estimators_)))
+    if list(np.unique(y)) != list(classifier.classes_):
+        print('State code {}: the input rows do not hold all classes {}; the '
+              'model is not updated'.format(stateCode, classifier.classes_.tolist()),
+              file=sys.stderr)
+        nReplace = 0
+    if nReplace > 0:
+        oldestFirst = np.argsort(lineage['trees'], kind='stable')
+        kept = sorted(oldestFirst[nReplace:])
+        classifier.estimators_ = [classifier.estimators_[i] for i in kept]
+        classifier.set_params(n_estimators=len(kept) + nReplace, warm_start=True,
+                              random_state=randomState + generation,
+                              n_jobs=nJobs)
+        with profile.stage('fit'):
+            classifier = classifier.fit(X, y)
+        classifier.set_params(warm_start=False)
+
+        lineage['generation'] = generation
+        lineage['trees'] = [lineage['trees'][i] for i in kept] + [generation] * nReplace
+        lineage['rows'].append(len(df))
+        lineage['refitDue'] = (
+            generation >= options['maxgen'] or
+            (lineage['rows'][0] is not None and
+             sum(lineage['rows'][1:]) >= options['maxrows'] * lineage['rows'][0]))
+        classifier.sto_lineage_ = lineage
+
+# The random seeds of all trees are drawn from random_state before any tree is
+# built, so the fitted trees do not depend on the number of jobs. Reset n_jobs
+# to its default value, so that the serialized model is byte-for-byte identical
+# to the one of a fit on a single core.
+classifier.set_params(n_jobs=None)
+
+# Tag a sub-forest with its sub-partition, so that the merge step can put the
+# trees of all sub-forests of a state back together in a fixed order.
+if options['subforest']:
+    classifier.sto_subforest_ = (subPart, subParts)
 
 # Serialize the model for export
-modelSer = pickle.dumps(classifier)
-modelSerB64 = base64.b64encode(modelSer)
+with profile.stage('serialize'):
+    if options['format'] in ('compact', 'quantized'):
+        import stoModelFile
+        metadata = {}
+        if options['subforest']:
+            metadata['subforest'] = [subPart, subParts]
+        if hasattr(classifier, 'sto_lineage_'):
+            metadata['lineage'] = classifier.sto_lineage_
+        modelSer = stoModelFile.dumps(classifier, metadata=metadata or None,
+                                      quantize=options['format'] == 'quantized')
+    else:
+        modelSer = pickle.dumps(classifier)
+    modelSerB64 = base64.b64encode(modelSer)
 
 ###
 ### Send the state code and fitted model as output from the present AMP.
 ###
 
 # Export results to Advanced SQL Engine through std output in expected format.
-print(df.iloc[0,9], delimiter, modelSerB64)
+if options['search']:
+    # Metrics rows of all candidates; NULL metrics are sent as empty values.
+    def metric_text(value):
+        return '' if np.isnan(value) else repr(float(value))
+
+    with profile.stage('write'):
+        nBytes = stoSchema.searchOutput.write([
+            [df['state_code'].iloc[0]] * len(metrics),
+            list(range(len(metrics))),
+            [params for params, _, _, _ in metrics],
+            [metric_text(accuracy) for _, accuracy, _, _ in metrics],
+            [metric_text(auc) for _, _, auc, _ in metrics],
+            [metric] * len(metrics),
+            ['{:.3f}'.format(seconds) for _, _, _, seconds in metrics],
+            [int(i == selected) for i in range(len(metrics))],
+            [str(modelSerB64) if i == selected else ''
+             for i in range(len(metrics))]], delimiter)
+    profile.count('rowsOut', len(metrics))
+    profile.count('bytesOut', nBytes)
+else:
+    with profile.stage('write'):
+        print(df['state_code'].iloc[0], delimiter, modelSerB64)
+    profile.count('rowsOut', 1)
+    profile.count('bytesOut', len(modelSerB64))
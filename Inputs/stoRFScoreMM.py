@@ -24,184 +24,254 @@
 #
 ################################################################################
 
+import itertools
 import sys
-import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-import pickle
-import base64
+
+# Optionally, profile the stages of the script with the stoProfile module; see
+# stoProfile.py. The profiler does nothing unless it is enabled with the
+# STO_PROFILE=1 environment variable, or a "profile=true" argument.
+import stoProfile
+profile = stoProfile.start('stoRFScoreMM.py')
+
+###
+### If no data received, gracefully exit before loading any heavy libraries.
+###
+
+# Every AMP launches its own Python process for the present script, including
+# AMPs without any data. To keep the start-up cost of such processes low, the
+# heavy libraries are imported only after input data are confirmed present.
+# Peek at the input without consuming it, and exit if there is none.
+if not sys.stdin.buffer.peek(1):
+    sys.exit()
+
+with profile.stage('import'):
+    import numpy as np
+    import stoModelBundle
+    import stoParse
+    import stoSchema
 
 delimiter = ','
 
-rowToScore = []
+# The script reads, scores and exports its input in chunks of nRowsIn rows at
+# a pass. Specify a different chunk size as a "chunk=<rows>" argument in the
+# script command, or in the STO_CHUNK environment variable.
+#
+# Alternatively, with an "adaptive=true" argument, the chunk size starts from
+# the chunk value and adapts to the measured rows per second of each chunk,
+# within a resident memory ceiling of "memory=<MB>" (default: 1024 MB). The
+# chosen sizes are logged to standard error, to help tune the chunk setting.
+#
+# Optionally, score with the flat-array forest engine of the stoForest module
+# that evaluates all trees at once and produces identical results. It is the
+# faster engine for the small chunks of the present script. To use it, append
+# an argument "engine=flat" to the script command, and install stoForest.py too.
+#
+# With an "io=binary" argument, the script reads and writes the binary
+# columnar frames of the stoFrame module instead of delimited text; each
+# input frame is scored as one chunk. Install stoFrame.py too for this mode.
+#
+# With a "partitioned=false" argument, the script scores input that is not
+# partitioned by state_code; e.g., the rows of the test table where they are
+# stored on each AMP, without a redistribution of the table. The rows of each
+# chunk are then grouped by state_code, and each group is scored with the
+# model of its state. A larger chunk size suits this mode; e.g., chunk=10000.
+#
+# In the threshold mode ("threshold=<cutoff>"), only the decision whether
+# Prob_1 is above the cutoff is needed. The trees are then evaluated in blocks
+# of "blocktrees=<n>" trees (default: 50) with the flat-array forest engine,
+# and a row stops early once the remaining trees cannot change its decision,
+# so that the decisions are exactly the ones of all trees. With a
+# "confidence=<level>" below 1 (e.g., 0.9999), a row also stops once its
+# decision is settled with that confidence, which saves more trees, but may
+# rarely give a different decision; see
+# stoForest.FlatForest.predict_threshold(). Borderline rows use all trees. The
+# output then carries 2 more columns: the Decision (1 if Prob_1 > cutoff), and
+# the number of Trees that scored the row; the probabilities of a row that
+# stopped early are the ones of its trees so far. Install stoForest.py too.
+options = stoParse.script_options({'chunk': 500, 'engine': 'sklearn',
+                                   'io': 'text', 'adaptive': False,
+                                   'memory': 1024, 'partitioned': True,
+                                   'threshold': '', 'blocktrees': 50,
+                                   'confidence': 1.0})
+nRowsIn = options['chunk']
+binaryIO = options['io'] == 'binary'
+partitioned = options['partitioned']
+# In the binary mode, the chunks are the input frames.
+adaptive = options['adaptive'] and not binaryIO
+if adaptive:
+    nRowsIn = stoParse.AdaptiveChunker(start=options['chunk'],
+                                       memoryMB=options['memory'])
+
+###
+### Read input
+###
 
 # Know your data: You must know in advance the number and data types of the
-# incoming columns from the SQL Engine database!
+# incoming columns from the SQL Engine database! The input schema of the ADS
+# is declared once in the stoSchema module, and parsed with the stoParse
+# module; both must be installed in the Database together with the present
+# script.
 # Note: When working with teradataml, you can inspect the data types of the
 #       input table columns by creating a teradataml DataFrame form the table
 #       on the client, and subsequently applying the dtypes method to the
 #       DataFrame.
 #
-colNames = ['cust_id', 'income', 'age', 'tot_cust_years', 'tot_children',
-            'female_ind', 'single_ind', 'married_ind', 'separated_ind',
-            'state_code', 'ca_resident_ind', 'ny_resident_ind', 'tx_resident_ind',
-            'il_resident_ind', 'az_resident_ind', 'oh_resident_ind',
-            'ck_acct_ind', 'sv_acct_ind', 'cc_acct_ind',
-            'ck_avg_bal', 'sv_avg_bal', 'cc_avg_bal', 'ck_avg_tran_amt',
-            'sv_avg_tran_amt', 'cc_avg_tran_amt', 'q1_trans_cnt',
-            'q2_trans_cnt', 'q3_trans_cnt', 'q4_trans_cnt']
-#
-# Of the above input columns, we need to ensure numeric ones are interpreted
-# correctly as rows are streamed as strings into the script by the Database.
-# If any numbers are streamed in scientific format that contains blanks,
-# (such as "1 E002" for 100), the following Lambda functions remove blanks
-# from the input string so that Python interprets the number correctly.
-#
-sciStrToFloat = lambda x: float("".join(x.split()))
-sciStrToInt = lambda x: int(float("".join(x.split())))
-# Use these Lambda functions in the following converters for each input culumn.
-converters = { 0: sciStrToInt,
-               1: sciStrToFloat,
-               2: sciStrToInt,
-               3: sciStrToInt,
-               4: sciStrToInt,
-               5: sciStrToInt,
-               6: sciStrToInt,
-               7: sciStrToInt,
-               8: sciStrToInt,
-              10: sciStrToInt,
-              11: sciStrToInt,
-              12: sciStrToInt,
-              13: sciStrToInt,
-              14: sciStrToInt,
-              15: sciStrToInt,
-              16: sciStrToInt,
-              17: sciStrToInt,
-              18: sciStrToInt,
-              19: sciStrToFloat,
-              20: sciStrToFloat,
-              21: sciStrToFloat,
-              22: sciStrToFloat,
-              23: sciStrToFloat,
-              24: sciStrToFloat,
-              25: sciStrToInt,
-              26: sciStrToInt,
-              27: sciStrToInt,
-              28: sciStrToInt}
-
 # To choose the correct model, the script needs to know which state_code is
-# being currently processed in the Database AMP it executes on. Start by
-# reading just the first streamed row of data to extract the state_code.
+# being currently processed in the Database AMP it executes on. The partition
+# reader of the stoParse module reads the first row ahead to extract the
+# state_code, and still delivers that row as part of the first chunk. Every
+# chunk, the first one included, is parsed in a single pass into typed columns
+# with a row index starting from 0.
 #
-try:
-    line = input()
-    # If the first row of data is blank, the AMP has no data. Exit gracefully.
-    if line == '':
-        sys.exit()
-    else:
-        allArgs = line.split(delimiter)
-        args_1 = [int(x.replace(" ","")) for x in allArgs[0:1]]
-        args_2 = [float(x.replace(" ","")) for x in allArgs[1:2]]
-        args_3 = [int(x.replace(" ","")) for x in allArgs[2:9]]
-        args_4 = [int(x.replace(" ","")) for x in allArgs[10:19]]
-        args_5 = [float(x.replace(" ","")) for x in allArgs[19:25]]
-        args_6 = [int(x.replace(" ","")) for x in allArgs[25:]]
-        currStateCode = allArgs[9].strip()
-        rowToScore = args_1 + args_2 + args_3 + [currStateCode] + args_4 + args_5 + args_6
-except (EOFError):   # Exit gracefully if no input received at all
+stdin = profile.input_stream(sys.stdin.buffer)
+if binaryIO:
+    import stoFrame
+    frames = stoFrame.read_frames(stdin)
+    firstFrame = next(frames, None)
+    currStateCode = (None if firstFrame is None or firstFrame.empty
+                     else str(firstFrame['state_code'].iloc[0]).strip())
+    chunks = itertools.chain([firstFrame], frames)
+elif partitioned:
+    reader = stoParse.PartitionReader(stdin, nRowsIn,
+                                      stoParse.adsSchema, delimiter,
+                                      keyColumn='state_code')
+    currStateCode = reader.key
+    chunks = iter(reader)
+else:
+    # Unpartitioned input holds several state codes; there is no single one.
+    chunks = stoParse.read_chunks(stdin, nRowsIn,
+                                  stoParse.adsSchema, delimiter)
+    currStateCode = 'all'
+
+# If the first row of data is blank, the AMP has no data. Exit gracefully.
+if currStateCode is None:
     sys.exit()
+profile.key = currStateCode
+chunks = profile.timed_iter(chunks, 'read_parse')
+if adaptive:
+    nRowsIn.label = 'stoRFScoreMM.py {}'.format(currStateCode)
 
 ###
-### Load appropriate model from input file
+### Load appropriate model from input bundle file
 ###
 # Before you execute the following statement, replace <DBNAME> with the
 # database name in the target Vantage Advanced SQL Engine where you have
 # previously uploaded the model file to.
 #
-allStateModels = pd.read_csv('./TRNG_TECHBYTES/multipleModels_py.csv')
-
-# Identify and isolate the model we need for the current state code
+# The models of all state codes are expected in a model bundle file. Create it
+# on the client from the training output with the stoModelBundle module. The
+# bundle is memory-mapped, and only the model of the current state code is
+# deserialized from it. In the unpartitioned mode, the model of each state
+# code is deserialized once, when the state code is first met in the input.
+# The bundle may hold pickled models, or compact model files that are loaded
+# with the stoModelFile module; install stoModelFile.py and stoForest.py too
+# for the latter.
 #
-modelSerB64 = allStateModels.loc[
-    allStateModels['State_Code'].str.strip() == currStateCode,
-    ['Model'] ].iloc[0,0].strip()
+bundlePath = './TRNG_TECHBYTES/multipleModels_py.bundle'
+threshold = float(options['threshold']) if options['threshold'] else None
+flatEngine = options['engine'] == 'flat' or threshold is not None
+if flatEngine:
+    import stoForest
 
-# The input model is expected to be a string in encoded, serialized raw format.
-# Follow the inverse process to obtain the model. First, decode the CLOB from
-# base64 into serialized raw. Then, unserialize.
-#
-modelSerB64 = modelSerB64.partition("'")[2]
-modelSer = base64.b64decode(modelSerB64)
-currStateClassifier = pickle.loads(modelSer)
+stateClassifiers = {}
+
+def state_classifier(stateCode):
+    """Return the model of a state code, loading it on first use."""
+    if stateCode not in stateClassifiers:
+        with profile.stage('model_load'):
+            classifier = stoModelBundle.load_model(bundlePath, stateCode)
+            # Compact model files load as flat-array forests already.
+            if flatEngine and hasattr(classifier, 'estimators_'):
+                classifier = stoForest.flatten_forest(classifier)
+        stateClassifiers[stateCode] = classifier
+    return stateClassifiers[stateCode]
+
+if partitioned:
+    currStateClassifier = state_classifier(currStateCode)
 
 ###
-### Ingest and process the rest of the input data rows, nRowsIn at a pass
+### Score the test table data with the given model, one chunk at a pass
 ###
-nRowsIn = 500
+# The predictors of the model, in model feature order, are declared together
+# with the input schema in the stoSchema module.
+predictor_columns = stoSchema.ads.names_of('predictor')
 
-# To read input in chunks, the read_csv reader function must have the
-# iterator argument set to True. The following assigns the function to
-# an object that we name reader. The reader object will be used in the
-# following with the get_chunk() function to read the data in chunks.
-reader = pd.read_csv(sys.stdin, sep=delimiter, header=None, names=colNames,
-                     index_col=False, iterator=True, converters=converters)
+def predict(classifier, X):
+    """Return the probabilities of the rows of X, and in the threshold mode the
+    number of trees that scored each row (else None)."""
+    if threshold is None:
+        return classifier.predict_proba(X), None
+    return classifier.predict_threshold(X, threshold, options['blocktrees'],
+                                        options['confidence'])
 
-# Use try...except to produce an error if something goes wrong in the try block
-try:
+outSchema = stoSchema.mmScoreOutput
+if threshold is not None:
+    outSchema = stoSchema.mmScoreOutput + stoSchema.decision
+
+# Time the passes of an adaptive chunk size from here on.
+if adaptive:
+    nRowsIn.restart()
 
-    while 1:
+# Use try...except to produce an error if something goes wrong in the loop
+try:
 
-        try:
-            # CAUTION: The following statement CONTINUES the row index count for
-            #          the DataFrame from where the previous iteration stopped!
-            dfToScore = reader.get_chunk(nRowsIn)
-        except (EOFError, StopIteration):
-            # Exit gracefully if no input received at all or iteration complete
-            sys.exit()
-        except:              # Raise an exception if other error encountered
-            raise
+    for dfToScore in chunks:
 
-        # Exit gracefully, if DataFrame is empty.
+        # Skip any empty chunk.
         if dfToScore.empty:
-            sys.exit()
-
-        # The first pass must also include the rowToScore list of the first row
-        if rowToScore:
-            dfToScore.loc[-1] = rowToScore
-            dfToScore.index = dfToScore.index+1
-            dfToScore = dfToScore.sort_index()
-            rowToScore = []
-
-        # Reset DataFrame index to start row index count from 0.
-        dfToScore.reset_index(drop = True, inplace = True)
-
-        ###
-        ### Score the test table data with the given model
-        ###
-        predictor_columns = ["income", "age", "tot_cust_years", "tot_children",
-                     "female_ind", "single_ind", "married_ind", "separated_ind",
-                     "ck_acct_ind", "sv_acct_ind", "ck_avg_bal", "sv_avg_bal",
-                     "ck_avg_tran_amt", "sv_avg_tran_amt", "q1_trans_cnt",
-                     "q2_trans_cnt", "q3_trans_cnt", "q4_trans_cnt"]
+            continue
 
         # Specify the rows to be scored by the model and call the predictor.
-        X_test = dfToScore[predictor_columns]
-        PredictionProba = currStateClassifier.predict_proba(X_test)
-
-        dfOut = pd.concat([ dfToScore[['cust_id', 'state_code', 'cc_acct_ind']],
-                            pd.DataFrame(data=PredictionProba, columns=['Prob0','Prob1'])
-                          ], axis=1)
+        # In the unpartitioned mode, the predict stage of a profile includes
+        # the model loads of the state codes that are first met in the chunk.
+        profile.count('rowsIn', len(dfToScore))
+        with profile.stage('predict'):
+            X_test = dfToScore[predictor_columns]
+            if partitioned:
+                PredictionProba, treesUsed = predict(currStateClassifier, X_test)
+            else:
+                # Group the row positions of the chunk by state_code with a
+                # stable sort, and score each group with the model of its state
+                # code. The probabilities are put back in the input row order.
+                stateCodes, stateIndex = np.unique(
+                    dfToScore['state_code'].to_numpy(dtype=str),
+                    return_inverse=True)
+                order = np.argsort(stateIndex, kind='stable')
+                ends = np.cumsum(np.bincount(stateIndex,
+                                             minlength=len(stateCodes)))
+                PredictionProba = None
+                treesUsed = np.empty(len(dfToScore), dtype=np.int64)
+                for k, stateCode in enumerate(stateCodes):
+                    rows = order[ends[k - 1] if k else 0:ends[k]]
+                    proba, trees = predict(state_classifier(stateCode),
+                                           X_test.iloc[rows])
+                    if PredictionProba is None:
+                        PredictionProba = np.empty((len(dfToScore),
+                                                    proba.shape[1]))
+                    PredictionProba[rows] = proba
+                    if trees is not None:
+                        treesUsed[rows] = trees
 
         # Send results to Advanced SQL Engine through stdout in expected format.
-        for index, row in dfOut.iterrows():
-            print(row['state_code'], delimiter, row['cust_id'], delimiter,
-                  row['Prob0'], delimiter, row['Prob1'], delimiter,
-                  row['cc_acct_ind'])
-
-except (SystemExit):
-    # Skip exception if system exit requested in try block
-    pass
+        # The entire chunk is formatted into one buffer and written at once.
+        outColumns = [dfToScore['state_code'], dfToScore['cust_id'],
+                      PredictionProba[:, 0], PredictionProba[:, 1],
+                      dfToScore['cc_acct_ind']]
+        if threshold is not None:
+            outColumns += [(PredictionProba[:, 1] > threshold).astype(int),
+                           treesUsed]
+        with profile.stage('write'):
+            nBytesOut = outSchema.write(outColumns, delimiter, binaryIO)
+        profile.count('rowsOut', len(dfToScore))
+        profile.count('bytesOut', nBytesOut)
+
+        # Let an adaptive chunk size account for the time of the present pass.
+        if adaptive:
+            nRowsIn.update(len(dfToScore))
+
+        # Release the present chunk before the next one is read.
+        del dfToScore, X_test, PredictionProba, treesUsed, outColumns
+
 except:    # Specify in standard error any other error encountered
     print("Script Failure :", sys.exc_info()[0], file=sys.stderr)
     raise
-    sys.exit()
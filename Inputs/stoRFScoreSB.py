@@ -23,94 +23,75 @@
 ################################################################################
 
 import sys
-import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-import pickle
-import base64
+
+# Optionally, profile the stages of the script with the stoProfile module; see
+# stoProfile.py. The profiler does nothing unless it is enabled with the
+# STO_PROFILE=1 environment variable, or a "profile=true" argument.
+import stoProfile
+profile = stoProfile.start('stoRFScoreSB.py')
 
 ###
-### Read input
+### If no data received, gracefully exit before loading any heavy libraries.
 ###
 
-delimiter = ','
-inputData = []
+# Every AMP launches its own Python process for the present script, including
+# AMPs without any data. To keep the start-up cost of such processes low, the
+# heavy libraries are imported only after input data are confirmed present.
+# Peek at the input without consuming it, and exit if there is none.
+if not sys.stdin.buffer.peek(1):
+    sys.exit()
 
-for line in sys.stdin.read().splitlines():
-    line = line.split(delimiter)
-    inputData.append(line)
+with profile.stage('import'):
+    import pickle
+    import base64
+    import pandas as pd
+    import stoParse
+    import stoSchema
 
 ###
-### If no data received, gracefully exit rather than producing an error later.
+### Read input
 ###
 
-if not inputData:
-    sys.exit()
+delimiter = ','
 
-###
-### Set up input DataFrame according to input schema
-###
+# The script reads, scores and exports its input in chunks of nRowsIn rows at
+# a pass, so that memory use does not grow with the amount of data on the AMP.
+# Specify a different chunk size as a "chunk=<rows>" argument in the script
+# command, or in the STO_CHUNK environment variable. Use chunk=0 to read the
+# entire input at once.
+#
+# With an "io=binary" argument, the script reads and writes the binary
+# columnar frames of the stoFrame module instead of delimited text; each
+# input frame is scored as one chunk. Install stoFrame.py too for this mode.
+options = stoParse.script_options({'chunk': 10000, 'engine': 'sklearn',
+                                   'io': 'text'})
+nRowsIn = options['chunk']
+binaryIO = options['io'] == 'binary'
 
 # Know your data: You must know in advance the number and data types of the
-# incoming columns from the database!
+# incoming columns from the database! The input schema of the ADS is declared
+# once in the stoSchema module, and parsed with the stoParse module; both must
+# be installed in the Database together with the present script.
 # For numeric columns, the database sends in floats in scientific format with a
 # blank space when the exponential is positive; e.g., 1.0 is sent as 1.000E 000.
-# The following input data read deals with any such blank spaces in numbers.
-
-columns = ['cust_id', 'income', 'age', 'tot_cust_years', 'tot_children',
-           'female_ind', 'single_ind', 'married_ind', 'separated_ind',
-           'state_code', 'ca_resident_ind', 'ny_resident_ind', 'tx_resident_ind',
-           'il_resident_ind', 'az_resident_ind', 'oh_resident_ind',
-           'ck_acct_ind', 'sv_acct_ind', 'cc_acct_ind',
-           'ck_avg_bal', 'sv_avg_bal', 'cc_avg_bal', 'ck_avg_tran_amt',
-           'sv_avg_tran_amt', 'cc_avg_tran_amt', 'q1_trans_cnt',
-           'q2_trans_cnt', 'q3_trans_cnt', 'q4_trans_cnt']
-
-df = pd.DataFrame(inputData, columns=columns)
-#df = pd.DataFrame.from_records(inputData, exclude=['nRow', 'model'], columns=columns)
-del inputData
-
-df['cust_id'] = pd.to_numeric(df['cust_id'])
-
-df['income'] = df['income'].apply(lambda x: "".join(x.split()))
-df['income'] = pd.to_numeric(df['income'])
-
-df['age'] = pd.to_numeric(df['age'])
-df['tot_cust_years'] = pd.to_numeric(df['tot_cust_years'])
-df['tot_children'] = pd.to_numeric(df['tot_children'])
-df['female_ind'] = pd.to_numeric(df['female_ind'])
-df['single_ind'] = pd.to_numeric(df['single_ind'])
-df['married_ind'] = pd.to_numeric(df['married_ind'])
-df['separated_ind'] = pd.to_numeric(df['separated_ind'])
-df['ca_resident_ind'] = pd.to_numeric(df['ca_resident_ind'])
-df['ny_resident_ind'] = pd.to_numeric(df['ny_resident_ind'])
-df['tx_resident_ind'] = pd.to_numeric(df['tx_resident_ind'])
-df['il_resident_ind'] = pd.to_numeric(df['il_resident_ind'])
-df['az_resident_ind'] = pd.to_numeric(df['az_resident_ind'])
-df['oh_resident_ind'] = pd.to_numeric(df['oh_resident_ind'])
-
-df['ck_acct_ind'] = pd.to_numeric(df['ck_acct_ind'])
-df['sv_acct_ind'] = pd.to_numeric(df['sv_acct_ind'])
-df['cc_acct_ind'] = pd.to_numeric(df['cc_acct_ind'])
-
-df['ck_avg_bal'] = df['ck_avg_bal'].apply(lambda x: "".join(x.split()))
-df['ck_avg_bal'] = pd.to_numeric(df['ck_avg_bal'])
-df['sv_avg_bal'] = df['sv_avg_bal'].apply(lambda x: "".join(x.split()))
-df['sv_avg_bal'] = pd.to_numeric(df['sv_avg_bal'])
-df['cc_avg_bal'] = df['cc_avg_bal'].apply(lambda x: "".join(x.split()))
-df['cc_avg_bal'] = pd.to_numeric(df['cc_avg_bal'])
-
-df['ck_avg_tran_amt'] = df['ck_avg_tran_amt'].apply(lambda x: "".join(x.split()))
-df['ck_avg_tran_amt'] = pd.to_numeric(df['ck_avg_tran_amt'])
-df['sv_avg_tran_amt'] = df['sv_avg_tran_amt'].apply(lambda x: "".join(x.split()))
-df['sv_avg_tran_amt'] = pd.to_numeric(df['sv_avg_tran_amt'])
-df['cc_avg_tran_amt'] = df['cc_avg_tran_amt'].apply(lambda x: "".join(x.split()))
-df['cc_avg_tran_amt'] = pd.to_numeric(df['cc_avg_tran_amt'])
-
-df['q1_trans_cnt'] = pd.to_numeric(df['q1_trans_cnt'])
-df['q2_trans_cnt'] = pd.to_numeric(df['q2_trans_cnt'])
-df['q3_trans_cnt'] = pd.to_numeric(df['q3_trans_cnt'])
-df['q4_trans_cnt'] = pd.to_numeric(df['q4_trans_cnt'])
+# The parser deals with any such blank spaces in numbers, and converts all
+# columns of each chunk to their types in a single pass.
+if binaryIO:
+    import stoFrame
+    chunks = stoFrame.read_frames(profile.input_stream(sys.stdin.buffer))
+else:
+    chunks = stoParse.read_chunks(profile.input_stream(sys.stdin.buffer),
+                                  nRowsIn, stoParse.adsSchema, delimiter)
+chunks = profile.timed_iter(chunks, 'read_parse')
+df = next(chunks, None)
+
+###
+### If only blank input received, gracefully exit rather than producing an
+### error later.
+###
+
+if df is None:
+    sys.exit()
 
 ###
 ### Load model from input file
@@ -119,30 +100,55 @@ df['q4_trans_cnt'] = pd.to_numeric(df['q4_trans_cnt'])
 # database name in the target Vantage Advanced SQL Engine where you have
 # previously uploaded the model file to.
 #
-fIn = open('./RFmodel_py.out', 'rb')   # 'rb' for reading binary file
-classifierPklB64 = fIn.read()
-fIn.close()
-
-# Decode and unserialize from imported format
-classifierPkl = base64.b64decode(classifierPklB64)
-classifier = pickle.loads(classifierPkl)
+with profile.stage('model_load'):
+    fIn = open('./RFmodel_py.out', 'rb')   # 'rb' for reading binary file
+    classifierPklB64 = fIn.read()
+    fIn.close()
+
+    # Decode and unserialize from imported format. A model file in the compact
+    # format of the stoModelFile module is loaded with that module instead; it
+    # is scored with the flat-array forest engine of the stoForest module.
+    # Install stoModelFile.py and stoForest.py too for such a model file.
+    if classifierPklB64.startswith(b'STOFRST\n'):
+        import stoModelFile
+        classifier = stoModelFile.loads(classifierPklB64)
+    else:
+        classifierPkl = base64.b64decode(classifierPklB64)
+        classifier = pickle.loads(classifierPkl)
+
+# Optionally, score with the flat-array forest engine of the stoForest module
+# that evaluates all trees at once and produces identical results. It is the
+# faster engine for chunks of up to a few hundred rows. To use it, append an
+# argument "engine=flat" to the script command, and install stoForest.py too.
+if options['engine'] == 'flat' and hasattr(classifier, 'estimators_'):
+    with profile.stage('model_load'):
+        import stoForest
+        classifier = stoForest.flatten_forest(classifier)
 
 ###
-### Score the test table data with the given model
+### Score the test table data with the given model, one chunk at a pass
 ###
-predictor_columns = ["income", "age", "tot_cust_years", "tot_children",
-                     "female_ind", "single_ind", "married_ind", "separated_ind",
-                     "ck_acct_ind", "sv_acct_ind", "ck_avg_bal", "sv_avg_bal",
-                     "ck_avg_tran_amt", "sv_avg_tran_amt", "q1_trans_cnt",
-                     "q2_trans_cnt", "q3_trans_cnt", "q4_trans_cnt"]
-
-# Specify the rows to be scored by the model and call the predictor.
-X_test = df[predictor_columns]
-PredictionProba = classifier.predict_proba(X_test)
-
-df = pd.concat([df, pd.DataFrame(data=PredictionProba, columns=['Prob0', 'Prob1'])], axis=1)
-
-# Export results to Advanced SQL Engine through standard output in expected format.
-for index, row in df.iterrows():
-    print(row['cust_id'], delimiter,
-          row['Prob0'], delimiter, row['Prob1'], delimiter, row['cc_acct_ind'])
+# The predictors of the model, in model feature order, are declared together
+# with the input schema in the stoSchema module.
+predictor_columns = stoSchema.ads.names_of('predictor')
+
+while df is not None:
+
+    # Specify the rows to be scored by the model and call the predictor.
+    profile.count('rowsIn', len(df))
+    with profile.stage('predict'):
+        X_test = df[predictor_columns]
+        PredictionProba = classifier.predict_proba(X_test)
+
+    # Export results to Advanced SQL Engine through standard output in expected
+    # format. The entire chunk is formatted into one buffer and written at once.
+    outColumns = [df['cust_id'], PredictionProba[:, 0], PredictionProba[:, 1],
+                  df['cc_acct_ind']]
+    with profile.stage('write'):
+        nBytesOut = stoSchema.scoreOutput.write(outColumns, delimiter, binaryIO)
+    profile.count('rowsOut', len(df))
+    profile.count('bytesOut', nBytesOut)
+
+    # Release the present chunk before the next one is read.
+    del df, X_test, PredictionProba, outColumns
+    df = next(chunks, None)
@@ -0,0 +1,270 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Demo
+# ------------------------------------------------------------------------------
+# File: stoSchema.py
+# ##############################################################################
+#
+# The present file is a helper module for the Python scripts that are used with
+# the SCRIPT table operator in the Part 4 "TBv2_Py-4-In_DB_Scripting.ipynb"
+# notebook in this Using Python with Vantage TechByte.
+#
+# The module is the single, declarative definition of the columns that the
+# scripts exchange with the Advanced SQL Engine: the input schema of the
+# Analytic Data Set (ADS), with the role of each column in the model, and the
+# output schemas that match the "returns" of the teradataml Script objects in
+# the notebook. Everything the scripts need is derived from one definition:
+#   - the decoder of a schema: the pandas.read_csv() options that parse all
+#     columns in one pass, with NumPy dtype casts of the integer columns;
+#   - the encoder of a schema: the text or binary frame writer of its columns;
+#   - the names and index arrays of the columns of a role; e.g., the
+#     predictors of the model, in model feature order.
+# The derived objects are built once per schema and cached. Install the module
+# in the Database next to the scripts, together with stoParse.py.
+#
+################################################################################
+
+import numpy as np
+
+columnTypes = ('int', 'float', 'str')
+
+
+class Schema(object):
+    """An ordered list of typed columns, with optional column roles.
+
+    columns : sequence of (name, type) or (name, type, role) entries, where
+              type is one of 'int', 'float' or 'str'.
+    A schema iterates over (name, type) pairs, like a plain list of pairs.
+    """
+
+    def __init__(self, columns):
+        self.columns = []
+        self.roles = {}
+        for entry in columns:
+            name, colType = entry[0], entry[1]
+            if colType not in columnTypes:
+                raise ValueError("Unknown type '{}' of column '{}'".format(
+                                 colType, name))
+            self.columns.append((name, colType))
+            if len(entry) > 2 and entry[2]:
+                self.roles.setdefault(entry[2], []).append(name)
+        self.names = [name for name, _ in self.columns]
+        self.types = [colType for _, colType in self.columns]
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        self._intNames = [name for name, colType in self.columns
+                          if colType == 'int']
+        self._readOptions = {}
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __getitem__(self, i):
+        return self.columns[i]
+
+    def __add__(self, other):
+        """Return the schema with the columns of other appended."""
+        return Schema([(name, colType, role)
+                       for part in (self, as_schema(other))
+                       for name, colType, role in part._entries()])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Schema({!r})'.format(self.columns)
+
+    def _entries(self):
+        roleOf = {name: role for role, names in self.roles.items()
+                  for name in names}
+        return [(name, colType, roleOf.get(name)) for name, colType in self.columns]
+
+    def index(self, name):
+        """Return the position of a column."""
+        return self._positions[name]
+
+    def names_of(self, role):
+        """Return the names of the columns of a role, in schema order."""
+        return list(self.roles.get(role, []))
+
+    def indices_of(self, role):
+        """Return the positions of the columns of a role as an index array."""
+        return np.array([self._positions[name] for name in self.roles.get(role, [])],
+                        dtype=np.intp)
+
+    ###
+    ### Decoder
+    ###
+
+    def read_options(self, sep=',', intType=np.float64):
+        """Return the pandas.read_csv() keyword arguments of the schema.
+
+        intType is the type the integer columns are read as: np.float64 (the
+        default), or str for an exact conversion of them by cast().
+        """
+        key = (sep, intType)
+        if key not in self._readOptions:
+            # By default, numeric columns are all read as floats, so that
+            # integers the Database may send in scientific format (e.g.,
+            # 1.000E+002) are accepted, too. Integer columns are cast to int64
+            # after the read.
+            types = {'int': intType, 'float': np.float64, 'str': str}
+            dtypes = {name: types[colType] for name, colType in self.columns}
+            # Only empty numeric fields are NULLs; "NA" is a valid code.
+            naValues = {name: [''] for name, colType in self.columns
+                        if colType != 'str'}
+            self._readOptions[key] = dict(
+                sep=sep, header=None, names=self.names, dtype=dtypes,
+                index_col=False, keep_default_na=False, na_values=naValues)
+        return self._readOptions[key]
+
+    def wide_int_names(self, df):
+        """Return the integer columns of a DataFrame read with floats that hold
+        values beyond 2^53, which the floats may not represent exactly."""
+        return [name for name in self._intNames
+                if (np.abs(df[name].to_numpy()) >= 2.0 ** 53).any()]
+
+    def cast(self, df):
+        """Cast the integer columns of a freshly parsed DataFrame in place.
+
+        Integer columns read as text are converted with pd.to_numeric(), which
+        keeps integers exact. A column is cast to int64 if all its values are
+        whole numbers; a column with NULLs or fractions stays float, as
+        pd.to_numeric() would leave it.
+        """
+        import pandas as pd
+        for name in self._intNames:
+            values = df[name].to_numpy()
+            if values.dtype == object:
+                values = pd.to_numeric(df[name]).to_numpy()
+            if values.dtype.kind == 'f' and (values == np.trunc(values)).all() \
+                    and (np.abs(values) < 2.0 ** 63).all():
+                values = values.astype(np.int64)
+            df[name] = values
+        return df
+
+    def empty(self):
+        """Return an empty DataFrame with the column types of the schema."""
+        import pandas as pd
+        types = {'int': np.int64, 'float': np.float64, 'str': object}
+        return pd.DataFrame({name: np.array([], dtype=types[colType])
+                             for name, colType in self.columns})
+
+    ###
+    ### Encoder
+    ###
+
+    def write(self, columns, sep=',', binary=False, out=None):
+        """Export output columns of the schema to standard output (or out).
+
+        The columns are written as delimited text with the stoWrite module,
+        or as a binary frame with the column names of the schema with the
+        stoFrame module. Returns the number of characters or bytes written.
+        """
+        if len(columns) != len(self.columns):
+            raise ValueError('Expected {} output columns {}, got {}'.format(
+                             len(self.columns), self.names, len(columns)))
+        if binary:
+            import stoFrame
+            return stoFrame.write_frame(columns, self.names, out)
+        import stoWrite
+        return stoWrite.write_rows(columns, sep, out)
+
+
+_schemas = {}
+
+
+def as_schema(schema):
+    """Return a Schema object for a Schema or a list of (name, type) pairs.
+
+    The Schema objects of plain lists are cached, so that their decoders are
+    built only once.
+    """
+    if isinstance(schema, Schema):
+        return schema
+    key = tuple(tuple(entry) for entry in schema)
+    if key not in _schemas:
+        _schemas[key] = Schema(key)
+    return _schemas[key]
+
+###
+### Schemas of the SCRIPT operator scripts
+###
+
+# Input schema of the Analytic Data Set (ADS). Know your data: You must know
+# in advance the number and data types of the incoming columns from the
+# database! The roles mark the customer ID, the partition key, the predictors
+# of the model in feature order, and the target.
+ads = Schema([
+    ('cust_id', 'int', 'id'), ('income', 'float', 'predictor'),
+    ('age', 'int', 'predictor'), ('tot_cust_years', 'int', 'predictor'),
+    ('tot_children', 'int', 'predictor'), ('female_ind', 'int', 'predictor'),
+    ('single_ind', 'int', 'predictor'), ('married_ind', 'int', 'predictor'),
+    ('separated_ind', 'int', 'predictor'), ('state_code', 'str', 'key'),
+    ('ca_resident_ind', 'int'), ('ny_resident_ind', 'int'),
+    ('tx_resident_ind', 'int'), ('il_resident_ind', 'int'),
+    ('az_resident_ind', 'int'), ('oh_resident_ind', 'int'),
+    ('ck_acct_ind', 'int', 'predictor'), ('sv_acct_ind', 'int', 'predictor'),
+    ('cc_acct_ind', 'int', 'target'), ('ck_avg_bal', 'float', 'predictor'),
+    ('sv_avg_bal', 'float', 'predictor'), ('cc_avg_bal', 'float'),
+    ('ck_avg_tran_amt', 'float', 'predictor'),
+    ('sv_avg_tran_amt', 'float', 'predictor'), ('cc_avg_tran_amt', 'float'),
+    ('q1_trans_cnt', 'int', 'predictor'), ('q2_trans_cnt', 'int', 'predictor'),
+    ('q3_trans_cnt', 'int', 'predictor'), ('q4_trans_cnt', 'int', 'predictor')])
+
+# Trailing columns of the ADS when a large state_code partition is split into
+# hash sub-partitions for training: the index of the sub-partition of a row,
+# and the number of sub-partitions of its state_code.
+subPart = Schema([('sub_part', 'int'), ('sub_parts', 'int')])
+
+# Output of stoRFScore.py and stoRFScoreSB.py.
+scoreOutput = Schema([('ID', 'int'), ('Prob_0', 'float'), ('Prob_1', 'float'),
+                      ('Actual', 'int')])
+
+# Output of stoRFScoreMM.py.
+mmScoreOutput = Schema([('State_Code', 'str'), ('Cust_ID', 'int'),
+                        ('Prob_0', 'float'), ('Prob_1', 'float'),
+                        ('Actual', 'int')])
+
+# Trailing columns of the outputs of the scoring scripts in the threshold
+# mode: the decision Prob_1 > threshold, and the number of trees that scored
+# the row.
+decision = Schema([('Decision', 'int'), ('Trees', 'int')])
+
+# Output of stoRFFitMM.py; the Model column is a CLOB of base64 text.
+fitOutput = Schema([('State_Code', 'str'), ('Model', 'str')])
+
+# Output of stoRFFitMM.py in the search mode: one row per candidate with its
+# parameters and out-of-bag metrics, and the metric that ranked the
+# candidates of the partition; only the selected candidate has a Model.
+searchOutput = Schema([('State_Code', 'str'), ('Candidate', 'int'),
+                       ('Params', 'str'), ('OOB_Accuracy', 'float'),
+                       ('OOB_AUC', 'float'), ('Metric', 'str'),
+                       ('Fit_Seconds', 'float'), ('Selected', 'int'),
+                       ('Model', 'str')])
+
+registry = {'ads': ads, 'subPart': subPart, 'scoreOutput': scoreOutput,
+            'mmScoreOutput': mmScoreOutput, 'decision': decision,
+            'fitOutput': fitOutput,
+            'searchOutput': searchOutput}
+
+
+def get(name):
+    """Return a registered schema by name."""
+    try:
+        return registry[name]
+    except KeyError:
+        raise KeyError("Unknown schema '{}'; registered schemas are {}".format(
+                       name, sorted(registry)))
@@ -0,0 +1,226 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Demo
+# ------------------------------------------------------------------------------
+# File: stoScoreLocal.py
+# ##############################################################################
+#
+# The present file is a client-side tool for the BYOM use case of the Part 4
+# "TBv2_Py-4-In_DB_Scripting.ipynb" notebook in this Using Python with Vantage
+# TechByte.
+#
+# The tool scores a test data set on the client with the scoring logic of
+# stoRFScore.py, in parallel on all cores, as a fast local validation of a
+# model file before it is installed in the Database. The input file is split
+# into shards by byte range at line boundaries, and the shards are scored in a
+# pool of worker processes. The model is loaded once, before the workers are
+# forked, so that they share it copy-on-write. The outputs of the shards are
+# written to the output file in input order as they complete; the output is
+# byte-for-byte identical to the one of stoRFScore.py on the same rows, in the
+# "ID , Prob_0 , Prob_1 , Actual" text format.
+#
+# The input is either a CSV file of the test ADS with a header row, such as
+# stoSandboxTestData.csv, or SCRIPT operator input text without a header.
+#
+# Usage: python stoScoreLocal.py <input> <output> [options]
+# Examples:
+#   python stoScoreLocal.py stoSandboxTestData.csv scores.txt
+#   python stoScoreLocal.py test_ads.csv scores.txt --model RFmodel_py.out \
+#       --workers 8 --shard-mb 16 --engine flat
+#
+################################################################################
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import stoModelFile
+import stoParse
+import stoSchema
+import stoWrite
+
+delimiter = ','
+
+# The predictors of the model, in model feature order, are declared together
+# with the input schema in the stoSchema module.
+predictor_columns = stoSchema.ads.names_of('predictor')
+
+###
+### Sharding of the input file
+###
+
+def _line_start(fIn, offset):
+    """Return the offset of the first line that starts at or after offset."""
+    if offset == 0:
+        return 0
+    fIn.seek(offset - 1)
+    fIn.readline()
+    return fIn.tell()
+
+
+def has_header(path):
+    """Return True if the first line of a file is a header row."""
+    with open(path, 'rb') as fIn:
+        first = fIn.read(1)
+    return bool(first) and not (first.isdigit() or first in b'-+.')
+
+
+def shard_ranges(path, shardBytes, skipHeader=False):
+    """Return the (start, end) byte ranges of the shards of a text file.
+
+    The ranges are cut near multiples of shardBytes, at the start of the next
+    line, so that every line belongs to exactly one shard.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as fIn:
+        start = 0
+        if skipHeader:
+            fIn.readline()
+            start = fIn.tell()
+        bounds = [start]
+        while bounds[-1] + shardBytes < size:
+            cut = _line_start(fIn, bounds[-1] + shardBytes)
+            if cut >= size:
+                break
+            bounds.append(cut)
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+###
+### Scoring of a shard
+###
+
+# The model of the workers; set in the parent process before the pool forks.
+_classifier = None
+
+
+def load_classifier(path, engine='sklearn'):
+    """Load a model file like stoRFScore.py does.
+
+    Model files in the compact format of the stoModelFile module load as
+    flat-array forests; base64-encoded pickles load as they were saved, and
+    are converted to flat-array forests for the "flat" engine.
+    """
+    with open(path, 'rb') as fIn:
+        classifier = stoModelFile.loads(fIn.read())
+    if engine == 'flat' and hasattr(classifier, 'estimators_'):
+        import stoForest
+        classifier = stoForest.flatten_forest(classifier)
+    return classifier
+
+
+def _init_worker(modelPath, engine):
+    """Pool initializer where processes are spawned instead of forked."""
+    global _classifier
+    _classifier = load_classifier(modelPath, engine)
+
+
+def score_text(data, classifier, nRows=10000):
+    """Score a block of input rows; return the output text of stoRFScore.py."""
+    import io
+    texts = []
+    for df in stoParse.read_chunks(io.BytesIO(data), nRows,
+                                   stoParse.adsSchema, delimiter):
+        if df.empty:
+            continue
+        PredictionProba = classifier.predict_proba(df[predictor_columns])
+        texts.append(stoWrite.format_rows(
+            [df['cust_id'], PredictionProba[:, 0], PredictionProba[:, 1],
+             df['cc_acct_ind']], delimiter))
+    return ''.join(texts).encode()
+
+
+def _score_shard(task):
+    """Read and score the byte range of one shard in a worker process."""
+    path, start, end, nRows = task
+    with open(path, 'rb') as fIn:
+        fIn.seek(start)
+        data = fIn.read(end - start)
+    return score_text(data, _classifier, nRows)
+
+###
+### Parallel scoring of a file
+###
+
+def score_file(inPath, outPath, modelPath, workers=0, shardMB=8.0,
+               chunk=10000, engine='sklearn', header=None):
+    """Score an input file in parallel and write the ordered output.
+
+    workers : number of worker processes; 0 uses all available cores.
+    header  : True or False if the input has a header row, or None to detect.
+    Returns the tuple (number of shards, output bytes).
+    """
+    global _classifier
+    if workers <= 0:
+        workers = stoParse.available_cores()
+    if header is None:
+        header = has_header(inPath)
+    ranges = shard_ranges(inPath, max(1, int(shardMB * 1024 * 1024)), header)
+    tasks = [(inPath, start, end, chunk) for start, end in ranges]
+
+    # Forked workers inherit the model loaded here; spawned workers load it.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        _classifier = load_classifier(modelPath, engine)
+        context = multiprocessing.get_context('fork')
+        poolArgs = {}
+    else:
+        context = multiprocessing.get_context()
+        poolArgs = {'initializer': _init_worker, 'initargs': (modelPath, engine)}
+
+    nBytes = 0
+    with open(outPath, 'wb') as fOut:
+        if workers == 1 or len(tasks) <= 1:
+            if _classifier is None:
+                _init_worker(modelPath, engine)
+            for text in map(_score_shard, tasks):
+                fOut.write(text)
+                nBytes += len(text)
+        else:
+            with context.Pool(workers, **poolArgs) as pool:
+                # imap() hands out the shards in order, and returns their
+                # outputs in input order as soon as each next one is done.
+                for text in pool.imap(_score_shard, tasks):
+                    fOut.write(text)
+                    nBytes += len(text)
+    return len(tasks), nBytes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Score a test data set on the client in parallel, with '
+                    'the same output as stoRFScore.py in the Database.')
+    parser.add_argument('input', help='CSV file of the test ADS, or SCRIPT '
+                                      'operator input text')
+    parser.add_argument('output', help='output file')
+    parser.add_argument('--model', default='RFmodel_py.out',
+                        help='model file (default: RFmodel_py.out)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='worker processes (default: all cores)')
+    parser.add_argument('--shard-mb', type=float, default=8.0,
+                        help='input shard size in MB (default: 8)')
+    parser.add_argument('--chunk', type=int, default=10000,
+                        help='rows scored at a pass in a shard (default: 10000)')
+    parser.add_argument('--engine', default='sklearn', choices=['sklearn', 'flat'])
+    parser.add_argument('--header', choices=['auto', 'yes', 'no'], default='auto',
+                        help='whether the input has a header row')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    nShards, nBytes = score_file(
+        args.input, args.output, args.model, args.workers, args.shard_mb,
+        args.chunk, args.engine, {'auto': None, 'yes': True, 'no': False}[args.header])
+    print('Scored {} shard(s) into {:,} bytes in {:.3f} s'.format(
+          nShards, nBytes, time.perf_counter() - start), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
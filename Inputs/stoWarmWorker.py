@@ -0,0 +1,497 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Demo
+# ------------------------------------------------------------------------------
+# File: stoWarmWorker.py
+# ##############################################################################
+#
+# The present file is a client-side tool for testing the Python scripts that
+# are used with the SCRIPT table operator in the Part 4
+# "TBv2_Py-4-In_DB_Scripting.ipynb" notebook in this Using Python with Vantage
+# TechByte.
+#
+# Every test of a script in the sandbox, or locally, starts a new interpreter
+# that imports numpy, pandas and scikit-learn and deserializes the model file
+# again, before it scores a single row. The warm worker is one long-lived
+# process that runs the stoRF* scripts over and over instead: the modules are
+# imported once, the models are deserialized once, and each invocation of a
+# script only runs the script code on a new input payload. An invocation
+# behaves like a script process on an AMP: the script reads the payload from
+# its standard input, takes its arguments from sys.argv and the STO_*
+# environment variables, and its standard output, standard error and exit
+# code are returned to the caller, in the same format as a separate process.
+#
+# The worker serves the invocations over a pipe (its standard input and
+# output), or over a local (Unix domain) socket. Each message is a length-
+# prefixed JSON header followed by a payload of bytes:
+#   request : {"script": name, "args": [...], "env": {...}} + input payload
+#   response: {"exitCode": n, "stderr": text} + output payload
+# The models of the scoring scripts are cached by content: a model file that
+# changes on disk is deserialized again. The training script always gets a
+# fresh copy of its base models, as the incremental mode modifies them.
+#
+# Usage:
+#   python stoWarmWorker.py serve   [--dir DIR] [--socket PATH]
+#   python stoWarmWorker.py replay  [--dir DIR] [--args "a=1 b=2"]
+#                                   [--out-dir DIR] <script> <input> ...
+# DIR is the working folder with the TRNG_TECHBYTES folder of the scripts and
+# models, as in the sandbox (default: the current folder). The replay driver
+# starts a worker, runs the script once on each input file, writes each
+# output next to the input (or to --out-dir) with an ".out" suffix, and
+# prints the latency of each invocation.
+#
+################################################################################
+
+import argparse
+import atexit
+import io
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+import traceback
+
+uifFolder = 'TRNG_TECHBYTES'
+
+# Scripts that only read their models; their models are cached by content.
+scoringScripts = ('stoRFScore.py', 'stoRFScoreSB.py', 'stoRFScoreMM.py')
+
+# Model files that are deserialized when the worker starts.
+modelFiles = [os.path.join('.', uifFolder, 'RFmodel_py.out'), './RFmodel_py.out']
+bundleFiles = [os.path.join('.', uifFolder, 'multipleModels_py.bundle')]
+
+_lengthFormat = '<II'
+
+###
+### Message framing
+###
+
+def write_message(fOut, header, payload=b''):
+    """Write a JSON header and a payload of bytes as one message."""
+    headerBytes = json.dumps(header).encode('utf-8')
+    fOut.write(struct.pack(_lengthFormat, len(headerBytes), len(payload)))
+    fOut.write(headerBytes)
+    fOut.write(payload)
+    fOut.flush()
+
+
+def _read_exactly(fIn, size):
+    data = fIn.read(size)
+    if len(data) != size:
+        raise EOFError('Truncated message: expected {} bytes, got {}'.format(
+                       size, len(data)))
+    return data
+
+
+def read_message(fIn):
+    """Read a message; return (header, payload), or None at end of input."""
+    prefix = fIn.read(struct.calcsize(_lengthFormat))
+    if not prefix:
+        return None
+    if len(prefix) != struct.calcsize(_lengthFormat):
+        raise EOFError('Truncated message prefix')
+    headerLen, payloadLen = struct.unpack(_lengthFormat, prefix)
+    header = json.loads(_read_exactly(fIn, headerLen).decode('utf-8'))
+    return header, _read_exactly(fIn, payloadLen)
+
+###
+### Model cache
+###
+
+class ModelCache(object):
+    """Memoizes the model loaders that the scoring scripts call.
+
+    pickle.loads() and stoModelFile.loads() return the same model object for
+    the same serialized bytes, and stoForest.flatten_forest() the same flat
+    forest for the same model object. Only the first maxEntries models are
+    kept, until they are replaced by newer ones.
+    """
+
+    def __init__(self, maxEntries=8):
+        self.maxEntries = maxEntries
+        self._models = {}
+        self._flat = {}
+
+    def _memoize(self, load):
+        def cached(data, *args, **kwargs):
+            if args or kwargs:
+                return load(data, *args, **kwargs)
+            key = (load, bytes(data))
+            if key not in self._models:
+                if len(self._models) >= self.maxEntries:
+                    self._forget(next(iter(self._models)))
+                self._models[key] = load(data)
+            return self._models[key]
+        return cached
+
+    def _forget(self, key):
+        del self._models[key]
+
+    def _memoize_flatten(self, flatten):
+        def cached(classifier):
+            # The flat forest is kept with its model, so that the id of the
+            # model stays valid as long as the entry exists.
+            if id(classifier) not in self._flat:
+                if len(self._flat) >= 4 * self.maxEntries:
+                    del self._flat[next(iter(self._flat))]
+                self._flat[id(classifier)] = (classifier, flatten(classifier))
+            return self._flat[id(classifier)][1]
+        return cached
+
+    def patches(self):
+        """Return the (module, name, replacement) patches of the loaders."""
+        import pickle
+        patches = [(pickle, 'loads', self._memoize(pickle.loads))]
+        for moduleName, name, wrap in [('stoModelFile', 'loads', self._memoize),
+                                       ('stoForest', 'flatten_forest',
+                                        self._memoize_flatten)]:
+            try:
+                module = __import__(moduleName)
+            except ImportError:
+                continue
+            patches.append((module, name, wrap(getattr(module, name))))
+        return patches
+
+
+def _file_signature(path):
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return info.st_ino, info.st_size, info.st_mtime_ns
+
+
+# Signatures of the bundle files that stoModelBundle holds open, as of the
+# time they were opened.
+_bundleSignatures = {}
+
+
+def _bundle_patches():
+    """Return the patch of stoModelBundle.open_bundle() that records the
+    signature of a bundle file when the bundle is opened.
+
+    The signature is taken before the file is opened, so that a file that is
+    replaced in between is seen as changed, rather than the other way round.
+    """
+    try:
+        import stoModelBundle
+    except ImportError:
+        return []
+    openBundle = stoModelBundle.open_bundle
+
+    def tracked(path):
+        if path not in stoModelBundle._bundles:
+            _bundleSignatures[path] = _file_signature(path)
+        return openBundle(path)
+    return [(stoModelBundle, 'open_bundle', tracked)]
+
+
+def refresh_bundles():
+    """Drop the cached bundles of stoModelBundle whose files have changed
+    since they were opened, and the ones opened without a signature."""
+    stoModelBundle = sys.modules.get('stoModelBundle')
+    if stoModelBundle is None:
+        return
+    for path in list(stoModelBundle._bundles):
+        if _bundleSignatures.get(path) != _file_signature(path):
+            stoModelBundle._bundles.pop(path).close()
+            for key in [key for key in stoModelBundle._models if key[0] == path]:
+                del stoModelBundle._models[key]
+            _bundleSignatures.pop(path, None)
+
+
+def _apply(patches):
+    """Set (module, name, value) patches; return the patches that undo them."""
+    saved = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, value in patches:
+        setattr(module, name, value)
+    return saved
+
+###
+### Worker
+###
+
+class Worker(object):
+    """Runs the scripts of a working folder in the present process."""
+
+    def __init__(self, workDir='.'):
+        self.workDir = os.path.abspath(workDir)
+        self.scriptDir = os.path.join(self.workDir, uifFolder)
+        self.cache = ModelCache()
+        self._code = {}
+        os.chdir(self.workDir)
+        if self.scriptDir not in sys.path:
+            sys.path.insert(0, self.scriptDir)
+
+    def preload(self):
+        """Import the modules of the scripts, and deserialize the models."""
+        import numpy
+        import pandas
+        import sklearn.ensemble
+        import stoParse
+        import stoSchema
+        import stoWrite
+        for path in modelFiles:
+            if os.path.exists(path):
+                with open(path, 'rb') as fIn:
+                    self._load_model_file(fIn.read())
+        saved = _apply(_bundle_patches())
+        try:
+            for path in bundleFiles:
+                if os.path.exists(path):
+                    import stoModelBundle
+                    for key in stoModelBundle.open_bundle(path).keys():
+                        stoModelBundle.load_model(path, key)
+        finally:
+            _apply(saved)
+
+    def _load_model_file(self, data):
+        """Deserialize a model file the way stoRFScore.py does, into the cache."""
+        saved = _apply(self.cache.patches())
+        try:
+            if data.startswith(b'STOFRST\n'):
+                import stoModelFile
+                stoModelFile.loads(data)
+            else:
+                import base64
+                import pickle
+                pickle.loads(base64.b64decode(data))
+        finally:
+            _apply(saved)
+
+    def _compiled(self, scriptName):
+        """Return the code object of a script, compiled again if it changed."""
+        path = os.path.join(self.scriptDir, scriptName)
+        signature = _file_signature(path)
+        if signature is None:
+            raise IOError("Script '{}' not found in {}".format(scriptName,
+                                                                 self.scriptDir))
+        cached = self._code.get(scriptName)
+        if cached is None or cached[0] != signature:
+            with open(path, 'rb') as fIn:
+                cached = (signature, compile(fIn.read(), path, 'exec'))
+            self._code[scriptName] = cached
+        return path, cached[1]
+
+    def run(self, scriptName, payload, args=(), env=None):
+        """Run a script on an input payload, like a script process would.
+
+        Returns the tuple (exit code, standard output bytes, standard error).
+        """
+        stdoutBuffer = io.BytesIO()
+        stdout = io.TextIOWrapper(stdoutBuffer, encoding='utf-8',
+                                  write_through=True)
+        stderr = io.StringIO()
+        stdin = io.TextIOWrapper(io.BufferedReader(io.BytesIO(payload)),
+                                 encoding='utf-8')
+        saved = (sys.stdin, sys.stdout, sys.stderr, sys.argv, atexit.register)
+        savedEnv = dict(os.environ)
+        exitHooks = []
+        patches = self.cache.patches() if scriptName in scoringScripts else []
+        patches += _bundle_patches()
+        exitCode = 0
+
+        def register(func, *args, **kwargs):
+            exitHooks.append((func, args, kwargs))
+            return func
+
+        try:
+            path, code = self._compiled(scriptName)
+            refresh_bundles()
+            os.environ.update(env or {})
+            sys.stdin, sys.stdout, sys.stderr = stdin, stdout, stderr
+            sys.argv = [os.path.join('.', uifFolder, scriptName)] + list(args)
+            # Exit handlers of the script, such as the report of a profile,
+            # run when the invocation ends, as they would at process exit.
+            atexit.register = register
+            savedLoaders = _apply(patches)
+            try:
+                exec(code, {'__name__': '__main__', '__file__': path,
+                            '__builtins__': __builtins__})
+            except SystemExit as e:
+                if e.code is None:
+                    exitCode = 0
+                elif isinstance(e.code, int):
+                    exitCode = e.code
+                else:
+                    stderr.write('{}\n'.format(e.code))
+                    exitCode = 1
+            except Exception:
+                traceback.print_exc(file=stderr)
+                exitCode = 1
+            finally:
+                _apply(savedLoaders)
+                for func, a, k in reversed(exitHooks):
+                    try:
+                        func(*a, **k)
+                    except Exception:
+                        traceback.print_exc(file=stderr)
+                try:
+                    stdout.flush()
+                except Exception:
+                    pass
+            output = stdoutBuffer.getvalue()
+        except Exception:
+            traceback.print_exc(file=stderr)
+            exitCode, output = 1, b''
+        finally:
+            (sys.stdin, sys.stdout, sys.stderr, sys.argv,
+             atexit.register) = saved
+            os.environ.clear()
+            os.environ.update(savedEnv)
+        return exitCode, output, stderr.getvalue()
+
+    def serve(self, fIn, fOut):
+        """Answer the requests of a stream until it ends."""
+        while True:
+            message = read_message(fIn)
+            if message is None:
+                return
+            header, payload = message
+            exitCode, output, errors = self.run(
+                header['script'], payload, header.get('args', []),
+                header.get('env'))
+            write_message(fOut, {'exitCode': exitCode, 'stderr': errors}, output)
+
+###
+### Client
+###
+
+class WarmWorker(object):
+    """Client of a warm worker process.
+
+    By default, a worker process is started for a working folder, and talks
+    over a pipe; WarmWorker.connect() talks to a worker on a local socket.
+    """
+
+    def __init__(self, workDir='.', _stream=None):
+        self.proc = None
+        if _stream is None:
+            self.proc = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), 'serve', '--dir',
+                 os.path.abspath(workDir)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self._in, self._out = self.proc.stdout, self.proc.stdin
+        else:
+            self._in = self._out = _stream
+
+    @classmethod
+    def connect(cls, socketPath):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socketPath)
+        client = cls(_stream=sock.makefile('rwb'))
+        client._socket = sock
+        return client
+
+    def run(self, scriptName, payload, args=(), env=None):
+        """Run a script in the worker; return (exit code, stdout, stderr)."""
+        write_message(self._out, {'script': scriptName, 'args': list(args),
+                                  'env': env or {}}, payload)
+        message = read_message(self._in)
+        if message is None:
+            raise EOFError('The warm worker has exited')
+        header, output = message
+        return header['exitCode'], output, header['stderr']
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.proc.stdout.close()
+        else:
+            self._in.close()
+            self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def serve_socket(worker, socketPath):
+    """Answer the requests of local socket connections, one at a time."""
+    if os.path.exists(socketPath):
+        os.remove(socketPath)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socketPath)
+    server.listen(1)
+    print('Warm worker listening on {}'.format(socketPath), file=sys.stderr)
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile('rwb') as stream:
+                worker.serve(stream, stream)
+    finally:
+        server.close()
+        os.remove(socketPath)
+
+
+def replay(workDir, scriptName, paths, args=(), outDir=None):
+    """Run a script in a warm worker on each of a list of input files."""
+    start = time.perf_counter()
+    with WarmWorker(workDir) as worker:
+        # The first answer arrives once the worker has preloaded.
+        worker.run(scriptName, b'', args)
+        print('Warm worker ready in {:.3f} s'.format(time.perf_counter() - start))
+        for path in paths:
+            with open(path, 'rb') as fIn:
+                payload = fIn.read()
+            start = time.perf_counter()
+            exitCode, output, errors = worker.run(scriptName, payload, args)
+            elapsed = time.perf_counter() - start
+            outPath = os.path.join(outDir or os.path.dirname(path),
+                                   os.path.basename(path) + '.out')
+            with open(outPath, 'wb') as fOut:
+                fOut.write(output)
+            sys.stderr.write(errors)
+            print('{}: exit code {}, {:,} bytes out, {:.3f} s'.format(
+                  path, exitCode, len(output), elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the stoRF* scripts in a warm, long-lived process.')
+    commands = parser.add_subparsers(dest='command')
+    serveParser = commands.add_parser('serve', help='serve script invocations')
+    serveParser.add_argument('--dir', default='.', help='working folder')
+    serveParser.add_argument('--socket', help='local socket path to listen '
+                             'on, instead of the standard input and output')
+    replayParser = commands.add_parser('replay', help='replay input files '
+                                       'through a warm worker')
+    replayParser.add_argument('--dir', default='.', help='working folder')
+    replayParser.add_argument('--args', default='', help='script arguments, '
+                              'as one string')
+    replayParser.add_argument('--out-dir', help='folder of the output files')
+    replayParser.add_argument('script', help='script name, e.g. stoRFScore.py')
+    replayParser.add_argument('inputs', nargs='+', help='input files')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        worker = Worker(args.dir)
+        worker.preload()
+        if args.socket:
+            serve_socket(worker, args.socket)
+        else:
+            # Keep the binary standard streams; the scripts get their own.
+            worker.serve(sys.stdin.buffer, sys.stdout.buffer)
+    elif args.command == 'replay':
+        replay(args.dir, args.script, args.inputs, args.args.split(),
+               args.out_dir)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
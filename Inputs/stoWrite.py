@@ -0,0 +1,55 @@
+################################################################################
+# * The contents of this file are Teradata Public Content and have been released
+# * to the Public Domain.
+# * Please see license.txt file in the package for more information.
+# * Alexander Kolovos and Tim Miller - May 2021 - v.2.0
+# * Copyright (c) 2021 by Teradata
+# * Licensed under BSD
+#
+# ##############################################################################
+# TechBytes: Using Python with Teradata Vantage - Part 4 - Demo
+# ------------------------------------------------------------------------------
+# File: stoWrite.py
+# ##############################################################################
+#
+# The present file is a helper module for the Python scripts that are used with
+# the SCRIPT table operator in the Part 4 "TBv2_Py-4-In_DB_Scripting.ipynb"
+# notebook in this Using Python with Vantage TechByte.
+#
+# The module exports a whole chunk of results to the Advanced SQL Engine with a
+# single write to standard output. Each output column is formatted as an array,
+# and the rows are assembled into one text buffer. Install it in the Database
+# next to the scripts that import it.
+#
+################################################################################
+
+import sys
+
+import numpy as np
+
+delimiter = ','
+
+
+def format_rows(columns, sep=delimiter):
+    """Format output columns into a text block with one row per line.
+
+    columns : sequence of equal-length arrays, pandas Series or lists, in the
+              order of the columns in the "returns" schema of the script.
+
+    The text is identical to printing each row with print(col1, sep, col2, ...);
+    i.e., the values are separated by the delimiter with a blank on each side,
+    integers are written as integers and floats in their shortest repr() form.
+    """
+    texts = [np.asarray(values).astype(str).tolist() for values in columns]
+    if not texts or not texts[0]:
+        return ''
+    lines = map((' ' + sep + ' ').join, zip(*texts))
+    return '\n'.join(lines) + '\n'
+
+
+def write_rows(columns, sep=delimiter, out=None):
+    """Export output columns to standard output (or out) in a single write."""
+    text = format_rows(columns, sep)
+    if text:
+        (sys.stdout if out is None else out).write(text)
+    return len(text)